@@ -4,6 +4,7 @@ from floodsystem.datafetcher import fetch_measure_levels
 from floodsystem.stationdata import build_station_list, update_water_levels
 from floodsystem.flood import stations_highest_rel_level
 from floodsystem.plot import plot_water_levels
+from floodsystem.readingstore import ReadingStore
 import numpy as np
 
 
@@ -18,8 +19,11 @@ def run():
     # Ploting the water levels over the past 10 days
     # for the 5 stations with the highest current relative water level
 
+    # Keep fetched readings on disk, so that repeated runs only fetch new readings
+    store = ReadingStore()
+
     for station in stations_highest_rel_level(stations, 5):
-        dates, levels = fetch_measure_levels(station.measure_id, dt=datetime.timedelta(days=10))
+        dates, levels = fetch_measure_levels(station.measure_id, dt=datetime.timedelta(days=10), store=store)
         plot_water_levels(station, dates, levels)
 
 if __name__ == "__main__":
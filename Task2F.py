@@ -4,6 +4,7 @@ from floodsystem.stationdata import build_station_list, update_water_levels
 from floodsystem.datafetcher import fetch_measure_levels
 from floodsystem.flood import stations_highest_rel_level
 from floodsystem.plot import plot_water_level_with_fit
+from floodsystem.readingstore import ReadingStore
 
 
 N = 5
@@ -20,9 +21,13 @@ def run():
     # Update water levels
     update_water_levels(stations)
 
+    # Keep fetched readings on disk, so that repeated runs only fetch new readings
+    store = ReadingStore()
+
     # Plot fitted polynomial for the `N` stations with the highest relative water levels
     for station in stations_highest_rel_level(stations, N):
-        plot_water_level_with_fit(station, *fetch_measure_levels(station.measure_id, dt=datetime.timedelta(days=DT)), ORDER)
+        dates, levels = fetch_measure_levels(station.measure_id, dt=datetime.timedelta(days=DT), store=store)
+        plot_water_level_with_fit(station, dates, levels, ORDER)
 
 if __name__ == "__main__":
     print("*** Task 2F: CUED Part IA Flood Warning System ***")
@@ -1,8 +1,21 @@
 import datetime
+import sys
 
 from floodsystem.stationdata import build_station_list, update_water_levels
 from floodsystem.datafetcher import fetch_measure_levels
 from floodsystem.flood import stations_highest_rel_level, get_all_town_risk_levels
+from floodsystem.readingstore import ReadingStore
+from floodsystem import metrics
+
+
+# Maximum number of level histories fetched at once. Requests are also
+# sent through the shared transport's rate limiter (see
+# floodsystem.transport), which allows every one of these requests in
+# flight at once and starts them at 50 a second at first, raising the
+# rate while it holds requests back and cutting back only while the
+# Environment Agency throttles or fails requests
+MAX_WORKERS = 16
+
 
 def run():
     """Requirements for Task 2G"""
@@ -13,7 +26,7 @@ def run():
     # Update water levels
     update_water_levels(stations)
 
-    towns = get_all_town_risk_levels(stations[:], 1, 3, True)
+    towns = get_all_town_risk_levels(stations[:], 1, 3, True, max_workers=MAX_WORKERS, store=ReadingStore())
 
     print('=== Towns at severe risk of flooding ===')
     print(*towns[0], sep = '\n')
@@ -27,6 +40,10 @@ def run():
     print('=== Towns at low risk of flooding ===')
     print(*towns[3], sep = '\n')    
 
+    # Timings and counts of the run, if FLOODSYSTEM_METRICS=1 is set
+    if metrics.is_enabled():
+        print(metrics.format_report(), file=sys.stderr)
+
 if __name__ == "__main__":
     print("*** Task 2G: CUED Part IA Flood Warning System ***")
     run()
@@ -0,0 +1,64 @@
+"""Benchmark of the time taken to import the floodsystem modules.
+
+Each module is imported in a fresh interpreter, several times, and the
+best wall-clock time of the import is reported along with which of the
+slow optional dependencies (matplotlib, requests, dateutil) it loaded.
+The time of starting an interpreter which only imports numpy is
+reported as a baseline, as every module needs numpy.
+
+Usage: python benchmarks/bench_import.py [number of runs]
+"""
+
+import json
+import os
+import subprocess
+import sys
+
+
+MODULES = [
+    "floodsystem.station",
+    "floodsystem.geo",
+    "floodsystem.analysis",
+    "floodsystem.datafetcher",
+    "floodsystem.stationdata",
+    "floodsystem.flood",
+    "floodsystem.monitor",
+    "floodsystem.plot",
+]
+
+HEAVY = ["matplotlib", "requests", "dateutil"]
+
+# Run in the child interpreter: times the import and lists the heavy modules it loaded
+SCRIPT = """
+import json, sys, time
+start = time.perf_counter()
+import {module}
+elapsed = time.perf_counter() - start
+print(json.dumps({{"seconds": elapsed, "loaded": [m for m in {heavy!r} if m in sys.modules]}}))
+"""
+
+
+def time_import(module, runs):
+    """Best time of importing module in a fresh interpreter, and the heavy modules it loaded"""
+    root = os.path.join(os.path.dirname(os.path.abspath(__file__)), os.pardir)
+    best = None
+    for _ in range(runs):
+        output = subprocess.run([sys.executable, "-c", SCRIPT.format(module=module, heavy=HEAVY)],
+                                cwd=root, check=True, capture_output=True, text=True).stdout
+        result = json.loads(output)
+        if best is None or result["seconds"] < best["seconds"]:
+            best = result
+    return best
+
+
+def run(runs=5):
+    results = {"runs": runs, "modules": {}}
+    for module in ["numpy"] + MODULES:
+        result = results["modules"][module] = time_import(module, runs)
+        print("{:>24}: {:>8.1f} ms  {}".format(module, 1e3 * result["seconds"], " ".join(result["loaded"])),
+              file=sys.stderr)
+    return results
+
+
+if __name__ == "__main__":
+    print(json.dumps(run(*[int(arg) for arg in sys.argv[1:]])))
@@ -0,0 +1,182 @@
+"""Benchmark suite for the flood warning system, run offline.
+
+Serves a synthetic network of stations from a local stub of the
+Environment Agency API (see synthetic.py and stubserver.py), points
+floodsystem.datafetcher at it, and times building the station list,
+updating water levels, the geo and spatial queries, polynomial fitting
+and town risk assessment.
+
+The stub can throttle requests beyond a number in flight at once, to
+measure how the transport's rate limiter and retries cope with an
+overloaded service.
+
+Each benchmark is run several times and the best time is reported.
+Results are printed to stdout as JSON, so that runs can be stored and
+compared to track regressions, and a summary is printed to stderr.
+
+Usage: python benchmarks/bench_suite.py [--stations N] [--days D]
+           [--histories H] [--repeats R] [--workers W] [--processes P]
+           [--server-limit L] [--rate R] [--only NAME]
+"""
+
+import argparse
+import datetime
+import json
+import os
+import platform
+import sys
+import tempfile
+import time
+
+import numpy as np
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), os.pardir))
+
+from floodsystem import datafetcher  # noqa: E402
+from floodsystem.analysis import polyfit, polyfit_many  # noqa: E402
+from floodsystem.cache import CachePolicy  # noqa: E402
+from floodsystem.datafetcher import fetch_measure_levels, iter_measure_levels  # noqa: E402
+from floodsystem.catalog import StationCatalog  # noqa: E402
+from floodsystem.flood import fetch_station_histories, get_all_town_risk_levels, get_risk_levels  # noqa: E402
+from floodsystem.geo import (rivers_station_number, rivers_with_station, stations_by_distance,  # noqa: E402
+                             stations_by_river, stations_within_radius)
+from floodsystem.spatial import StationIndex  # noqa: E402
+from floodsystem.stationdata import build_station_list, update_water_levels  # noqa: E402
+from floodsystem.transport import HTTPTransport, set_transport  # noqa: E402
+from stubserver import StubServer  # noqa: E402
+from synthetic import SyntheticNetwork  # noqa: E402
+
+
+CAMBRIDGE = (52.2053, 0.1218)
+
+
+def best_time(f, repeats):
+    """Best wall-clock time of calling f over several runs, and the result of the last call"""
+    best = float("inf")
+    for _ in range(repeats):
+        start = time.perf_counter()
+        result = f()
+        best = min(best, time.perf_counter() - start)
+    return best, result
+
+
+class Suite:
+    def __init__(self, stub, args):
+        self.stub = stub
+        self.args = args
+        self.results = {}
+
+    def time(self, name, f, repeats=None, **info):
+        """Times f, unless it is excluded by --only, and records the result"""
+        if self.args.only and not any(name.startswith(prefix) for prefix in self.args.only):
+            return f()
+        seconds, result = best_time(f, repeats or self.args.repeats)
+        self.results[name] = dict(seconds=seconds, **info)
+        print("{:>40}: {:>10.4f} s".format(name, seconds), file=sys.stderr)
+        return result
+
+    def run(self):
+        n = self.args.stations
+
+        self.time("build_station_list.download", lambda: build_station_list(use_cache=False), stations=n)
+        stations = self.time("build_station_list.cache", lambda: build_station_list(), stations=n)
+        self.time("build_station_list.stream", lambda: build_station_list(stream=True), stations=n)
+        build_station_list(binary=True)
+        self.time("build_station_list.binary", lambda: build_station_list(binary=True), stations=n)
+
+        self.time("update_water_levels", lambda: update_water_levels(stations), stations=len(stations))
+
+        self.time("geo.stations_by_distance", lambda: stations_by_distance(stations, CAMBRIDGE))
+        self.time("geo.stations_within_radius", lambda: stations_within_radius(stations, CAMBRIDGE, 10))
+        self.time("geo.rivers_with_station", lambda: rivers_with_station(stations))
+        self.time("geo.stations_by_river", lambda: stations_by_river(stations))
+        self.time("geo.rivers_station_number", lambda: rivers_station_number(stations, 9))
+
+        # Grouping queries answered from a catalog's memoized indexes, after the first query builds them
+        catalog = StationCatalog(stations)
+        self.time("catalog.first_query", lambda: (catalog.invalidate(), catalog.rivers_station_number(9)), repeats=1)
+        self.time("catalog.rivers_station_number", lambda: rivers_station_number(catalog, 9))
+        self.time("catalog.stations_by_town", lambda: catalog.stations_by_town())
+
+        index = self.time("spatial.build", lambda: StationIndex(stations))
+        points = [tuple(p) for p in np.random.default_rng(1).uniform((50.0, -5.7), (55.8, 1.8), (100, 2))]
+        self.time("spatial.within_radius", lambda: [index.within_radius(p, 10) for p in points], queries=len(points))
+        self.time("spatial.nearest", lambda: [index.nearest(p, 10) for p in points], queries=len(points))
+
+        # Level histories of a sample of stations with a consistent typical range
+        sample = [s for s in stations if s.typical_range_consistent()][:self.args.histories]
+        histories = self.time(
+            "fetch_station_histories",
+            lambda: list(fetch_station_histories(sample, self.args.days, self.args.workers)),
+            repeats=1, histories=len(sample), days=self.args.days, workers=self.args.workers)
+        readings = sum(len(h[0]) for h in histories)
+        if "fetch_station_histories" in self.results:
+            self.results["fetch_station_histories"]["throttled"] = self.stub.throttled
+        self.time("polyfit", lambda: [polyfit(dates, levels, 3) for (dates, levels) in histories],
+                  histories=len(histories), readings=readings)
+        self.time("polyfit_many", lambda: polyfit_many([h[0] for h in histories], [h[1] for h in histories], 3),
+                  histories=len(histories), readings=readings)
+        self.time("get_risk_levels", lambda: get_risk_levels(histories, 3), histories=len(histories), readings=readings)
+        if self.args.processes:
+            self.time("get_risk_levels.processes", lambda: get_risk_levels(histories, 3, self.args.processes),
+                      histories=len(histories), readings=readings, processes=self.args.processes)
+
+        # The whole served history of one station, in one response or streamed a day at a time
+        history = datetime.timedelta(days=self.args.history_days)
+        measure_id = sample[0].measure_id
+        self.time("fetch_measure_levels.whole", lambda: fetch_measure_levels(measure_id, history, as_series=True),
+                  days=self.args.history_days)
+        self.time("fetch_measure_levels.stream",
+                  lambda: sum(len(page.times) for page in iter_measure_levels(measure_id, history, True, 500)),
+                  days=self.args.history_days, page_size=500)
+
+        # Risk of the towns of the sample, which fetches the histories of every station in those towns
+        towns = {s.town for s in sample}
+        assessed = [s for s in stations if s.town in towns]
+        self.time("get_all_town_risk_levels",
+                  lambda: get_all_town_risk_levels(assessed, self.args.days, 3, False, max_workers=self.args.workers,
+                                                   processes=self.args.processes),
+                  repeats=1, stations=len(assessed), towns=len(towns), days=self.args.days, workers=self.args.workers,
+                  processes=self.args.processes)
+
+        return self.results
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--stations", type=int, default=5000, help="number of synthetic stations")
+    parser.add_argument("--days", type=float, default=2, help="days of level history fetched for each station")
+    parser.add_argument("--history-days", type=float, default=30, help="days of level history the stub serves")
+    parser.add_argument("--histories", type=int, default=200, help="number of station histories to fit")
+    parser.add_argument("--repeats", type=int, default=3, help="number of runs of each benchmark")
+    parser.add_argument("--workers", type=int, default=16, help="number of histories fetched at once")
+    parser.add_argument("--processes", type=int, help="number of processes to fit histories in")
+    parser.add_argument("--server-limit", type=int,
+                        help="number of requests the stub handles at once before throttling")
+    parser.add_argument("--rate", type=float,
+                        help="number of requests started per second at first (no token bucket if not given)")
+    parser.add_argument("--seed", type=int, default=0, help="seed of the synthetic network")
+    parser.add_argument("--only", action="append", help="only run benchmarks whose name starts with this")
+    args = parser.parse_args(argv)
+
+    network = SyntheticNetwork(args.stations, seed=args.seed)
+    with StubServer(network, history_days=args.history_days, max_in_flight=args.server_limit) as stub, \
+            tempfile.TemporaryDirectory() as cache:
+        datafetcher.STATION_DATA_URL = stub.station_data_url
+        datafetcher.LEVEL_DATA_URL = stub.level_data_url
+        datafetcher.cache_policy = CachePolicy(directory=cache)
+        set_transport(HTTPTransport(rate=args.rate, retry_delay=0.05))
+        results = Suite(stub, args).run()
+
+    return {
+        "timestamp": datetime.datetime.now(datetime.timezone.utc).isoformat(),
+        "python": platform.python_version(),
+        "numpy": np.__version__,
+        "machine": platform.machine(),
+        "config": {name: value for (name, value) in vars(args).items() if name != "only"},
+        "results": results,
+    }
+
+
+if __name__ == "__main__":
+    print(json.dumps(main(), indent=2))
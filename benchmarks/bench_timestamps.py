@@ -0,0 +1,52 @@
+"""Benchmark of parsing reading timestamps, in readings per second.
+
+Compares parsing every timestamp with dateutil (as fetch_measure_levels
+used to) with the fast paths in floodsystem.datafetcher.
+
+Usage: python benchmarks/bench_timestamps.py [number of readings]
+"""
+
+import datetime
+import json
+import os
+import sys
+import time
+
+import dateutil.parser
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), os.pardir))
+
+from floodsystem.datafetcher import parse_datetime64, parse_datetimes  # noqa: E402
+
+
+def timestamps(n):
+    """Timestamps of n readings every 15 minutes, in the Environment Agency's format"""
+    start = datetime.datetime(2024, 1, 1)
+    return [(start + datetime.timedelta(minutes=15 * i)).strftime("%Y-%m-%dT%H:%M:%SZ") for i in range(n)]
+
+
+def throughput(parse, strings, repeats=3):
+    """Best number of strings parsed per second over several runs"""
+    best = float("inf")
+    for _ in range(repeats):
+        start = time.perf_counter()
+        parse(strings)
+        best = min(best, time.perf_counter() - start)
+    return len(strings) / best
+
+
+def run(n=100000):
+    strings = timestamps(n)
+    results = {
+        "readings": n,
+        "dateutil": throughput(lambda s: [dateutil.parser.parse(x) for x in s], strings),
+        "parse_datetimes": throughput(parse_datetimes, strings),
+        "parse_datetime64": throughput(parse_datetime64, strings),
+    }
+    for name in ["dateutil", "parse_datetimes", "parse_datetime64"]:
+        print("{:>18}: {:>12,.0f} readings/s".format(name, results[name]), file=sys.stderr)
+    return results
+
+
+if __name__ == "__main__":
+    print(json.dumps(run(*[int(arg) for arg in sys.argv[1:]])))
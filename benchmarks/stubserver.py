@@ -0,0 +1,191 @@
+"""A local stub of the Environment Agency flood monitoring API.
+
+Serves a SyntheticNetwork at the /id/stations, /id/measures and
+/id/measures/<measure>/readings endpoints, with the _limit, _offset,
+since, startdate and enddate query parameters, and ETags so that cached copies can be
+revalidated. Responses for the station list and latest levels are
+encoded once and reused.
+
+Like a throttling upstream service, the stub can answer 429 Too Many
+Requests to requests beyond a number in flight at once.
+
+Usage: python benchmarks/stubserver.py [number of stations] [port]
+"""
+
+import hashlib
+import json
+import threading
+import urllib.parse
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+import numpy as np
+
+from synthetic import SyntheticNetwork
+
+
+class StubServer:
+    """Serves a SyntheticNetwork over HTTP on a local port.
+
+    history_days is how far back the readings of each measure go.
+    max_in_flight is the number of requests handled at once, beyond
+    which requests are throttled, or None for no limit.
+    requests counts the requests made for each path, and throttled the
+    requests which were answered with 429.
+    """
+
+    def __init__(self, network, history_days=30, host="127.0.0.1", port=0, max_in_flight=None):
+        self.network = network
+        self.history_days = history_days
+        self.max_in_flight = max_in_flight
+        self.requests = {}
+        self.throttled = 0
+        self._in_flight = 0
+        self._lock = threading.Lock()
+        self._bodies = {}
+        self.server = ThreadingHTTPServer((host, port), self._handler())
+        self.server.daemon_threads = True
+        self.url = "http://{}:{}".format(*self.server.server_address[:2])
+        self._thread = None
+
+    @property
+    def station_data_url(self):
+        return self.url + "/id/stations?status=Active&parameter=level&qualifier=Stage&_view=full"
+
+    @property
+    def level_data_url(self):
+        return self.url + "/id/measures?parameter=level&qualifier=Stage&qualifier=level"
+
+    def start(self):
+        self._thread = threading.Thread(target=self.server.serve_forever, daemon=True)
+        self._thread.start()
+        return self
+
+    def stop(self):
+        self.server.shutdown()
+        self.server.server_close()
+
+    def __enter__(self):
+        return self.start()
+
+    def __exit__(self, *args):
+        self.stop()
+
+    def advance(self, steps=1):
+        """Moves the network on by a number of reading intervals"""
+        with self._lock:
+            self.network.advance(steps)
+            self._bodies.pop("/id/measures", None)
+
+    def count(self, prefix=""):
+        """Number of requests made for paths starting with prefix"""
+        with self._lock:
+            return sum(n for (path, n) in self.requests.items() if path.startswith(prefix))
+
+    def _body(self, path, query):
+        """Encoded response and ETag for a request"""
+        limit = int(query["_limit"][0]) if "_limit" in query else None
+        offset = int(query.get("_offset", ["0"])[0])
+        stop = None if limit is None else offset + limit
+
+        if path in ("/id/stations", "/id/measures"):
+            if offset == 0 and limit is None:
+                # The whole list is encoded once, as it is much the largest response
+                with self._lock:
+                    cached = self._bodies.get(path)
+                if cached is None:
+                    cached = self._encode(self._items(path, 0, None))
+                    with self._lock:
+                        self._bodies[path] = cached
+                return cached
+            return self._encode(self._items(path, offset, stop))
+
+        if path.endswith("/readings"):
+            k = self.network.measure_index(path[:-len("/readings")])
+            if k is None or not 0 <= k < self.network.n:
+                return None
+            since = query.get("since", [None])[0]
+            if since is not None:
+                since = np.datetime64(since.rstrip("Z"))
+            first = query.get("startdate", [None])[0]
+            if first is not None:
+                since = np.datetime64(first).astype("datetime64[s]")
+            items = self.network.reading_items(k, since, self.history_days)
+            last = query.get("enddate", [None])[0]
+            if last is not None:
+                items = [item for item in items if item["dateTime"][:10] <= last]
+            return self._encode(items[offset:stop])
+
+        return None
+
+    def _items(self, path, start, stop):
+        if path == "/id/stations":
+            return self.network.station_items(self.url, start, stop)
+        return self.network.measure_items(self.url, start, stop)
+
+    @staticmethod
+    def _encode(items):
+        body = json.dumps({"meta": {"publisher": "Synthetic"}, "items": items}).encode("utf-8")
+        return body, '"{}"'.format(hashlib.sha1(body).hexdigest())
+
+    def _handler(self):
+        stub = self
+
+        class Handler(BaseHTTPRequestHandler):
+            protocol_version = "HTTP/1.1"
+
+            def do_GET(self):
+                url = urllib.parse.urlsplit(self.path)
+                path = url.path.rstrip("/")
+                with stub._lock:
+                    stub.requests[path] = stub.requests.get(path, 0) + 1
+                    throttled = stub.max_in_flight is not None and stub._in_flight >= stub.max_in_flight
+                    if throttled:
+                        stub.throttled += 1
+                    else:
+                        stub._in_flight += 1
+                if throttled:
+                    self.send_response(429)
+                    self.send_header("Retry-After", "0")
+                    self.send_header("Content-Length", "0")
+                    self.end_headers()
+                    return
+                try:
+                    self._respond(path, url)
+                finally:
+                    with stub._lock:
+                        stub._in_flight -= 1
+
+            def _respond(self, path, url):
+                response = stub._body(path, urllib.parse.parse_qs(url.query))
+                if response is None:
+                    self.send_error(404)
+                    return
+                body, etag = response
+                if self.headers.get("If-None-Match") == etag:
+                    self.send_response(304)
+                    self.send_header("ETag", etag)
+                    self.send_header("Content-Length", "0")
+                    self.end_headers()
+                    return
+                self.send_response(200)
+                self.send_header("Content-Type", "application/json")
+                self.send_header("Content-Length", str(len(body)))
+                self.send_header("ETag", etag)
+                self.end_headers()
+                self.wfile.write(body)
+
+            def log_message(self, *args):
+                pass
+
+        return Handler
+
+
+if __name__ == "__main__":
+    import sys
+
+    args = [int(arg) for arg in sys.argv[1:]]
+    n = args[0] if args else 5000
+    port = args[1] if len(args) > 1 else 8000
+    stub = StubServer(SyntheticNetwork(n), port=port)
+    print("Serving {} synthetic stations at {}".format(n, stub.url), file=sys.stderr)
+    stub.server.serve_forever()
@@ -0,0 +1,152 @@
+"""Synthetic Environment Agency data for the benchmarks.
+
+Station lists and reading histories are generated deterministically
+from a seed, in the same JSON format as the Environment Agency flood
+monitoring API, including the irregularities the real data has:
+stations with no town, no typical range, an inconsistent typical range,
+a list for a label or no coordinates, measures with no latest reading
+and readings with no value or a list of values.
+
+Readings are generated on demand for any time range, so histories of
+months do not have to be held in memory.
+"""
+
+import numpy as np
+
+
+# Rough bounding box of England, (latitude, longitude)
+LAT_RANGE = (50.0, 55.8)
+LONG_RANGE = (-5.7, 1.8)
+
+# Readings are every 15 minutes
+READING_INTERVAL = np.timedelta64(15, "m")
+
+
+class SyntheticNetwork:
+    """A network of n synthetic monitoring stations.
+
+    Station k has the station id ``<url>/id/stations/<k>`` and the
+    measure id ``<url>/id/measures/<k>-level-stage-i-15_min-m``, where
+    url is the base URL of the server the data is served from.
+
+    The latest reading of every measure is at ``now``, which is rounded
+    down to a whole reading interval.
+    """
+
+    def __init__(self, n, seed=0, now=None):
+        self.n = n
+        self.seed = seed
+        if now is None:
+            now = np.datetime64("now", "s")
+        self.now = now.astype("datetime64[m]").astype("datetime64[s]")
+        self.now -= (self.now - np.datetime64("1970-01-01T00:00:00")) % READING_INTERVAL
+
+        rng = np.random.default_rng(seed)
+        self.lat = rng.uniform(*LAT_RANGE, n)
+        self.long = rng.uniform(*LONG_RANGE, n)
+        self.river = rng.integers(0, max(1, n // 20), n)
+        self.town = rng.integers(0, max(1, n // 5), n)
+        self.has_town = rng.random(n) >= 0.1
+        self.typical_low = np.round(rng.uniform(0.0, 1.0, n), 3)
+        self.typical_high = np.round(self.typical_low + rng.uniform(0.2, 2.0, n), 3)
+        self.has_range = rng.random(n) >= 0.05
+        self.inconsistent = rng.random(n) < 0.02
+        self.list_label = rng.random(n) < 0.01
+        self.has_coord = rng.random(n) >= 0.005
+        self.has_latest = rng.random(n) >= 0.03
+        self.list_latest = rng.random(n) < 0.005
+
+        # Levels follow a slow tide-like cycle and a trend, relative to the typical range
+        self.phase = rng.uniform(0, 2 * np.pi, n)
+        self.period = rng.uniform(0.5, 14.0, n)
+        self.trend = rng.normal(0.0, 0.05, n)
+
+    def advance(self, steps=1):
+        """Moves now on by a number of reading intervals, giving every measure new readings"""
+        self.now += steps * READING_INTERVAL
+
+    def measure_path(self, k):
+        return "/id/measures/{}-level-stage-i-15_min-m".format(k)
+
+    @staticmethod
+    def measure_index(path):
+        """The station number of a measure path, or None"""
+        name = path.rstrip("/").rsplit("/", 1)[-1]
+        try:
+            return int(name.split("-", 1)[0])
+        except ValueError:
+            return None
+
+    def station_items(self, url, start=0, stop=None):
+        """Station items for the /id/stations endpoint"""
+        stop = self.n if stop is None else min(stop, self.n)
+        items = []
+        for k in range(start, stop):
+            label = "Station {}".format(k)
+            item = {
+                "@id": "{}/id/stations/{}".format(url, k),
+                "label": [label, label + " Gauge"] if self.list_label[k] else label,
+                "measures": [{"@id": url + self.measure_path(k), "parameter": "level", "qualifier": "Stage"}],
+                "riverName": "River {}".format(self.river[k]),
+            }
+            if self.has_coord[k]:
+                item["lat"] = float(self.lat[k])
+                item["long"] = float(self.long[k])
+            if self.has_town[k]:
+                item["town"] = "Town {}".format(self.town[k])
+            if self.has_range[k]:
+                low, high = float(self.typical_low[k]), float(self.typical_high[k])
+                if self.inconsistent[k]:
+                    low, high = high, low
+                item["stageScale"] = {"typicalRangeLow": low, "typicalRangeHigh": high}
+            items.append(item)
+        return items
+
+    def levels(self, k, times):
+        """Water levels of station k at a datetime64 array of times"""
+        days = (times - np.datetime64("1970-01-01T00:00:00")) / np.timedelta64(1, "D")
+        since = (self.now - times) / np.timedelta64(1, "D")
+        low, high = self.typical_low[k], self.typical_high[k]
+        relative = 0.5 + 0.4 * np.sin(2 * np.pi * days / self.period[k] + self.phase[k]) - self.trend[k] * since
+        noise = np.sin(days * 7919.0 + k) * 0.01
+        return np.round(low + (high - low) * relative + noise, 3)
+
+    def measure_items(self, url, start=0, stop=None):
+        """Measure items with their latest reading, for the /id/measures endpoint"""
+        stop = self.n if stop is None else min(stop, self.n)
+        now = str(self.now) + "Z"
+        ks = np.arange(start, stop)
+        latest = self.levels(ks, np.full(len(ks), self.now)) if len(ks) else []
+        items = []
+        for (k, level) in zip(ks.tolist(), np.asarray(latest).tolist()):
+            measure = url + self.measure_path(k)
+            item = {"@id": measure, "parameter": "level", "qualifier": "Stage"}
+            if self.has_latest[k]:
+                value = [level, level + 0.01] if self.list_latest[k] else level
+                item["latestReading"] = {"@id": measure + "/readings/latest", "measure": measure,
+                                         "dateTime": now, "value": value}
+            items.append(item)
+        return items
+
+    def reading_times(self, since, days):
+        """Times of the readings from since (a datetime64, or None for the start of the history) up to now, where the
+        history goes back days"""
+        first = self.now - np.timedelta64(int(days * 86400), "s")
+        if since is not None and since > first:
+            first = since
+        # Round up to a whole reading interval
+        first += -(first - np.datetime64("1970-01-01T00:00:00")) % READING_INTERVAL
+        if first > self.now:
+            return np.array([], dtype="datetime64[s]")
+        return np.arange(first, self.now + READING_INTERVAL, READING_INTERVAL).astype("datetime64[s]")
+
+    def reading_items(self, k, since=None, days=30):
+        """Reading items of station k for the /readings endpoint, in date order"""
+        times = self.reading_times(since, days)
+        levels = self.levels(k, times).tolist()
+        strings = [s + "Z" for s in np.datetime_as_string(times, unit="s").tolist()]
+        items = [{"dateTime": t, "value": v} for (t, v) in zip(strings, levels)]
+        # Some readings are missing their value
+        for i in range(k % 97, len(items), 97):
+            del items[i]["value"]
+        return items
@@ -0,0 +1,121 @@
+"""Fixtures shared by the unit tests"""
+
+import collections
+import datetime
+import json
+import threading
+import urllib.parse
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+import pytest
+
+from floodsystem import datafetcher
+from floodsystem.cache import CachePolicy
+
+
+class StubEA:
+    """A local stub of the Environment Agency API, serving stations with simulated streams of readings"""
+
+    def __init__(self, n):
+        self.lock = threading.Lock()
+        self.readings = dict()
+        self.requests = collections.Counter()
+        self.paths = collections.Counter()
+        self.server = ThreadingHTTPServer(("127.0.0.1", 0), self.handler())
+        self.url = "http://127.0.0.1:{}".format(self.server.server_address[1])
+
+        self.stations = list()
+        now = datetime.datetime.utcnow().replace(microsecond=0)
+        for k in range(n):
+            measure = "{}/id/measures/{}".format(self.url, k)
+            item = {"@id": "{}/id/stations/{}".format(self.url, k), "label": "Station {}".format(k),
+                    "lat": 52 + k / n, "long": 0.1, "measures": [{"@id": measure}], "riverName": "River",
+                    "stageScale": {"typicalRangeLow": 0.0, "typicalRangeHigh": 1.0 if k % 5 else -1.0}}
+            if k % 7:
+                item["town"] = "Town {}".format(k % 4)
+            self.stations.append(item)
+            self.readings[measure] = [(now - datetime.timedelta(minutes=15 * i), 0.4 + 0.01 * k * (-1)**k * (8 - i))
+                                      for i in range(8, 0, -1)]
+
+    def handler(self):
+        stub = self
+
+        class Handler(BaseHTTPRequestHandler):
+            def do_GET(self):
+                path, _, query = self.path.partition("?")
+                query = urllib.parse.parse_qs(query)
+                with stub.lock:
+                    stub.paths[path] += 1
+                    if path == "/id/stations":
+                        items = stub.stations
+                    elif path == "/id/measures":
+                        items = [{"@id": m, "latestReading": {"measure": m, "dateTime": stub.iso(r[-1][0]),
+                                                              "value": r[-1][1]}}
+                                 for (m, r) in stub.readings.items()]
+                    elif path == "/data/readings":
+                        items = stub.all_readings(query)
+                    else:
+                        measure = stub.url + path[:-len("/readings/")]
+                        stub.requests[measure] += 1
+                        items = stub.measure_readings(measure, query)
+                body = json.dumps({"items": items}).encode()
+                self.send_response(200)
+                self.send_header("Content-Type", "application/json")
+                self.send_header("Content-Length", str(len(body)))
+                self.end_headers()
+                self.wfile.write(body)
+
+            def log_message(self, *args):
+                pass
+
+        return Handler
+
+    def measure_readings(self, measure, query):
+        # Readings of a measure since a time, newest first as the Environment Agency sorts them
+        readings = [(t, measure, v) for (t, v) in self.readings[measure]]
+        return [{"dateTime": self.iso(t), "value": v} for (t, m, v) in self.page(readings, query)]
+
+    def all_readings(self, query):
+        # Readings of every measure since a time, newest first
+        readings = [(t, m, v) for (m, r) in self.readings.items() for (t, v) in r]
+        return [{"dateTime": self.iso(t), "measure": m, "value": v} for (t, m, v) in self.page(readings, query)]
+
+    @staticmethod
+    def page(readings, query):
+        # Readings from the since query parameter onwards, or between the start and end dates,
+        # newest first, paged with _limit and _offset
+        if "since" in query:
+            since = datetime.datetime.fromisoformat(query["since"][0].rstrip("Z"))
+            readings = [reading for reading in readings if reading[0] >= since]
+        if "startdate" in query:
+            first = datetime.date.fromisoformat(query["startdate"][0])
+            last = datetime.date.fromisoformat(query["enddate"][0])
+            readings = [reading for reading in readings if first <= reading[0].date() <= last]
+        readings = sorted(readings, key=lambda reading: reading[0], reverse=True)
+        if "_limit" in query:
+            offset = int(query.get("_offset", ["0"])[0])
+            readings = readings[offset:offset + int(query["_limit"][0])]
+        return readings
+
+    @staticmethod
+    def iso(t):
+        return t.isoformat() + "Z"
+
+    def add_reading(self, k, value):
+        measure = "{}/id/measures/{}".format(self.url, k)
+        with self.lock:
+            t, _ = self.readings[measure][-1]
+            self.readings[measure].append((t + datetime.timedelta(minutes=15), value))
+
+
+@pytest.fixture
+def stub(monkeypatch, tmp_path):
+    stub = StubEA(30)
+    threading.Thread(target=stub.server.serve_forever, daemon=True).start()
+    monkeypatch.setattr(datafetcher, "STATION_DATA_URL", stub.url + "/id/stations")
+    monkeypatch.setattr(datafetcher, "LEVEL_DATA_URL", stub.url + "/id/measures?parameter=level")
+    monkeypatch.setattr(datafetcher, "READINGS_DATA_URL", stub.url + "/data/readings?parameter=level")
+    monkeypatch.setattr(datafetcher, "cache_policy", CachePolicy(directory=str(tmp_path)))
+    yield stub
+    stub.server.shutdown()
+    stub.server.server_close()
@@ -2,9 +2,43 @@
 This module contains functions related to predicting the water levels for monitoring stations.
 """
 
+import collections
+import datetime
+import math
+
 import numpy as np
 
-from matplotlib.dates import date2num
+from . import metrics
+from .series import day_numbers
+
+
+def fill_missing_levels(levels):
+    """
+    Replaces missing water levels with the previous recorded value (or 1 if the first values are missing),
+    allowing fitting to stations with partially missing data.
+
+    # Inputs
+    - `levels`: the water level measurements, with `None` or NaN for missing measurements.
+
+    # Returns
+    A `float64` array of the levels with no missing values.
+    """
+    if isinstance(levels, np.ndarray):
+        levels = levels.astype(float)
+    else:
+        levels = np.array([np.nan if level is None else level for level in levels], dtype=float)
+    missing = np.isnan(levels)
+    if not missing.any():
+        return levels
+
+    # Index of the latest recorded value at or before each measurement
+    latest = np.where(missing, 0, np.arange(len(levels)))
+    np.maximum.accumulate(latest, out=latest)
+    levels = levels[latest]
+
+    # Only missing values before the first recorded value are left
+    levels[np.isnan(levels)] = 1.
+    return levels
 
 
 def polyfit(dates, levels, p):
@@ -12,31 +46,232 @@ def polyfit(dates, levels, p):
     Computes the least-squares fit for a degree `p` polynomial to the level history data of a station
 
     # Inputs
-    - `dates`: a `list` of the dates of the measurements.
+    - `dates`: a `list` or `datetime64` array of the dates of the measurements.
     - `levels`: the water level measurements.
     - `p`: the degree of the polynomial to fit to the data.
 
     # Returns
     A `tuple` containing the fitted polynomial and the 0-offset for the dates.
     """
-    # Convert dates to a numerical representation
-    date_array = date2num(dates)
-    # Offset the dates to have smaller values to avoid floating point errors
-    offset = date_array[0]
-    date_array -= offset
-
-    # Replaces `None` with the previous recorded value (or 1 if the first value is missing), allowing fitting to stations with partially missing data
-    for i in range(len(levels)):
-        if levels[i] == None:
-            if i == 0:
-                levels[i] == 1.
-            else:
-                levels[i] = levels[i-1]
+    with metrics.timer("analysis.polyfit"):
+        # Convert dates to a numerical representation
+        date_array = day_numbers(dates)
+        # Offset the dates to have smaller values to avoid floating point errors
+        offset = date_array[0]
+        date_array -= offset
 
-    # Get polynomial coefficients
-    coefficients = np.polyfit(date_array, levels, p)
+        # Get polynomial coefficients
+        coefficients = np.polyfit(date_array, fill_missing_levels(levels), p)
 
-    # Convert coefficient into a polynomial object
-    polynomial = np.poly1d(coefficients)
+        # Convert coefficient into a polynomial object
+        polynomial = np.poly1d(coefficients)
 
     return (polynomial, offset)
+
+
+def polyfit_many(dates, levels, p, max_batch_size=2**21):
+    """
+    Computes the least-squares fits for degree `p` polynomials to the level histories of many stations at once.
+
+    The histories are padded to the same length and all of the fits are solved together with batched linear algebra,
+    giving the same results as calling `polyfit` on each history to within rounding.
+
+    # Inputs
+    - `dates`: a `list` of the dates of the measurements of each station.
+    - `levels`: a `list` of the water level measurements of each station.
+    - `p`: the degree of the polynomials to fit to the data.
+    - `max_batch_size`: the maximum number of padded measurements to fit at once, which bounds the memory used.
+
+    # Returns
+    A `list` of `tuple`s containing the fitted polynomial and the 0-offset for the dates, for each station.
+    """
+    if len(dates) != len(levels):
+        raise ValueError("dates and levels must have the same number of stations")
+
+    # Offset the dates of each station to have smaller values to avoid floating point errors
+    xs, ys, offsets = [], [], []
+    for (station_dates, station_levels) in zip(dates, levels):
+        x = day_numbers(station_dates)
+        if len(x) == 0:
+            raise ValueError("cannot fit a polynomial to a station with no measurements")
+        if len(x) != len(station_levels):
+            raise ValueError("each station must have the same number of dates and levels")
+        offsets.append(x[0])
+        xs.append(x - x[0])
+        ys.append(fill_missing_levels(station_levels))
+
+    # Fit stations with similar numbers of measurements together to keep padding small
+    coefficients = [None] * len(xs)
+    order = sorted(range(len(xs)), key=lambda i: len(xs[i]))
+    start = 0
+    while start < len(order):
+        end = start + 1
+        while end < len(order) and (end - start + 1) * len(xs[order[end]]) <= max_batch_size:
+            end += 1
+        batch = order[start:end]
+        with metrics.timer("analysis.polyfit_many.batch"):
+            solutions = _lstsq_polyfit([xs[i] for i in batch], [ys[i] for i in batch], p)
+        for (i, c) in zip(batch, solutions):
+            coefficients[i] = c
+        start = end
+
+    metrics.count("analysis.polyfit_many.fits", len(xs))
+    return [(np.poly1d(c), offset) for (c, offset) in zip(coefficients, offsets)]
+
+
+def _lstsq_polyfit(xs, ys, p):
+    """
+    Solves the least-squares polynomial fits for a batch of series, padding them with zero rows, which don't change the
+    solution. As in `np.polyfit`, the columns of the Vandermonde matrices are scaled to improve the conditioning, and
+    singular values below `len(x) * eps` are discarded.
+    """
+    lengths = np.array([len(x) for x in xs])
+    mask = np.arange(lengths.max()) < lengths[:, np.newaxis]
+    x = np.zeros(mask.shape)
+    y = np.zeros(mask.shape)
+    x[mask] = np.concatenate(xs)
+    y[mask] = np.concatenate(ys)
+
+    # Vandermonde matrices with highest powers first, and padding rows zeroed
+    vander = x[:, :, np.newaxis] ** np.arange(p, -1, -1)
+    vander *= mask[:, :, np.newaxis]
+
+    scale = np.sqrt(np.sum(vander**2, axis=1))
+    scale[scale == 0] = 1.
+    vander /= scale[:, np.newaxis, :]
+
+    u, s, vt = np.linalg.svd(vander, full_matrices=False)
+    rcond = lengths * np.finfo(float).eps
+    with np.errstate(divide="ignore"):
+        s_inv = np.where(s > rcond[:, np.newaxis] * s[:, :1], 1. / s, 0.)
+    uty = np.einsum("mlk,ml->mk", u, y)
+    return np.einsum("mkj,mk->mj", vt, s_inv * uty) / scale
+
+
+class SlidingPolyfit:
+    """
+    An incremental least-squares fit of a degree `p` polynomial to the most recent water levels of a station.
+
+    The sums which make up the normal equations of the fit are kept up to date as readings are added and expired, so
+    adding or expiring a reading takes O(p) time however many readings are in the window, and `fit` only solves a
+    `p + 1` by `p + 1` system. The result is the same as calling `polyfit` on the readings in the window, to within
+    rounding, provided the window holds at least `p + 1` distinct dates.
+
+    Missing levels are replaced with the previous recorded level (or 1 if no level has been recorded) as they are
+    added, as `fill_missing_levels` does.
+
+    # Inputs
+    - `p`: the degree of the polynomial to fit.
+    - `window`: a `datetime.timedelta` for how long readings are kept, counted back from the latest reading, or `None`
+      to keep readings until they are expired with `expire`.
+    """
+
+    def __init__(self, p, window=None):
+        self.p = p
+        self.window = None if window is None else window / datetime.timedelta(days=1)
+        # Dates are measured from an origin and in units of the window length, which keeps the sums well conditioned
+        self.scale = self.window if self.window else 1.
+
+        # The (day number, level) of each reading in the window
+        self.readings = collections.deque()
+        self._last_level = None
+        self._reset()
+
+    def _reset(self):
+        self._origin = self.readings[0][0] if self.readings else None
+        # Sums of u^k for k up to 2p and of u^k * level for k up to p, where u is the scaled date
+        self._moments = [0.] * (2 * self.p + 1)
+        self._products = [0.] * (self.p + 1)
+        for (t, level) in self.readings:
+            self._accumulate(t, level, 1.)
+
+    def _accumulate(self, t, level, sign):
+        u = (t - self._origin) / self.scale
+        power = sign
+        for k in range(2 * self.p + 1):
+            self._moments[k] += power
+            if k <= self.p:
+                self._products[k] += power * level
+            power *= u
+
+    def __len__(self):
+        return len(self.readings)
+
+    @property
+    def latest_reading(self):
+        """
+        The `(day number, level)` of the latest reading, where the day number is as given by `day_numbers`.
+        """
+        return self.readings[-1]
+
+    def add(self, date, level):
+        """
+        Adds a reading, which must be no older than the latest reading, and expires readings which are out of the
+        window.
+        """
+        self.extend([date], [level])
+
+    def extend(self, dates, levels):
+        """
+        Adds readings in date order, and expires readings which are out of the window.
+
+        `dates` may be a `list` of `datetime`s or a `datetime64` array, such as the times of a `LevelSeries`.
+        """
+        for (t, level) in zip(day_numbers(dates).tolist(), levels):
+            if self.readings and t < self.readings[-1][0]:
+                raise ValueError("readings must be added in date order")
+            if level is None or level != level:
+                level = 1. if self._last_level is None else self._last_level
+            else:
+                level = float(level)
+                self._last_level = level
+            if self._origin is None:
+                self._origin = t
+            self.readings.append((t, level))
+            self._accumulate(t, level, 1.)
+
+        if self.window is not None and self.readings:
+            self._expire(self.readings[-1][0] - self.window)
+
+    def expire(self, before):
+        """
+        Removes the readings from before the date `before`.
+        """
+        self._expire(day_numbers([before])[0])
+
+    def _expire(self, before):
+        while self.readings and self.readings[0][0] < before:
+            t, level = self.readings.popleft()
+            self._accumulate(t, level, -1.)
+
+        # Start the sums again from the current window once it has moved on by a whole window length, so that the
+        # rounding errors of removing readings don't build up, and the scaled dates stay small
+        if not self.readings or self.readings[0][0] - self._origin > self.scale:
+            self._reset()
+
+    def fit(self):
+        """
+        Returns the fitted polynomial and the 0-offset for the dates, as `polyfit` does for the readings in the window.
+        """
+        if not self.readings:
+            raise ValueError("cannot fit a polynomial to a station with no measurements")
+
+        n = self.p + 1
+        normal = np.array([self._moments[i:i + n] for i in range(n)])
+        products = np.array(self._products)
+        try:
+            coefficients = np.linalg.solve(normal, products)
+        except np.linalg.LinAlgError:
+            # Too few distinct dates to determine the polynomial: take the minimum norm solution
+            coefficients = np.linalg.lstsq(normal, products, rcond=None)[0]
+
+        # Convert from a polynomial in the scaled date u = (x + d) / scale to one in x, the days since the first
+        # reading in the window, by expanding each power of u with the binomial theorem
+        offset = self.readings[0][0]
+        d = offset - self._origin
+        shifted = [0.] * n
+        for (k, c) in enumerate(coefficients.tolist()):
+            c /= self.scale**k
+            for j in range(k + 1):
+                shifted[j] += c * math.comb(k, j) * d**(k - j)
+        return (np.poly1d(shifted[::-1]), offset)
@@ -0,0 +1,180 @@
+"""
+This module contains a compact binary cache format for the station data.
+
+The fields of each station which are used by `MonitoringStation` are extracted once and stored as fixed-width arrays,
+with strings stored in string tables of offsets into a block of UTF-8 bytes. The file is memory-mapped when it is read,
+so loading a `StationTable` from it is almost instant: numbers are read straight from the mapped arrays and strings are
+only decoded when they are used.
+
+# File layout
+- 8 bytes: the magic string `FLOODBIN`.
+- 8 bytes: the length of the header, as a little-endian unsigned integer.
+- The header: a JSON object recording the format version, details of the source data and the `dtype`, `shape` and
+  `offset` of each array.
+- The arrays, each starting at a multiple of 64 bytes from the start of the file.
+"""
+
+import json
+import os
+import threading
+from collections.abc import Sequence
+
+import numpy as np
+
+from .stationtable import StationTable
+
+
+MAGIC = b"FLOODBIN"
+VERSION = 1
+
+_ALIGNMENT = 64
+
+
+class StringColumn(Sequence):
+    """
+    A read-only sequence of strings stored as UTF-8 bytes in `blob`, where string `i` is
+    `blob[offsets[i]:offsets[i+1]]`.
+
+    Strings are decoded each time they are accessed.
+    """
+
+    def __init__(self, offsets, blob):
+        self.offsets = offsets
+        self.blob = blob
+
+    @classmethod
+    def from_strings(cls, strings):
+        """
+        Builds a column from a sequence of `str`.
+        """
+        encoded = [s.encode("utf-8") for s in strings]
+        offsets = np.zeros(len(encoded) + 1, dtype=np.int64)
+        np.cumsum([len(e) for e in encoded], out=offsets[1:])
+        blob = np.frombuffer(b"".join(encoded), dtype=np.uint8)
+        return cls(offsets, blob)
+
+    def __len__(self):
+        return len(self.offsets) - 1
+
+    def tolist(self):
+        """
+        Decodes every string in the column, returning a `list` of `str`.
+        """
+        blob = self.blob.tobytes()
+        offsets = self.offsets.tolist()
+        return [blob[start:end].decode("utf-8") for (start, end) in zip(offsets[:-1], offsets[1:])]
+
+    def __getitem__(self, i):
+        if isinstance(i, slice):
+            return [self[j] for j in range(*i.indices(len(self)))]
+        if i < 0:
+            i += len(self)
+        if not 0 <= i < len(self):
+            raise IndexError("string column index out of range")
+        return self.blob[self.offsets[i]:self.offsets[i + 1]].tobytes().decode("utf-8")
+
+
+# Numeric columns of a `StationTable` which are stored, and the string columns stored as string tables
+_ARRAYS = ("lat", "long", "typical_low", "typical_high", "river_codes", "town_codes")
+_STRINGS = ("station_ids", "measure_ids", "names", "rivers", "towns")
+
+
+def write_station_table(table, path, source=None):
+    """
+    Writes the stations in a `StationTable` to a binary cache file. Latest levels are not stored.
+
+    # Inputs
+    - `table`: the `StationTable` to write.
+    - `path`: the path of the file to write.
+    - `source`: a JSON-serialisable description of the data the table was built from,
+      which is returned by `read_station_table` so that an out-of-date cache can be detected.
+    """
+    arrays = {name: np.ascontiguousarray(getattr(table, name)) for name in _ARRAYS}
+    for name in _STRINGS:
+        column = StringColumn.from_strings(getattr(table, name))
+        arrays[name + ".offsets"] = column.offsets
+        arrays[name + ".blob"] = column.blob
+
+    # Lay out the arrays after the header, which has to be sized first as it records their offsets
+    entries = {name: {"dtype": array.dtype.str, "shape": list(array.shape), "offset": 0}
+               for (name, array) in arrays.items()}
+    header = {"version": VERSION, "source": source, "arrays": entries}
+    while True:
+        encoded = json.dumps(header).encode("utf-8")
+        offset = _align(len(MAGIC) + 8 + len(encoded))
+        for (name, array) in arrays.items():
+            entries[name]["offset"] = offset
+            offset = _align(offset + array.nbytes)
+        if json.dumps(header).encode("utf-8") == encoded:
+            break
+
+    os.makedirs(os.path.dirname(path) or ".", exist_ok=True)
+    tmp_path = "{}.{}.{}.tmp".format(path, os.getpid(), threading.get_ident())
+    with open(tmp_path, "wb") as f:
+        f.write(MAGIC)
+        f.write(len(encoded).to_bytes(8, "little"))
+        f.write(encoded)
+        for (name, array) in arrays.items():
+            f.write(b"\0" * (entries[name]["offset"] - f.tell()))
+            f.write(array.tobytes())
+    os.replace(tmp_path, path)
+
+
+def read_station_header(path):
+    """
+    Returns the header of a binary cache file, or `None` if the file doesn't exist or isn't a readable cache file.
+    """
+    try:
+        with open(path, "rb") as f:
+            if f.read(len(MAGIC)) != MAGIC:
+                return None
+            length = int.from_bytes(f.read(8), "little")
+            header = json.loads(f.read(length).decode("utf-8"))
+    except (FileNotFoundError, ValueError):
+        return None
+    if header.get("version") != VERSION:
+        return None
+    return header
+
+
+def read_station_table(path, source=None):
+    """
+    Reads a `StationTable` from a binary cache file by memory-mapping it.
+
+    If `source` is given, the file is only read if it was written with the same `source`, so that an out-of-date file
+    is never mapped and can be replaced straight away, which isn't possible on Windows while it is mapped.
+
+    # Returns
+    A `tuple` of the `StationTable` and the `source` it was written with, or `None` if the file doesn't exist, isn't a
+    readable cache file or was written with a different `source`. The arrays of the table are read-only, except for
+    the latest levels, which are all NaN.
+    """
+    header = read_station_header(path)
+    if header is None or (source is not None and header["source"] != source):
+        return None
+
+    # The whole file is mapped once, and every array is a view of the mapping
+    mapped = None
+    arrays = dict()
+    for (name, entry) in header["arrays"].items():
+        shape = tuple(entry["shape"])
+        dtype = np.dtype(entry["dtype"])
+        if np.prod(shape) == 0:
+            # Empty arrays can't be memory-mapped
+            arrays[name] = np.zeros(shape, dtype=dtype)
+            continue
+        if mapped is None:
+            mapped = np.memmap(path, dtype=np.uint8, mode="r")
+        end = entry["offset"] + int(np.prod(shape)) * dtype.itemsize
+        arrays[name] = mapped[entry["offset"]:end].view(dtype).reshape(shape)
+
+    columns = {name: arrays[name] for name in _ARRAYS}
+    for name in _STRINGS:
+        columns[name] = StringColumn(arrays[name + ".offsets"], arrays[name + ".blob"])
+    columns["latest_level"] = np.full(len(columns["lat"]), np.nan)
+
+    return StationTable(**columns), header["source"]
+
+
+def _align(offset):
+    return -(-offset // _ALIGNMENT) * _ALIGNMENT
@@ -0,0 +1,211 @@
+"""
+This module contains the cache policy used when fetching data from the Environment Agency.
+
+Each cached resource is stored as a JSON file in the cache directory, alongside a small `.meta` file recording when it
+was fetched and the `ETag` and `Last-Modified` headers it was served with. A cached resource is used as-is until it is
+older than its time-to-live (TTL). After that, it is revalidated with a conditional request, so the resource is only
+downloaded again if it has changed upstream. If it can't be fetched, the expired cached copy is used instead.
+"""
+
+import codecs
+import json
+import os
+import sys
+import threading
+import time
+
+from . import metrics
+from .transport import get_transport
+
+
+# Default time-to-live of each resource, in seconds
+DEFAULT_TTLS = {
+    # The list of stations rarely changes
+    "station_data": 24 * 60 * 60,
+    # Stations report new levels every 15 minutes
+    "level_data": 15 * 60,
+}
+
+
+class CachePolicy:
+    """
+    Decides when cached resources are used, revalidated or fetched again.
+
+    # Inputs
+    - `ttls`: a `dict` mapping resource names to their time-to-live in seconds, overriding `DEFAULT_TTLS`.
+      Resources with no TTL are always revalidated.
+    - `directory`: the directory to store cached resources in.
+    """
+
+    def __init__(self, ttls=None, directory="cache"):
+        self.ttls = dict(DEFAULT_TTLS)
+        if ttls is not None:
+            self.ttls.update(ttls)
+        self.directory = directory
+
+    def ttl(self, resource):
+        """
+        Returns the time-to-live of `resource` in seconds.
+        """
+        return self.ttls.get(resource, 0)
+
+    def path(self, resource):
+        """
+        Returns the path of the file `resource` is cached in.
+        """
+        return os.path.join(self.directory, resource + ".json")
+
+    def load_meta(self, resource):
+        """
+        Returns the metadata stored for the cached copy of `resource`, or `None` if it isn't cached.
+        """
+        path = self.path(resource)
+        if not os.path.exists(path):
+            return None
+        try:
+            with open(path + ".meta", "r") as f:
+                return json.load(f)
+        except (FileNotFoundError, ValueError):
+            # Cache files written before metadata was stored are treated as fetched when last modified, with no
+            # validators
+            return {"url": None, "fetched": os.path.getmtime(path), "etag": None, "last_modified": None}
+
+    def is_fresh(self, resource, url, meta=None):
+        """
+        Returns whether the cached copy of `resource` was fetched from `url` and is younger than its TTL.
+        """
+        if meta is None:
+            meta = self.load_meta(resource)
+        if meta is None or meta["url"] not in (None, url):
+            return False
+        return time.time() - meta["fetched"] < self.ttl(resource)
+
+    def fetch(self, resource, url, revalidate=False, transport=None):
+        """
+        Returns the JSON data for `resource`, using the cached copy where possible.
+
+        # Inputs
+        - `resource`: the name of the resource, which is used to name its cache file.
+        - `url`: the URL to fetch the resource from.
+        - `revalidate`: if `True`, check the resource hasn't changed upstream even if the cached copy hasn't expired.
+        - `transport`: the transport to send requests with. Defaults to the shared transport.
+        """
+        return json.loads("".join(self.iter_text(resource, url, revalidate, transport)))
+
+    def iter_text(self, resource, url, revalidate=False, transport=None, chunk_size=1 << 16):
+        """
+        Returns the JSON text of `resource` in chunks, using the cached copy where possible.
+
+        When the resource is downloaded, each chunk is yielded as it arrives and the cached copy is only replaced once
+        every chunk has been read. Takes the same inputs as `fetch`, and the size of the chunks to read.
+
+        If the request fails, or the response is anything other than the resource or "not modified", the cached copy is
+        used even if it has expired, and the failure is counted in the `cache.stale` metric and printed to stderr. With
+        no cached copy, the error is raised, as a `requests.HTTPError` for an unexpected response.
+        """
+        meta = self.load_meta(resource)
+        if not revalidate and self.is_fresh(resource, url, meta):
+            metrics.count("cache.hits")
+            return self._read(resource, chunk_size)
+
+        if transport is None:
+            transport = get_transport()
+
+        # Only ask the server to validate a cached copy of the same URL
+        headers = dict()
+        if meta is not None and meta["url"] == url:
+            if meta["etag"] is not None:
+                headers["If-None-Match"] = meta["etag"]
+            if meta["last_modified"] is not None:
+                headers["If-Modified-Since"] = meta["last_modified"]
+
+        # A cached copy of the same URL is served, although it has expired, if the resource can't be fetched
+        stale = meta is not None and meta["url"] in (None, url)
+        try:
+            with metrics.timer("cache.request"):
+                r = transport.get(url, headers=headers, stream=True)
+        except OSError as e:
+            # Connection errors and timeouts, once the transport has run out of retries
+            if not stale:
+                raise
+            return self._read_stale(resource, chunk_size, e)
+
+        if r.status_code == 304 and headers:
+            # Not modified: keep the cached copy and restart its TTL
+            metrics.count("cache.not_modified")
+            r.close()
+            meta["fetched"] = time.time()
+            self._dump_meta(resource, meta)
+            return self._read(resource, chunk_size)
+
+        if r.status_code != 200:
+            # Anything else isn't the resource, so it is never decoded or cached
+            r.close()
+            error = _status_error(r)
+            if not stale:
+                raise error
+            return self._read_stale(resource, chunk_size, error)
+
+        metrics.count("cache.misses")
+        return self._download(resource, url, r, chunk_size)
+
+    def _read_stale(self, resource, chunk_size, error):
+        metrics.count("cache.stale")
+        print("Using the expired cached copy of {}, as it couldn't be fetched: {}".format(resource, error),
+              file=sys.stderr)
+        return self._read(resource, chunk_size)
+
+    def _read(self, resource, chunk_size):
+        with open(self.path(resource), "r", encoding="utf-8") as f:
+            yield from iter(lambda: f.read(chunk_size), "")
+
+    def _download(self, resource, url, r, chunk_size):
+        decoder = codecs.getincrementaldecoder("utf-8")()
+        os.makedirs(self.directory, exist_ok=True)
+        path = self.path(resource)
+        tmp_path = self._tmp_path(path)
+        complete = False
+        try:
+            # The response is saved to a temporary file as it is read, so that a partial download is never used
+            with open(tmp_path, "wb") as f:
+                for chunk in r.iter_content(chunk_size):
+                    f.write(chunk)
+                    metrics.count("cache.bytes_downloaded", len(chunk))
+                    yield decoder.decode(chunk)
+                yield decoder.decode(b"", final=True)
+            os.replace(tmp_path, path)
+            complete = True
+            self._dump_meta(resource, {
+                "url": url,
+                "fetched": time.time(),
+                "etag": r.headers.get("ETag"),
+                "last_modified": r.headers.get("Last-Modified"),
+            })
+        finally:
+            r.close()
+            if not complete and os.path.exists(tmp_path):
+                os.remove(tmp_path)
+
+    def _dump_meta(self, resource, meta):
+        self._write(self.path(resource) + ".meta", meta)
+
+    def _write(self, path, data):
+        os.makedirs(self.directory, exist_ok=True)
+        # Write to a temporary file first so that a partially written file is never read
+        tmp_path = self._tmp_path(path)
+        with open(tmp_path, "w") as f:
+            json.dump(data, f)
+        os.replace(tmp_path, path)
+
+    def _tmp_path(self, path):
+        return "{}.{}.{}.tmp".format(path, os.getpid(), threading.get_ident())
+
+
+def _status_error(r):
+    # requests is already imported, as it sent the response
+    import requests
+    if r.status_code >= 400:
+        message = "{} {} for {}".format(r.status_code, r.reason, r.url)
+    else:
+        message = "unexpected {} {} response for {}".format(r.status_code, r.reason, r.url)
+    return requests.HTTPError(message, response=r)
@@ -0,0 +1,149 @@
+"""
+This module contains a catalog of monitoring stations which answers grouping queries, such as the stations on each
+river, from indexes which are built once and reused.
+
+The functions in `geo` regroup the station list on every call. When many grouping queries are made on the same station
+list, such as between refreshes of a long-running service, a `StationCatalog` builds each index the first time it is
+needed and keeps it until the station list changes.
+"""
+
+import heapq
+from collections.abc import Sequence
+from operator import attrgetter
+
+
+def group_stations(stations, key):
+    """
+    Groups stations by the value of `key(station)`.
+
+    # Inputs
+    - `stations`: an iterable of `MonitoringStation`s.
+    - `key`: a function of a station returning the value to group it by.
+
+    # Returns
+    A `dict` mapping each value to a `list` of the stations with that value, in the order they appear in `stations`.
+    The values are in the order they first appear.
+    """
+    groups = dict()
+    for station in stations:
+        value = key(station)
+        group = groups.get(value)
+        if group is None:
+            groups[value] = [station]
+        else:
+            group.append(station)
+    return groups
+
+
+def top_counts(counts, N):
+    """
+    Returns the `N` items with the greatest counts, and any further items with the same count as the `N`th.
+
+    # Inputs
+    - `counts`: a `dict` mapping items to their counts.
+    - `N`: the number of items to return, not counting ties.
+
+    # Returns
+    A `list` of `(item, count)` tuples, sorted by count from greatest to least. Items with the same count are in the
+    order of `counts`.
+    """
+    if N < 1 or not counts:
+        return []
+
+    # Items are ranked by count, and then by their position in `counts`, which gives the same order as a stable sort
+    items = list(counts.items())
+    ranked = heapq.nsmallest(N, range(len(items)), key=lambda i: (-items[i][1], i))
+    top = [items[i] for i in ranked]
+
+    # Add the items tied with the last one which didn't fit, in their order in `counts`
+    if len(items) > N:
+        chosen = set(ranked)
+        last = top[-1][1]
+        top.extend(item for (i, item) in enumerate(items) if item[1] == last and i not in chosen)
+    return top
+
+
+class StationCatalog(Sequence):
+    """
+    A list of monitoring stations with memoized river and town indexes.
+
+    A catalog can be used anywhere a `list` of stations is expected. The indexes are built the first time they are used
+    and are kept until the catalog is changed with `update`, or until `invalidate` is called. A change in the length of
+    the station list is detected automatically, but changes which keep its length the same, such as replacing a
+    station or changing a station's river, must be followed by a call to `invalidate`.
+
+    The `dict`s and `list`s returned by the catalog are shared between calls, so they must not be modified.
+
+    # Inputs
+    - `stations`: a `list` of `MonitoringStation`s.
+    """
+
+    def __init__(self, stations):
+        self.update(stations)
+
+    def update(self, stations):
+        """
+        Replaces the station list, such as after it has been refreshed, and clears the indexes.
+        """
+        self.stations = stations
+        self.invalidate()
+
+    def invalidate(self):
+        """
+        Clears the indexes, so that they are rebuilt from the station list the next time they are used.
+        """
+        self._length = len(self.stations)
+        self._indexes = dict()
+
+    def _index(self, name, build):
+        # Returns the index `name`, building it first if needed
+        if len(self.stations) != self._length:
+            self.invalidate()
+        index = self._indexes.get(name)
+        if index is None:
+            index = self._indexes[name] = build()
+        return index
+
+    def __len__(self):
+        return len(self.stations)
+
+    def __getitem__(self, i):
+        return self.stations[i]
+
+    def __iter__(self):
+        return iter(self.stations)
+
+    def stations_by_river(self):
+        """
+        Returns a `dict` mapping each river to the `list` of stations on it, as `geo.stations_by_river` does.
+        """
+        return self._index("river", lambda: group_stations(self.stations, attrgetter("river")))
+
+    def stations_by_town(self):
+        """
+        Returns a `dict` mapping each town to the `list` of stations in it. Stations with no town are under `None`.
+        """
+        return self._index("town", lambda: group_stations(self.stations, attrgetter("town")))
+
+    def rivers_with_station(self):
+        """
+        Returns a `list` of the rivers on which a station is located, in the order they first appear.
+        """
+        return self._index("rivers", lambda: list(self.stations_by_river()))
+
+    def river_station_counts(self):
+        """
+        Returns a `dict` mapping each river to the number of stations on it.
+        """
+        return self._index("river_counts",
+                           lambda: {river: len(group) for (river, group) in self.stations_by_river().items()})
+
+    def rivers_station_number(self, N):
+        """
+        Returns the `N` rivers with the greatest number of stations, as `geo.rivers_station_number` does.
+
+        # Returns
+        A `list` of `N` `(river, number of stations)` tuples, sorted by the number of stations. If there are more rivers
+        with the same number of stations as the `N`th, they are also included.
+        """
+        return top_counts(self.river_station_counts(), N)
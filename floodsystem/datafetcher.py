@@ -8,16 +8,47 @@ latest time history level data
 
 import datetime
 import json
-import os
 
-import dateutil.parser
-import requests
+import numpy as np
 
+from . import metrics
+from .cache import CachePolicy
+from .jsonstream import iter_items
+from .series import LevelSeries
+from .transport import get_transport
 
-def fetch(url):
-    """Fetch data from url and return fetched JSON object"""
-    r = requests.get(url)
-    data = r.json()
+
+# URL for retrieving data for active stations with river level
+# monitoring (see
+# http://environment.data.gov.uk/flood-monitoring/doc/reference)
+STATION_DATA_URL = "http://environment.data.gov.uk/flood-monitoring/id/stations?status=Active&parameter=level&qualifier=Stage&_view=full"  # noqa
+
+# URL for retrieving latest levels from all measures
+LEVEL_DATA_URL = "http://environment.data.gov.uk/flood-monitoring/id/measures?parameter=level&qualifier=Stage&qualifier=level"  # noqa
+
+# URL for retrieving the readings of all level measures at once
+READINGS_DATA_URL = "http://environment.data.gov.uk/flood-monitoring/data/readings?parameter=level"  # noqa
+
+# Number of readings requested in each page of readings, for a single
+# measure or for all measures
+READINGS_PAGE_SIZE = 10000
+
+# Cache policy for the station and level data
+cache_policy = CachePolicy()
+
+
+def fetch(url, transport=None):
+    """Fetch data from url and return fetched JSON object.
+
+    Requests are sent with the shared transport (see
+    ``floodsystem.transport``) unless another transport is given, so
+    connections to the Environment Agency are reused between calls.
+
+    """
+    if transport is None:
+        transport = get_transport()
+    with metrics.timer('datafetcher.fetch'):
+        data = transport.get_json(url)
     return data
 
 
@@ -44,78 +75,124 @@ def fetch_station_data(use_cache=True):
     Fetched data is dumped to a cache file so on subsequent call it can
     optionally be retrieved from the cache file. This is faster than
     retrieval over the Internet and avoids excessive calls to the
-    Environment Agency service.
+    Environment Agency service. The cache file is used until it is
+    older than its time-to-live in ``cache_policy``, after which it is
+    revalidated with a conditional request and only downloaded again
+    if the station data has changed.
 
     Args:
-        use_cache: If ``True``, use file cache. Otherwise fetch data
-            over the Internet.
+        use_cache: If ``True``, use file cache. Otherwise always check
+            for changes over the Internet.
 
     Returns:
         River level data.
     """
 
-    # URL for retrieving data for active stations with river level
-    # monitoring (see
-    # http://environment.data.gov.uk/flood-monitoring/doc/reference)
-    url = "http://environment.data.gov.uk/flood-monitoring/id/stations?status=Active&parameter=level&qualifier=Stage&_view=full"  # noqa
-
-    sub_dir = 'cache'
-    try:
-        os.makedirs(sub_dir)
-    except FileExistsError:
-        pass
-    cache_file = os.path.join(sub_dir, 'station_data.json')
-
-    # Attempt to load station data from file, otherwise fetch over
-    # Internet
-    if use_cache:
-        try:
-            # Attempt to load from file
-            data = load(cache_file)
-        except FileNotFoundError:
-            # If load from file fails, fetch and dump to file
-            data = fetch(url)
-            dump(data, cache_file)
-    else:
-        # Fetch and dump to file
-        data = fetch(url)
-        dump(data, cache_file)
+    return cache_policy.fetch('station_data', STATION_DATA_URL,
+                              revalidate=not use_cache)
 
-    return data
+
+def iter_station_data(use_cache=True):
+    """Fetch data for all active river level monitoring stations, as
+    for ``fetch_station_data``, but return an iterator which decodes
+    the station items one at a time as the data is read from the cache
+    file or the Internet, rather than the whole JSON object.
+
+    """
+    return iter_items(cache_policy.iter_text(
+        'station_data', STATION_DATA_URL, revalidate=not use_cache))
 
 
 def fetch_latest_water_level_data(use_cache=False):
-    """Fetch latest levels from all 'measures'. Returns JSON object"""
+    """Fetch latest levels from all 'measures'. Returns JSON object.
 
-    # URL for retrieving data
-    url = "http://environment.data.gov.uk/flood-monitoring/id/measures?parameter=level&qualifier=Stage&qualifier=level"  # noqa
+    If ``use_cache`` is ``True``, the cached levels are used until they
+    are older than their time-to-live in ``cache_policy``. Otherwise
+    they are revalidated with a conditional request, so the levels are
+    only downloaded again if they have changed.
 
-    sub_dir = 'cache'
-    try:
-        os.makedirs(sub_dir)
-    except FileExistsError:
-        pass
-    cache_file = os.path.join(sub_dir, 'level_data.json')
+    """
 
-    # Attempt to load level data from file, otherwise fetch over
-    # Internet
-    if use_cache:
-        try:
-            # Attempt to load from file
-            data = load(cache_file)
-        except FileNotFoundError:
-            data = fetch(url)
-            dump(data, cache_file)
-    else:
-        data = fetch(url)
-        dump(data, cache_file)
+    return cache_policy.fetch('level_data', LEVEL_DATA_URL,
+                              revalidate=not use_cache)
 
-    return data
 
+def fetch_measure_levels(measure_id, dt, store=None, as_series=False):
+    """Fetch measure levels from latest reading and going back a period
+    dt. Return list of dates and a list of values, in date order.
+
+    The readings are fetched in pages of ``READINGS_PAGE_SIZE`` and
+    joined together.
+
+    If a ``ReadingStore`` is given, readings already in the store are
+    not fetched again: only readings newer than the latest stored one
+    are fetched and appended to the store, and the history is read
+    back from the store.
 
-def fetch_measure_levels(measure_id, dt):
+    If ``as_series`` is ``True``, a ``LevelSeries`` of NumPy arrays is
+    returned instead of lists, which unpacks to ``(times, levels)``
+    in the same way.
+
+    """
+
+    # Current time (UTC)
+    now = datetime.datetime.utcnow()
+
+    # Start time for data
+    start = now - dt
+
+    if store is None:
+        return _fetch_readings(_readings_url(measure_id, start), as_series)
+
+    start = start.replace(tzinfo=datetime.timezone.utc)
+    with store.lock(measure_id):
+        covered = store.covered_since(measure_id)
+        last = store.last_date(measure_id)
+        if covered is None or covered > start or last is None or last < start:
+            # The store doesn't hold the whole period, or would be
+            # brought up to date with more readings than the period
+            # holds, so fetch the whole period instead
+            metrics.count('readingstore.full_fetches')
+            dates, levels = _fetch_readings(_readings_url(measure_id, start))
+            store.replace(measure_id, start, dates, levels)
+        else:
+            # Only fetch readings from the latest stored one onwards
+            metrics.count('readingstore.incremental_fetches')
+            dates, levels = _fetch_readings(_readings_url(measure_id, last))
+            store.append(measure_id, dates, levels, since=start)
+        dates, levels = store.read(measure_id, since=start)
+
+    if as_series:
+        return LevelSeries.from_lists(dates, levels)
+    return dates, levels
+
+
+def iter_measure_levels(measure_id, dt, as_series=False, page_size=None):
     """Fetch measure levels from latest reading and going back a period
-    dt. Return list of dates and a list of values.
+    dt, as ``fetch_measure_levels`` does, but a window of days at a
+    time, and return an iterator which yields the readings of each
+    window as a list of dates and a list of values, or a
+    ``LevelSeries`` if ``as_series`` is ``True``, as soon as they
+    arrive.
+
+    Windows are yielded oldest first, and the readings of each window
+    are in date order, so the readings are yielded in date order
+    overall. Each window spans as many whole days (UTC) as are expected
+    to hold about ``page_size`` readings, which defaults to
+    ``READINGS_PAGE_SIZE``, judging by the readings of the window
+    before. So the number of requests grows with the number of
+    readings, and only about a page of readings is held at a time. Long
+    histories can be processed incrementally with bounded memory, for
+    example by adding each window to a ``SlidingPolyfit``:
+
+        for dates, levels in iter_measure_levels(measure_id, dt):
+            fit.extend(dates, levels)
+
+    Each window is requested with the ``startdate`` and ``enddate``
+    parameters, and paged with ``_limit`` and ``_offset`` if it holds
+    more readings than expected. A reading seen twice, which happens
+    when a new reading shifts the pages while paging, is only yielded
+    once. Windows with no readings are not yielded.
 
     """
 
@@ -125,22 +202,218 @@ def fetch_measure_levels(measure_id, dt):
     # Start time for data
     start = now - dt
 
-    # Construct URL for fetching data
-    url_base = measure_id
-    url_options = "/readings/?_sorted&since=" + start.isoformat() + 'Z'
-    url = url_base + url_options
+    return _iter_windowed_readings(measure_id, start, now.date(), as_series,
+                                   page_size)
+
+
+# Number of readings expected each day, which are every 15 minutes, to
+# size the first window of readings by
+_READINGS_PER_DAY = 96
+
+
+def _iter_windowed_readings(measure_id, start, last_day, as_series=False,
+                            page_size=None):
+    """Yield the readings of a measure from time start (naive UTC)
+    onwards, up to last_day, a window of days at a time"""
+
+    if page_size is None:
+        page_size = READINGS_PAGE_SIZE
+
+    parse = _parse_readings_series if as_series else _parse_readings
+    per_day = _READINGS_PER_DAY
+    day = start.date()
+    while day <= last_day:
+        days = max(1, int(page_size // per_day))
+        end = min(day + datetime.timedelta(days=days - 1), last_day)
+        url = (measure_id + "/readings/?_sorted&startdate=" + day.isoformat()
+               + "&enddate=" + end.isoformat())
+        items = [item for page in _iter_reading_items(url, page_size)
+                 for item in page]
+        if items:
+            # Size the next window by how many readings this one held
+            per_day = len(items) / ((end - day).days + 1)
+        if day == start.date() and items:
+            # The first day is only wanted from the start time
+            times = parse_datetime64([item['dateTime'] for item in items])
+            items = [item for (item, keep) in
+                     zip(items, times >= np.datetime64(start, 'us'))
+                     if keep]
+        if items:
+            yield parse({'items': items})
+        day = end + datetime.timedelta(days=1)
+
+
+def _iter_reading_items(url, page_size=None):
+    """Yield the pages of reading items from a readings URL, without
+    the readings repeated from the page before"""
+
+    if page_size is None:
+        page_size = READINGS_PAGE_SIZE
+
+    seen = set()
+    offset = 0
+    while True:
+        items = fetch('{}&_limit={}&_offset={}'.format(url, page_size,
+                                                       offset))['items']
+        metrics.count('datafetcher.reading_pages')
+        full = len(items) == page_size
+
+        # Readings can only be repeated from the page before
+        times = {item['dateTime'] for item in items}
+        if seen:
+            items = [item for item in items if item['dateTime'] not in seen]
+        seen = times
+
+        if items:
+            yield items
+        if not full:
+            return
+        offset += page_size
+
+
+def _fetch_readings(url, as_series=False):
+    """Fetch every page of readings from a readings URL, and return
+    them in date order as a list of dates and a list of levels, or as
+    a LevelSeries"""
+
+    items = [item for page in _iter_reading_items(url) for item in page]
+    if as_series:
+        return _parse_readings_series({'items': items})
+    return _parse_readings({'items': items})
+
+
+def _readings_url(measure_id, since):
+    """Return URL for the readings of a measure from time since
+    (naive UTC or timezone aware) onwards"""
+    if since.tzinfo is not None:
+        since = since.astimezone(datetime.timezone.utc).replace(tzinfo=None)
+    return measure_id + "/readings/?_sorted&since=" + since.isoformat() + 'Z'
+
+
+def _parse_readings(data):
+    """Extract list of dates and list of levels, in date order, from
+    readings JSON object"""
+
+    with metrics.timer('datafetcher.parse_readings'):
+        items = data['items']
+
+        # Convert date-time strings to datetime objects
+        dates = parse_datetimes([measure['dateTime'] for measure in items])
+        levels = _reading_levels(items)
+
+        # Readings are served newest first, and are returned oldest first
+        if any(a > b for a, b in zip(dates, dates[1:])):
+            order = sorted(range(len(dates)), key=dates.__getitem__)
+            dates = [dates[i] for i in order]
+            levels = [levels[i] for i in order]
+
+        return dates, levels
+
+
+def _parse_readings_series(data):
+    """Extract LevelSeries, in date order, from readings JSON object"""
+
+    with metrics.timer('datafetcher.parse_readings'):
+        items = data['items']
+        times = parse_datetime64([measure['dateTime'] for measure in items])
+        levels = np.array([np.nan if level is None else level
+                           for level in _reading_levels(items)], dtype=float)
+        if (times[1:] < times[:-1]).any():
+            order = np.argsort(times, kind='stable')
+            times, levels = times[order], levels[order]
+        return LevelSeries(times, levels)
+
+
+def fetch_all_measure_levels(dt, measure_ids=None, as_series=False,
+                             page_size=None):
+    """Fetch the levels of every level measure from the latest reading
+    and going back a period dt, with a few paged requests for the
+    readings of all measures at once rather than one request for each
+    measure. Return a dict mapping each measure id to its list of dates
+    and list of values, as ``fetch_measure_levels`` returns for a
+    single measure, or to its ``LevelSeries`` if ``as_series`` is
+    ``True``.
+
+    If ``measure_ids`` is given, only those measures are returned, and
+    measures with no readings in the period have empty histories.
+
+    Each measure's readings are returned in date order. A reading seen
+    twice, which happens when new readings arrive while paging, is only
+    returned once.
+
+    """
+
+    if page_size is None:
+        page_size = READINGS_PAGE_SIZE
 
-    # Fetch data
-    data = fetch(url)
+    # Current time (UTC)
+    now = datetime.datetime.utcnow()
 
-    # Extract dates and levels
-    dates, levels = [], []
-    for measure in data['items']:
-        # Convert date-time string to a datetime object
-        d = dateutil.parser.parse(measure['dateTime'])
+    # Start time for data
+    start = now - dt
 
-        # Append data
-        dates.append(d)
+    url = (READINGS_DATA_URL + ('&' if '?' in READINGS_DATA_URL else '?')
+           + '_sorted&since=' + start.isoformat() + 'Z')
+
+    items = []
+    offset = 0
+    while True:
+        page = fetch('{}&_limit={}&_offset={}'.format(url, page_size,
+                                                       offset))['items']
+        items.extend(page)
+        metrics.count('datafetcher.bulk_pages')
+        if len(page) < page_size:
+            break
+        offset += page_size
+
+    with metrics.timer('datafetcher.parse_readings'):
+        series = _demultiplex_readings(items, measure_ids)
+
+    if as_series:
+        return series
+    return {measure_id: s.to_lists() for measure_id, s in series.items()}
+
+
+def _demultiplex_readings(items, measure_ids=None):
+    """Split reading items of many measures into a dict mapping each
+    measure id to its LevelSeries"""
+
+    # Number the measures, in the order they are given or first seen
+    codes = dict()
+    if measure_ids is not None:
+        for measure_id in measure_ids:
+            codes.setdefault(measure_id, len(codes))
+        items = [item for item in items if item.get('measure') in codes]
+    measure_codes = np.array(
+        [codes.setdefault(item['measure'], len(codes)) for item in items],
+        dtype=np.int64)
+
+    times = parse_datetime64([item['dateTime'] for item in items])
+    levels = np.array([np.nan if level is None else level
+                       for level in _reading_levels(items)], dtype=float)
+
+    # Sort by measure and then by date, and drop repeated readings
+    order = np.lexsort((times, measure_codes))
+    measure_codes, times, levels = (measure_codes[order], times[order],
+                                    levels[order])
+    keep = np.ones(len(order), dtype=bool)
+    keep[1:] = ((measure_codes[1:] != measure_codes[:-1])
+                | (times[1:] != times[:-1]))
+    measure_codes, times, levels = (measure_codes[keep], times[keep],
+                                    levels[keep])
+
+    splits = np.cumsum(np.bincount(measure_codes,
+                                   minlength=len(codes)))[:-1]
+    return {measure_id: LevelSeries(t, l) for (measure_id, t, l) in
+            zip(codes, np.split(times, splits), np.split(levels, splits))}
+
+
+def _reading_levels(items):
+    """Extract list of levels from reading items, with None for
+    missing levels"""
+
+    levels = []
+    for measure in items:
         try:
             if type(measure['value']) == float:
                 levels.append(measure['value'])
@@ -152,4 +425,98 @@ def fetch_measure_levels(measure_id, dt):
         # Modified to account for when water level are given as a range of water levels (lists)
         # And when no data is available
 
-    return dates, levels
+    return levels
+
+
+def parse_datetimes(strings):
+    """Convert a list of date-time strings to a list of timezone aware
+    datetime objects.
+
+    Strings in the Environment Agency's fixed ISO 8601 format
+    (``YYYY-MM-DDTHH:MM:SSZ``) are parsed with the fast built-in ISO
+    parser. Anything else is parsed with ``dateutil``.
+
+    """
+    dates = []
+    for s in strings:
+        try:
+            if len(s) != 20 or s[19] != 'Z':
+                raise ValueError
+            # The built-in parser only accepts 'Z' from Python 3.11
+            dates.append(datetime.datetime.fromisoformat(s[:19] + '+00:00'))
+        except ValueError:
+            dates.append(_parse_any_datetime(s))
+    return dates
+
+
+def _parse_any_datetime(s):
+    """Parse a date-time string in any format with ``dateutil``, which
+    is only imported when it is first needed"""
+    import dateutil.parser
+    return dateutil.parser.parse(s)
+
+
+def parse_datetime64(strings):
+    """Convert a list of date-time strings to a numpy ``datetime64[s]``
+    array of UTC times.
+
+    The whole batch is parsed at once with array operations when every
+    string is in the Environment Agency's fixed ISO 8601 format
+    (``YYYY-MM-DDTHH:MM:SSZ``). Strings which are not are parsed one at
+    a time with ``dateutil``, and are assumed to be UTC if they have
+    no time zone.
+
+    """
+    n = len(strings)
+    times = np.zeros(n, dtype='datetime64[s]')
+    fast = np.zeros(n, dtype=bool)
+
+    # Parse the strings with the expected length as fixed-width fields
+    lengths = np.fromiter(map(len, strings), dtype=np.int64, count=n)
+    fixed = np.flatnonzero(lengths == 20)
+    if len(fixed):
+        if len(fixed) < n:
+            strings_fixed = [strings[i] for i in fixed]
+        else:
+            strings_fixed = strings
+        try:
+            chars = np.frombuffer(''.join(strings_fixed).encode('ascii'),
+                                  dtype=np.uint8).reshape(-1, 20)
+        except UnicodeEncodeError:
+            chars = np.zeros((len(fixed), 20), dtype=np.uint8)
+        digits = chars.astype(np.int64) - ord('0')
+        valid = ((chars[:, _SEPARATOR_POSITIONS] == _SEPARATORS).all(axis=1)
+                 & ((digits[:, _DIGIT_POSITIONS] >= 0) & (digits[:, _DIGIT_POSITIONS] <= 9)).all(axis=1))
+
+        def field(start, end):
+            value = np.zeros(len(fixed), dtype=np.int64)
+            for position in range(start, end):
+                value = 10 * value + digits[:, position]
+            return value
+
+        year, month, day = field(0, 4), field(5, 7), field(8, 10)
+        hour, minute, second = field(11, 13), field(14, 16), field(17, 19)
+        valid &= (month >= 1) & (month <= 12) & (day >= 1) & (hour < 24) & (minute < 60) & (second < 60)
+
+        months = ((year - 1970) * 12 + np.clip(month, 1, 12) - 1).astype('datetime64[M]')
+        days = months.astype('datetime64[D]') + (day - 1)
+        # Days past the end of the month would roll over into the next month
+        valid &= days.astype('datetime64[M]') == months
+
+        times[fixed] = days.astype('datetime64[s]') + (3600 * hour + 60 * minute + second)
+        fast[fixed] = valid
+
+    # Fall back to dateutil for everything else
+    for i in np.flatnonzero(~fast):
+        d = _parse_any_datetime(strings[i])
+        if d.tzinfo is not None:
+            d = d.astimezone(datetime.timezone.utc).replace(tzinfo=None)
+        times[i] = np.datetime64(d, 's')
+
+    return times
+
+
+# Positions and values of the separators and digits in 'YYYY-MM-DDTHH:MM:SSZ'
+_SEPARATOR_POSITIONS = [4, 7, 10, 13, 16, 19]
+_SEPARATORS = np.frombuffer(b'--T::Z', dtype=np.uint8)
+_DIGIT_POSITIONS = [0, 1, 2, 3, 5, 6, 8, 9, 11, 12, 14, 15, 17, 18]
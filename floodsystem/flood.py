@@ -5,9 +5,46 @@ This module contains functions related to predicting the risk of flooding at mon
 import datetime
 import numpy as np
 import sys
-from matplotlib.dates import date2num
-from floodsystem.datafetcher import fetch_measure_levels
-from floodsystem.analysis import polyfit
+from concurrent.futures import ProcessPoolExecutor, ThreadPoolExecutor
+from floodsystem.datafetcher import fetch_all_measure_levels, fetch_measure_levels
+from floodsystem.analysis import polyfit, polyfit_many, fill_missing_levels
+from floodsystem.stationtable import StationTable
+from floodsystem.series import day_numbers
+from floodsystem import metrics
+
+
+def relative_water_levels(stations):
+    """
+    Computes the latest relative water level of every station at once.
+
+    # Inputs
+    - `stations`: a `list` of `MonitoringStation`s, or a `StationTable`.
+
+    # Returns
+    A `float64` array of each station's latest water level as a fraction of its typical range,
+    with NaN where the typical range is inconsistent or there is no latest level.
+    """
+    if isinstance(stations, StationTable):
+        return stations.relative_water_levels()
+
+    n = len(stations)
+    typical_range = np.array([s.typical_range if s.typical_range != None else (np.nan, np.nan) for s in stations],
+                             dtype=float).reshape(n, 2)
+    latest_level = np.array([s.latest_level if s.latest_level != None else np.nan for s in stations], dtype=float)
+    low, high = typical_range[:, 0], typical_range[:, 1]
+
+    with np.errstate(divide="ignore", invalid="ignore"):
+        relative = (latest_level - low) / (high - low)
+    # Comparisons with NaN are false, so stations with no typical range are inconsistent
+    return np.where(high >= low, relative, np.nan)
+
+
+def _descending(indices, values):
+    """
+    Sorts `indices` in descending order of `values[indices]`, keeping equal values in the order of their indices,
+    which matches a stable `sorted(..., reverse=True)`.
+    """
+    return indices[np.lexsort((indices, -values[indices]))]
 
 
 def stations_level_over_threshold(stations, tol):
@@ -17,20 +54,22 @@ def stations_level_over_threshold(stations, tol):
     The returned list is sorted by the relative level in descending order.
 
     # Inputs
-    - `stations`: a `list` of `MonitoringStation`s to sort.
+    - `stations`: a `list` of `MonitoringStation`s to sort, or a `StationTable`.
     - `tol`: the minimum relative water level.
 
     """
-    over_threshold = list()
-    # Getting a list of station name and latest relative water level over tol
-    for station in stations:
-        a = station.name
-        b = station.relative_water_level()
-        if b != None and b > tol and station.typical_range_consistent():
-            over_threshold += [(a, b)]
-    
-    # Sorting the list in descending order of relative level
-    return sorted(over_threshold, key = lambda x: x[1], reverse = True)
+    levels = relative_water_levels(stations)
+
+    # Getting the stations with a latest relative water level over tol (NaN is never over tol)
+    with np.errstate(invalid="ignore"):
+        over_threshold = np.flatnonzero(levels > tol)
+
+    # Sorting in descending order of relative level
+    order = _descending(over_threshold, levels).tolist()
+    levels = levels.tolist()
+    if isinstance(stations, StationTable):
+        return [(stations.names[i], levels[i]) for i in order]
+    return [(stations[i].name, levels[i]) for i in order]
 
 
 def stations_highest_rel_level(stations, N):
@@ -41,13 +80,31 @@ def stations_highest_rel_level(stations, N):
     even if these water levels are negative.
 
     # Inputs
-    - `stations`: a `list` of `MonitoringStation`s to sort.
+    - `stations`: a `list` of `MonitoringStation`s to sort, or a `StationTable`.
     - `N`: the maximum number of stations to return.
 
     # Returns
     A `list` of `MonitoringStation`s sorted in descending order by relative water level.
     """
-    return sorted(stations, key = lambda s: s.relative_water_level() if s.relative_water_level() != None else float("-inf"), reverse=True)[:N]
+    levels = relative_water_levels(stations)
+    levels[np.isnan(levels)] = -np.inf
+
+    # Same meaning of `N` as slicing the sorted list with `[:N]`
+    n = len(levels)
+    N = len(range(n)[:N])
+    if N == 0:
+        return []
+
+    # Only the stations at least as high as the Nth highest need sorting; ties with it are kept so the order is unchanged
+    candidates = np.arange(n)
+    if N < n:
+        nth_highest = np.partition(levels, n - N)[n - N]
+        candidates = np.flatnonzero(levels >= nth_highest)
+
+    highest = _descending(candidates, levels)[:N].tolist()
+    if isinstance(stations, StationTable):
+        return stations.to_stations(highest)
+    return [stations[i] for i in highest]
 
 def get_risk_level(dates, levels, p):
     """
@@ -57,7 +114,8 @@ def get_risk_level(dates, levels, p):
     even if these water levels are negative.
 
     # Inputs
-    - `dates`: a `list` of the dates of the measurements.
+    - `dates`: a `list` or `datetime64` array of the dates of the measurements, oldest first,
+      so that the last is the latest.
     - `levels`: the water level measurements.
     - `p`: the degree of the polynomial used internally to fit to the data.
 
@@ -67,13 +125,142 @@ def get_risk_level(dates, levels, p):
     # Create prediction polynomial
     polynomial, offset = polyfit(dates, levels, p)
 
+    return assess_risk(polynomial, day_numbers(dates)[-1] - offset, fill_missing_levels(levels)[-1])
+
+
+def get_risk_levels(histories, p, processes=None):
+    """
+    Returns the assessed risk of many stations given their water level histories, fitting all of the histories at once.
+
+    # Inputs
+    - `histories`: a `list` of `(dates, levels)` pairs or `LevelSeries`, one for each station.
+    - `p`: the degree of the polynomial used internally to fit to the data.
+    - `processes`: the number of processes to share the fitting between, or `None` to fit in this process.
+      The result is the same either way.
+
+    # Returns
+    A `list` of the numerical assessments of the risk level at each station, the same as `get_risk_level` gives.
+    Stations with no level history are given a moderate risk of 2.
+    """
+    if processes is not None:
+        return _score_in_processes(histories, None, p, processes)[0].tolist()
+
+    fitted = [i for (i, (dates, levels)) in enumerate(histories) if len(dates) > 0]
+    fits = polyfit_many([histories[i][0] for i in fitted], [histories[i][1] for i in fitted], p)
+
+    risks = [2] * len(histories)
+    for (i, (polynomial, offset)) in zip(fitted, fits):
+        dates, levels = histories[i]
+        risks[i] = assess_risk(polynomial, day_numbers(dates[-1:])[0] - offset, fill_missing_levels(levels)[-1])
+    return risks
+
+
+def get_town_severities(histories, towns, p, processes=None):
+    """
+    Returns the number of stations at each risk level in each town, given the stations' water level histories.
+
+    # Inputs
+    - `histories`: a `list` of `(dates, levels)` pairs or `LevelSeries`, one for each station.
+    - `towns`: a `list` of the town of each station.
+    - `p`: the degree of the polynomial used internally to fit to the data.
+    - `processes`: the number of processes to share the fitting between, or `None` to fit in this process.
+      Each process counts the risk levels of its share of the stations, and the counts are added together.
+
+    # Returns
+    A `dict` mapping each town to a `list` of the number of its stations at risk levels 0 to 3,
+    with the towns in the order they first appear in `towns`.
+    """
+    codes = dict()
+    town_codes = np.array([codes.setdefault(town, len(codes)) for town in towns], dtype=np.int64)
+    if processes is None:
+        risks = np.array(get_risk_levels(histories, p), dtype=np.int64)
+        counts = _count_severities(town_codes, risks, len(codes))
+    else:
+        counts = _score_in_processes(histories, town_codes, p, processes, len(codes))[1]
+    return {town: counts[code].tolist() for (town, code) in codes.items()}
+
+
+# Minimum number of histories sent to a process at once, so that the cost of starting each task is shared out
+_MIN_SHARD_SIZE = 64
+
+
+def _pack_histories(histories):
+    """
+    Packs histories into compact arrays of the day number and level of every measurement, and the number of
+    measurements of each history, which are much cheaper to send to another process than `datetime`s.
+    """
+    lengths = np.array([len(dates) for (dates, levels) in histories], dtype=np.int64)
+    present = [(dates, levels) for (dates, levels) in histories if len(dates) > 0]
+    if not present:
+        return np.zeros(0), np.zeros(0), lengths
+    days = np.concatenate([day_numbers(dates) for (dates, levels) in present])
+    levels = np.concatenate([fill_missing_levels(levels) for (dates, levels) in present])
+    return days, levels, lengths
+
+
+def _score_packed(days, levels, lengths, p, town_codes=None, n_towns=0):
+    """
+    Assesses the risk of each history packed by `_pack_histories`, and counts the risk levels in each town.
+    This is run in the worker processes.
+    """
+    splits = np.cumsum(lengths)[:-1]
+    risks = np.array(get_risk_levels(list(zip(np.split(days, splits), np.split(levels, splits))), p), dtype=np.int64)
+    counts = None if town_codes is None else _count_severities(town_codes, risks, n_towns)
+    return risks, counts
+
+
+def _count_severities(town_codes, risks, n_towns):
+    counts = np.zeros((n_towns, 4), dtype=np.int64)
+    np.add.at(counts, (town_codes, risks), 1)
+    return counts
+
+
+def _score_in_processes(histories, town_codes, p, processes, n_towns=0):
+    """
+    Shares `_score_packed` between a pool of processes, returning the risk of each history and, if `town_codes` is
+    given, the total number of stations at each risk level in each town.
+    """
+    if processes < 1:
+        raise ValueError("processes must be at least 1")
+
+    # Several shards for each process even out the work when histories have different lengths
+    shard_size = max(_MIN_SHARD_SIZE, -(-len(histories) // (4 * processes)))
+    shards = list()
+    for start in range(0, len(histories), shard_size):
+        shard = histories[start:start + shard_size]
+        codes = None if town_codes is None else town_codes[start:start + shard_size]
+        shards.append((*_pack_histories(shard), p, codes, n_towns))
+
+    risks = [np.zeros(0, dtype=np.int64)]
+    counts = np.zeros((n_towns, 4), dtype=np.int64)
+    if shards:
+        with ProcessPoolExecutor(max_workers=min(processes, len(shards))) as executor:
+            for (shard_risks, shard_counts) in executor.map(_score_packed, *zip(*shards)):
+                risks.append(shard_risks)
+                if shard_counts is not None:
+                    counts += shard_counts
+    return np.concatenate(risks), counts
+
+
+def assess_risk(polynomial, latest_date, latest_level):
+    """
+    Returns the assessed risk of a station given the polynomial fitted to its water level history.
+
+    # Inputs
+    - `polynomial`: the polynomial fitted to the station's water level history.
+    - `latest_date`: the date of the latest measurement, offset in the same way as the polynomial.
+    - `latest_level`: the latest water level measurement.
+
+    # Returns
+    A numerical assessment of the risk level at the station.
+    """
     # Prediction of time until water level reaches critical values based on current trend
     coefficients = polynomial.deriv()
-    derivative = np.poly1d(coefficients)(date2num(dates)[-1] - offset)
-    days_to_top = (1.2 - levels[-1]) / derivative
+    derivative = np.poly1d(coefficients)(latest_date)
+    days_to_top = (1.2 - latest_level) / derivative
 
     # There probably already is a flood: severe risk
-    if levels[-1] > 2:
+    if latest_level > 2:
         return 0
     elif derivative > 0:
         # River level is above typical range and rising: severe risk
@@ -99,7 +286,57 @@ def get_risk_level(dates, levels, p):
         else:
             return 3
 
-def get_all_town_risk_levels(stations, n, p, show_loading):
+def fetch_station_histories(stations, n, max_workers=None, store=None, bulk=False):
+    """
+    Fetches the water level history of each station, yielding the histories in the same order as `stations`.
+
+    If `max_workers` is given, the histories are fetched concurrently by a pool of at most `max_workers` threads,
+    so at most `max_workers` requests are in flight at any time. Otherwise they are fetched one at a time.
+
+    If `bulk` is `True`, the readings of every measure are fetched together with a few paged requests
+    (see `fetch_all_measure_levels`), rather than with a request for each station, and `max_workers` is not used.
+
+    # Inputs
+    - `stations`: a `list` of `MonitoringStation`s.
+    - `n`: the number of days to fetch latest measure levels from.
+    - `max_workers`: the maximum number of histories to fetch at once, or `None` to fetch sequentially.
+    - `store`: a `ReadingStore` to keep the fetched readings in, so that only new readings are fetched next time.
+      This can't be used with `bulk`.
+    - `bulk`: whether to fetch the readings of every measure together.
+
+    # Returns
+    An iterator of `LevelSeries`, one for each station in `stations`.
+    """
+    dt = datetime.timedelta(days=n)
+
+    if bulk:
+        if store is not None:
+            raise ValueError("a reading store can't be used with bulk fetching")
+        histories = fetch_all_measure_levels(dt, [station.measure_id for station in stations], as_series=True)
+        yield from (histories[station.measure_id] for station in stations)
+        return
+
+    def fetch(station):
+        return fetch_measure_levels(station.measure_id, dt=dt, store=store, as_series=True)
+
+    if max_workers is None:
+        yield from map(fetch, stations)
+    else:
+        if max_workers < 1:
+            raise ValueError("max_workers must be at least 1")
+        with ThreadPoolExecutor(max_workers=max_workers) as executor:
+            try:
+                # `map` returns the results in submission order,
+                # so the output doesn't depend on which request finishes first
+                yield from executor.map(fetch, stations)
+            except BaseException:
+                # If a fetch fails, or the histories are no longer wanted, don't start the fetches still queued,
+                # so that only those already in flight are waited for
+                executor.shutdown(cancel_futures=True)
+                raise
+
+
+def get_all_town_risk_levels(stations, n, p, show_loading, max_workers=None, store=None, processes=None, bulk=False):
     """
     Returns the assessed risk of all towns given its stations' water level history.
 
@@ -108,29 +345,69 @@ def get_all_town_risk_levels(stations, n, p, show_loading):
     - `n`: the number of days to fetch latest measure levels from.
     - `p`: the degree of the polynomial used internally to fit to the data.
     - `show_loading`: whether to print a loading bar.
+    - `max_workers`: the maximum number of level histories to fetch concurrently.
+      If `None` (the default), the histories are fetched one at a time.
+      The result is the same either way.
+    - `store`: a `ReadingStore` to keep the fetched readings in, so that only new readings are fetched next time.
+    - `processes`: the number of processes to share fitting the histories between, which is worthwhile for long
+      histories of many stations. If `None` (the default), the histories are fitted in this process.
+      The result is the same either way.
+    - `bulk`: whether to fetch the readings of every station together with a few paged requests, rather than with a
+      request for each station. This makes far fewer requests, but can't be used with `store`.
     """
-    total_stations = len(stations)
-    towns = [list(), list(), list(), list()]
     severities = dict()
-    for (i, station) in enumerate(stations):
-        # shows a progress bar. This is printed to stderr so that the progress can be seen even if the output is piped to a file
-        if show_loading:
-            progress = (i / total_stations)
-            print("Calculating risk levels: [" + "="*int(progress * 20) + " "*(20-int(progress * 20)) + f"]   {round(progress * 100, 2)}%   ", end = "\r", file=sys.stderr)
-        if station.town != None:
-            if station.typical_range_consistent() == False:
-                risk = 2
-            else:
-                dates, levels = fetch_measure_levels(station.measure_id, dt=datetime.timedelta(days=n))
-                if len(dates) == 0:
-                    risk = 2
-                else:
-                    risk = get_risk_level(dates, levels, p)
-            if not station.town in severities:
-                severities[station.town] = [0]*4
-            severities[station.town][risk] += 1
-
-    for town, risks in severities.items():
+
+    # Only stations in a town with a consistent typical range need their level history
+    assessed = [station for station in stations if station.town != None and station.typical_range_consistent()]
+    total_stations = len(assessed)
+
+    histories = list()
+    with metrics.timer("flood.town_risk.fetch_histories"):
+        for (i, history) in enumerate(fetch_station_histories(assessed, n, max_workers, store, bulk)):
+            # shows a progress bar. This is printed to stderr so that the progress can be seen even if the output is piped to a file
+            if show_loading:
+                progress = (i / total_stations)
+                print("Calculating risk levels: [" + "="*int(progress * 20) + " "*(20-int(progress * 20)) + f"]   {round(progress * 100, 2)}%   ", end = "\r", file=sys.stderr)
+            histories.append(history)
+    metrics.count("flood.town_risk.stations_fetched", total_stations)
+
+    # Fit all of the histories at once, counting the stations at each risk level in each town
+    with metrics.timer("flood.town_risk.fit"):
+        assessed_severities = get_town_severities(histories, [station.town for station in assessed], p, processes)
+
+    with metrics.timer("flood.town_risk.rollup"):
+        for station in stations:
+            if station.town != None:
+                if not station.town in severities:
+                    severities[station.town] = [0]*4
+                # Stations with an inconsistent typical range can't be assessed, so are given a moderate risk
+                if station.typical_range_consistent() == False:
+                    severities[station.town][2] += 1
+        for town, counts in assessed_severities.items():
+            for risk in range(4):
+                severities[town][risk] += counts[risk]
+
+        towns = get_town_risk_levels(severities)
+
+    # starts a new line so text printed after this function is properly formatted.
+    if show_loading:
+        print("Calculating risk levels: [====================]   100%   \n", file=sys.stderr)
+    return towns
+
+
+def get_town_risk_levels(severities):
+    """
+    Returns the assessed risk of all towns given the number of their stations at each risk level.
+
+    # Inputs
+    - `severities`: a `dict` mapping each town to a `list` of the number of its stations at risk levels 0 to 3.
+
+    # Returns
+    A `list` of 4 `list`s of towns, one for each risk level from severe (0) to low (3).
+    """
+    towns = [list(), list(), list(), list()]
+    for town, counts in severities.items():
+        risks = list(counts)
         current_risk = 3
         if risks[2] > 0:
             current_risk = 2
@@ -142,9 +419,5 @@ def get_all_town_risk_levels(stations, n, p, show_loading):
                 risks[0] += 1
         if risks[0] > 0:
             current_risk = 0
-        towns[current_risk].append(town) 
-
-    # starts a new line so text printed after this function is properly formatted.
-    if show_loading:
-        print("Calculating risk levels: [====================]   100%   \n", file=sys.stderr)
+        towns[current_risk].append(town)
     return towns
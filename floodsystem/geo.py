@@ -7,6 +7,9 @@ geographical data.
 """
 from math import sqrt, cos, sin, asin, pi, radians
 
+import numpy as np
+
+from .catalog import StationCatalog, group_stations, top_counts
 from .utils import sorted_by_key  # noqa
 
 
@@ -21,7 +24,11 @@ def stations_by_distance(stations, p):
     # Returns
     A `list` of `MonitoringStation`s sorted in ascending order by distance from point `p`.
     """
-    return sorted([(station, haversine(station.coord, p)) for station in stations], key = lambda x: x[1])
+    distances = haversine_many(station_coords(stations), p)
+    # A stable sort keeps stations at the same distance in their original order
+    order = np.argsort(distances, kind="stable")
+    distances = distances.tolist()
+    return [(stations[i], distances[i]) for i in order]
 
 
 def stations_within_radius(stations, centre, r):
@@ -33,7 +40,8 @@ def stations_within_radius(stations, centre, r):
     - `centre`: the (latitude, longitude) pair which the monitoring stations must be within the specified radius of.
     - `r`: the maximum distance a monitoring station can be from `centre`
     """
-    return [station for station in stations if haversine(station.coord, centre) <= r]
+    inside = haversine_many(station_coords(stations), centre) <= r
+    return [station for (station, is_inside) in zip(stations, inside) if is_inside]
 
 
 def rivers_with_station(stations):
@@ -41,13 +49,15 @@ def rivers_with_station(stations):
     Gets all of the rivers on which a `list` of `MonitoringStation`s are located.
 
     # Inputs
-    - `stations`: a `list` of `MonitoringStation`s.
+    - `stations`: a `list` of `MonitoringStation`s, or a `StationCatalog`.
 
     # Returns
     A `list` containing the names of all the rivers on which a station in `stations` was located.
 
     A list is returned so that the result can be ordered.
     """
+    if isinstance(stations, StationCatalog):
+        return list(stations.rivers_with_station())
     return list({station.river for station in stations})
 
 
@@ -56,18 +66,14 @@ def stations_by_river(stations):
     Creates a `dict` mapping all of the rivers on which a `MonitoringStation` in `list` is located to the `MonitoringStation`s on that river.
 
     # Inputs
-    - `stations`: a `list` of `MonitoringStation`s.
+    - `stations`: a `list` of `MonitoringStation`s, or a `StationCatalog`, whose grouping is reused rather than rebuilt.
 
     # Returns
     A `dict` mapping river names to `list`s of stations on that river.
     """
-    out = dict()
-    for station in stations:
-        if station.river in out:
-            out[station.river] += [station]
-        else:
-            out[station.river] = [station]
-    return out
+    if isinstance(stations, StationCatalog):
+        return stations.stations_by_river()
+    return group_stations(stations, lambda station: station.river)
 
 
 def haversine(p1, p2):
@@ -84,44 +90,60 @@ def haversine(p1, p2):
     return 12742 * asin(sqrt(sin(0.5 * (p1[0] - p2[0]))**2 + cos(p1[0])*cos(p2[0])*sin(0.5 * (p1[1] - p2[1]))**2))
 
 
+def station_coords(stations):
+    """
+    Collects the coordinates of a `list` of `MonitoringStation`s into an array.
+
+    # Inputs
+    - `stations`: a `list` of `MonitoringStation`s.
+
+    # Returns
+    An `(n, 2)` array of the (latitude, longitude) of each station, which can be reused for many distance queries.
+    """
+    return np.array([station.coord for station in stations], dtype=float).reshape(-1, 2)
+
+
+def haversine_many(coords, points):
+    """
+    Computes the great circle distances from many points to one or more other points using the haversine formula.
+
+    # Inputs
+    - `coords`: an `(n, 2)` array of (latitude, longitude) coordinates, such as the output of `station_coords`.
+    - `points`: a single (latitude, longitude) pair, or an `(m, 2)` array of them.
+
+    # Returns
+    An array of the distances in km from each of `coords` to `points`, with shape `(n,)` for a single point,
+    or `(m, n)` for many points.
+    """
+    coords = np.radians(np.asarray(coords, dtype=float)).reshape(-1, 2)
+    points = np.radians(np.asarray(points, dtype=float))
+    single = points.ndim == 1
+    points = points.reshape(-1, 2)
+
+    lat1, long1 = coords[:, 0], coords[:, 1]
+    lat2, long2 = points[:, 0, np.newaxis], points[:, 1, np.newaxis]
+    h = np.sin(0.5 * (lat1 - lat2))**2 + np.cos(lat1)*np.cos(lat2)*np.sin(0.5 * (long1 - long2))**2
+    # Rounding can push `h` just above 1 for antipodal points
+    distances = 12742 * np.arcsin(np.sqrt(np.minimum(h, 1.)))
+
+    return distances[0] if single else distances
+
+
 def rivers_station_number(stations, N):
     """
     Determining the `N` number of rivers with the greatest number of `MonitoringStation`s.
 
     # Inputs
-    - `stations`: a `list` of `MonitoringStation`s
+    - `stations`: a `list` of `MonitoringStation`s, or a `StationCatalog`
     - `N`: number of rivers with greatest number of `MonitoringStation`s
 
     # Returns
     A list of `N` river name and number of station tuples, sorted by the number of stations.
     If there are more rivers with the same number of stations as the Nth entry, they are also included in the list.
     """
-    # Creating a dict of river name key and stations on river list value
-    river_stations = stations_by_river(stations)
-
-    # Getting a list of river name and number of stations on that river tuple
-    river_n_stations = list()
-    for river, stas in river_stations.items():
-        a = river
-        b = len(stas)
-        river_n_stations += [(a, b)]
-
-    # Sorting the list in descending order of river numbers
-    sorted_river_n_stations = sorted(river_n_stations, key = lambda x: x[1], reverse = True)
-
-    # Checking if any more rivers have the same number of stations as the Nth river
-    counter = 0
-    while counter < 1500: # Max number of river with station was 1022
-        counter += 1
-        try:
-            i = sorted_river_n_stations[N-1]
-            j = sorted_river_n_stations[N]
-            if i[1] == j[1]: 
-                N += 1
-            else:
-                break
-        except:
-            break
-
-
-    return sorted_river_n_stations[:N]
+    if isinstance(stations, StationCatalog):
+        return stations.rivers_station_number(N)
+
+    # Counting the stations on each river, and selecting the rivers with the most with a heap
+    river_n_stations = {river: len(stas) for (river, stas) in stations_by_river(stations).items()}
+    return top_counts(river_n_stations, N)
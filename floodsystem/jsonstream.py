@@ -0,0 +1,126 @@
+"""
+This module contains an incremental JSON parser for large API responses.
+
+Environment Agency responses are a JSON object with the results in an `items` array. `iter_items` decodes the elements
+of this array one at a time from chunks of text, as they arrive from the network or are read from a file, so the whole
+document never has to be held in memory at once.
+"""
+
+import json
+import re
+
+
+_WHITESPACE = re.compile(r"[ \t\n\r]*")
+
+# Consumed text is only dropped from the buffer once there is this much of it, to avoid copying on every item
+_TRIM_SIZE = 1 << 16
+
+
+class _Reader:
+    """
+    A buffer of text from an iterator of chunks, which is topped up as needed.
+    """
+
+    def __init__(self, chunks):
+        self.chunks = iter(chunks)
+        self.buffer = ""
+        self.pos = 0
+        self.eof = False
+
+    def more(self):
+        """
+        Reads another chunk into the buffer, returning `False` if there are no more.
+        """
+        if self.pos >= _TRIM_SIZE:
+            self.buffer = self.buffer[self.pos:]
+            self.pos = 0
+        for chunk in self.chunks:
+            if chunk:
+                self.buffer += chunk
+                return True
+        self.eof = True
+        return False
+
+    def peek(self):
+        """
+        Skips whitespace and returns the next character, or `""` at the end of the text.
+        """
+        while True:
+            self.pos = _WHITESPACE.match(self.buffer, self.pos).end()
+            if self.pos < len(self.buffer):
+                return self.buffer[self.pos]
+            if not self.more():
+                return ""
+
+    def expect(self, chars):
+        """
+        Consumes the next character, which must be one of `chars`, and returns it.
+        """
+        c = self.peek()
+        if c == "" or c not in chars:
+            raise ValueError("expected one of {!r} at position {} of JSON stream, found {!r}".format(
+                chars, self.pos, c))
+        self.pos += 1
+        return c
+
+    def value(self, decoder):
+        """
+        Decodes the next JSON value.
+        """
+        self.peek()
+        while True:
+            try:
+                value, end = decoder.raw_decode(self.buffer, self.pos)
+                # A number at the end of the buffer may continue in the next chunk
+                if end < len(self.buffer) or self.eof:
+                    self.pos = end
+                    return value
+            except json.JSONDecodeError:
+                if self.eof:
+                    raise
+            self.more()
+
+
+def iter_items(chunks, key="items"):
+    """
+    Decodes the elements of the array stored under `key` in a JSON object one at a time.
+
+    # Inputs
+    - `chunks`: an iterable of `str` chunks which together make up the JSON text.
+    - `key`: the key of the array in the top level object.
+
+    # Returns
+    An iterator of the decoded elements of the array. Nothing is yielded if the object has no such key.
+    Once the object has been decoded, the rest of `chunks` is read, so that a source which finishes its work
+    when it is exhausted (such as a download being saved to the cache) does so.
+    """
+    reader = _Reader(chunks)
+    decoder = json.JSONDecoder()
+
+    reader.expect("{")
+    if reader.peek() == "}":
+        _drain(reader)
+        return
+    while True:
+        name = reader.value(decoder)
+        reader.expect(":")
+        if name == key and reader.peek() == "[":
+            reader.expect("[")
+            if reader.peek() == "]":
+                reader.pos += 1
+            else:
+                while True:
+                    yield reader.value(decoder)
+                    if reader.expect(",]") == "]":
+                        break
+        else:
+            # Skip over other values, such as the metadata
+            reader.value(decoder)
+        if reader.expect(",}") == "}":
+            _drain(reader)
+            return
+
+
+def _drain(reader):
+    for _ in reader.chunks:
+        pass
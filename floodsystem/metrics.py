@@ -0,0 +1,192 @@
+"""
+This module contains lightweight, opt-in instrumentation of the hot paths of the flood warning system.
+
+Code is instrumented with named counters (`count`) and timers (`timer`), such as the number of bytes fetched, cache hits
+and misses, and the time spent fitting polynomials. Instrumentation is off by default, in which case `count` returns at
+once and `timer` returns a shared no-op context manager, so instrumented code runs at almost full speed. It is turned on
+with `enable`, or by setting the `FLOODSYSTEM_METRICS` environment variable to `1`.
+
+The metrics recorded are returned by `report`, formatted for people by `format_report`, and exported in the Prometheus
+text exposition format by `export_prometheus`.
+
+    from floodsystem import metrics
+
+    metrics.enable()
+    towns = get_all_town_risk_levels(stations, 1, 3, False)
+    print(metrics.format_report())
+"""
+
+import contextlib
+import os
+import re
+import threading
+import time
+
+
+class TimerStats:
+    """
+    The number of times a timer has been run, and the total, shortest and longest time of the runs in seconds.
+    """
+
+    __slots__ = ("count", "total", "min", "max")
+
+    def __init__(self):
+        self.count = 0
+        self.total = 0.
+        self.min = float("inf")
+        self.max = 0.
+
+    def add(self, seconds):
+        self.count += 1
+        self.total += seconds
+        if seconds < self.min:
+            self.min = seconds
+        if seconds > self.max:
+            self.max = seconds
+
+    def as_dict(self):
+        return {"count": self.count, "total": self.total, "min": self.min if self.count else 0., "max": self.max,
+                "mean": self.total / self.count if self.count else 0.}
+
+
+class _Timer:
+    # Times the block it is used in, adding the time to the timer `name` on exit
+    __slots__ = ("name", "start")
+
+    def __init__(self, name):
+        self.name = name
+
+    def __enter__(self):
+        self.start = time.perf_counter()
+        return self
+
+    def __exit__(self, *exc_info):
+        elapsed = time.perf_counter() - self.start
+        with _lock:
+            stats = _timers.get(self.name)
+            if stats is None:
+                stats = _timers[self.name] = TimerStats()
+            stats.add(elapsed)
+        return False
+
+
+_enabled = os.environ.get("FLOODSYSTEM_METRICS", "") not in ("", "0")
+_lock = threading.Lock()
+_counters = dict()
+_timers = dict()
+_NULL_TIMER = contextlib.nullcontext()
+
+
+def enable():
+    """
+    Turns on recording of metrics.
+    """
+    global _enabled
+    _enabled = True
+
+
+def disable():
+    """
+    Turns off recording of metrics. Metrics already recorded are kept until `reset` is called.
+    """
+    global _enabled
+    _enabled = False
+
+
+def is_enabled():
+    """
+    Returns whether metrics are being recorded.
+    """
+    return _enabled
+
+
+def reset():
+    """
+    Clears all of the recorded metrics.
+    """
+    with _lock:
+        _counters.clear()
+        _timers.clear()
+
+
+def count(name, value=1):
+    """
+    Adds `value` to the counter `name`, if metrics are being recorded.
+    """
+    if not _enabled:
+        return
+    with _lock:
+        _counters[name] = _counters.get(name, 0) + value
+
+
+def timer(name):
+    """
+    Returns a context manager which adds the time spent in its block to the timer `name`, if metrics are being recorded.
+
+        with metrics.timer("analysis.polyfit"):
+            ...
+    """
+    if not _enabled:
+        return _NULL_TIMER
+    return _Timer(name)
+
+
+def report():
+    """
+    Returns a snapshot of the recorded metrics.
+
+    # Returns
+    A `dict` with a `counters` `dict` mapping each counter name to its value, and a `timers` `dict` mapping each timer
+    name to a `dict` of the `count`, `total`, `min`, `max` and `mean` time of its runs in seconds.
+    """
+    with _lock:
+        return {
+            "counters": dict(sorted(_counters.items())),
+            "timers": {name: stats.as_dict() for (name, stats) in sorted(_timers.items())},
+        }
+
+
+def format_report():
+    """
+    Returns the recorded metrics as a table of text.
+    """
+    snapshot = report()
+    lines = []
+    if snapshot["timers"]:
+        lines.append("{:<44} {:>8} {:>11} {:>11} {:>11}".format("timer", "count", "total / s", "mean / ms", "max / ms"))
+        for (name, stats) in snapshot["timers"].items():
+            lines.append("{:<44} {:>8} {:>11.4f} {:>11.3f} {:>11.3f}".format(
+                name, stats["count"], stats["total"], stats["mean"] * 1e3, stats["max"] * 1e3))
+    if snapshot["counters"]:
+        if lines:
+            lines.append("")
+        lines.append("{:<44} {:>16}".format("counter", "value"))
+        for (name, value) in snapshot["counters"].items():
+            lines.append("{:<44} {:>16,}".format(name, value))
+    return "\n".join(lines)
+
+
+def export_prometheus(prefix="floodsystem"):
+    """
+    Returns the recorded metrics in the Prometheus text exposition format.
+
+    Counters are exported as `<prefix>_<name>_total` counters, and timers as `<prefix>_<name>_seconds` summaries with
+    `_count` and `_sum` samples, where any characters of the name which aren't allowed in a metric name are replaced
+    with `_`.
+    """
+    snapshot = report()
+    lines = []
+    for (name, value) in snapshot["counters"].items():
+        metric = _metric_name(prefix, name) + "_total"
+        lines.append("# TYPE {} counter".format(metric))
+        lines.append("{} {}".format(metric, value))
+    for (name, stats) in snapshot["timers"].items():
+        metric = _metric_name(prefix, name) + "_seconds"
+        lines.append("# TYPE {} summary".format(metric))
+        lines.append("{}_count {}".format(metric, stats["count"]))
+        lines.append("{}_sum {!r}".format(metric, stats["total"]))
+    return "".join(line + "\n" for line in lines)
+
+
+def _metric_name(prefix, name):
+    return re.sub(r"[^a-zA-Z0-9_]", "_", "{}_{}".format(prefix, name) if prefix else name)
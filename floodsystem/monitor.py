@@ -0,0 +1,148 @@
+"""
+This module contains a long-running flood monitor.
+
+A `FloodMonitor` keeps the station list, the latest water levels and the risk level of every station in memory, and
+polls the Environment Agency for new readings on a schedule. Each poll only fetches the level history of, and rescores,
+the stations whose latest reading has changed, so the work done by a poll is proportional to the number of changes
+rather than to the number of stations. The town risk levels can be read at any time, including from other threads
+while the monitor is running in the background.
+"""
+
+import sys
+import threading
+import time
+
+from .flood import fetch_station_histories, get_risk_levels, get_town_risk_levels
+from .stationdata import WaterLevelUpdater, build_station_list
+
+
+class FloodMonitor:
+    """
+    Monitors the risk of flooding in every town.
+
+    # Inputs
+    - `n`: the number of days of level history to fit to when scoring a station.
+    - `p`: the degree of the polynomial fitted to the level histories.
+    - `interval`: the number of seconds between polls.
+    - `max_workers`: the maximum number of level histories to fetch concurrently, or `None` to fetch sequentially.
+    - `store`: a `ReadingStore` to keep the fetched readings in, so that only new readings are fetched for a station.
+    - `use_cache`: whether the station list may be built from the cached station data.
+    """
+
+    def __init__(self, n=1, p=3, interval=900., max_workers=None, store=None, use_cache=True):
+        self.n = n
+        self.p = p
+        self.interval = interval
+        self.max_workers = max_workers
+        self.store = store
+        self.use_cache = use_cache
+
+        self.stations = None
+        self.updater = None
+        # The risk level of each scored station, and the number of stations at each risk level in each town
+        self.risks = dict()
+        self.severities = dict()
+        # The stations waiting to be scored, which are kept until a poll scores them successfully
+        self._pending = dict()
+
+        self.polls = 0
+        self.last_poll = None
+        self.last_error = None
+
+        self._lock = threading.Lock()
+        self._stop = threading.Event()
+        self._thread = None
+
+    def poll(self):
+        """
+        Refreshes the latest water levels and rescores the stations whose latest reading has changed.
+
+        The first poll builds the station list and scores every station in a town. If a poll fails, the stations it
+        was to rescore are rescored by the next poll, even if their latest reading hasn't changed again.
+
+        # Returns
+        A `list` of the stations which were rescored.
+        """
+        if self.stations is None:
+            stations = build_station_list(self.use_cache)
+            updater = WaterLevelUpdater(stations)
+            updater.update()
+            self.stations, self.updater = stations, updater
+            changed = stations
+        else:
+            changed = self.updater.update()
+        for station in changed:
+            if station.town is not None:
+                self._pending[id(station)] = station
+        rescored = list(self._pending.values())
+
+        # Stations with an inconsistent typical range can't be scored from their history and are given a moderate risk
+        fitted = [station for station in rescored if station.typical_range_consistent()]
+        histories = list(fetch_station_histories(fitted, self.n, self.max_workers, self.store))
+        risks = dict(zip(map(id, fitted), get_risk_levels(histories, self.p)))
+
+        with self._lock:
+            for station in rescored:
+                self._set_risk(station, risks.get(id(station), 2))
+            self._pending.clear()
+            self.polls += 1
+            self.last_poll = time.time()
+        return rescored
+
+    def _set_risk(self, station, risk):
+        # Moves a station's count in its town from its previous risk level to its new one
+        previous = self.risks.get(id(station))
+        counts = self.severities.setdefault(station.town, [0] * 4)
+        if previous is not None:
+            counts[previous] -= 1
+        counts[risk] += 1
+        self.risks[id(station)] = risk
+
+    def town_risk_levels(self):
+        """
+        Returns the current assessed risk of all towns, in the same form as `get_all_town_risk_levels`:
+        a `list` of 4 `list`s of towns, one for each risk level from severe (0) to low (3).
+        """
+        with self._lock:
+            severities = {town: list(counts) for (town, counts) in self.severities.items()}
+        return get_town_risk_levels(severities)
+
+    def run(self, max_polls=None):
+        """
+        Polls every `interval` seconds until `stop` is called, or until `max_polls` polls have been made.
+
+        An error in a poll doesn't stop the monitor: it is recorded in `last_error`, printed to stderr and the poll is
+        tried again at the next interval.
+        """
+        polls = 0
+        while not self._stop.is_set() and (max_polls is None or polls < max_polls):
+            started = time.monotonic()
+            try:
+                self.poll()
+                self.last_error = None
+            except Exception as e:
+                self.last_error = e
+                print("Flood monitor poll failed: {!r}".format(e), file=sys.stderr)
+            polls += 1
+            if max_polls is not None and polls >= max_polls:
+                break
+            self._stop.wait(max(0., self.interval - (time.monotonic() - started)))
+
+    def start(self):
+        """
+        Starts polling in a background daemon thread.
+        """
+        if self._thread is not None and self._thread.is_alive():
+            raise RuntimeError("the monitor is already running")
+        self._stop.clear()
+        self._thread = threading.Thread(target=self.run, name="FloodMonitor", daemon=True)
+        self._thread.start()
+
+    def stop(self, timeout=None):
+        """
+        Stops polling, waiting for up to `timeout` seconds for a poll in progress to finish.
+        """
+        self._stop.set()
+        if self._thread is not None:
+            self._thread.join(timeout)
+            self._thread = None
@@ -1,15 +1,11 @@
 """
 This module contains functions for plotting water level data over time for monitoring stations.
-"""
 
-import matplotlib.pyplot as plt
-import numpy as np
-import datetime
+`matplotlib.pyplot` is only imported when a plot is made, as importing it is slow.
+"""
 
-from floodsystem.stationdata import build_station_list
-from floodsystem.datafetcher import fetch_measure_levels
 from floodsystem.analysis import polyfit
-from matplotlib.dates import date2num
+from floodsystem.series import day_numbers
 
 
 def plot_water_levels(station, dates, levels):
@@ -22,6 +18,7 @@ def plot_water_levels(station, dates, levels):
     - `dates`: the dates and times at which the levels were recorded.
     - `levels`: the water levels recorded at the monitoring station.
     """
+    import matplotlib.pyplot as plt
 
     # Plot the water levels
     plt.plot(dates, levels)
@@ -53,6 +50,8 @@ def plot_water_level_with_fit(station, dates, levels, p):
     - `levels`: the water levels recorded at the monitoring station.
     - `p`: the degree of polynomial to fit the the station's water level data.
     """
+    import matplotlib.pyplot as plt
+
     # Create the plot
     fig, ax = plt.subplots()
 
@@ -62,7 +61,7 @@ def plot_water_level_with_fit(station, dates, levels, p):
     # Fit polynomial to level data
     polynomial, offset = polyfit(dates, levels, p)
     # Create offset dates for inputs to the polynomial
-    date_array = date2num(dates)
+    date_array = day_numbers(dates)
     date_array -= offset
 
     # Create predicted water levels form polynomial fit
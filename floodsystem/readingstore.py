@@ -0,0 +1,168 @@
+"""
+This module contains an on-disk store of the water level readings fetched for each measure.
+
+Readings for each measure are kept in their own text file, sorted by time. New readings are only ever appended to the
+end of a file, so a level history can be brought up to date by fetching just the readings newer than the last stored
+one. Each file starts with a header recording the time from which it holds every reading, so that a request for a
+longer history than has been stored can be detected and fetched in full. Readings which have fallen out of the history
+being kept are dropped once they make up most of a file, so that files don't grow without bound.
+"""
+
+import datetime
+import hashlib
+import os
+import threading
+
+
+class ReadingStore:
+    """
+    A persistent store of level readings, with one append-only file per measure.
+
+    # Inputs
+    - `directory`: the directory to store the reading files in.
+    """
+
+    def __init__(self, directory=os.path.join("cache", "readings")):
+        self.directory = directory
+        self._lock = threading.Lock()
+        self._locks = dict()
+
+    def path(self, measure_id):
+        """
+        Returns the path of the file storing the readings of `measure_id`.
+        """
+        # Measure ids are URLs, so the file is named after the last part of the URL and a hash of the whole URL
+        name = measure_id.rstrip("/").rsplit("/", 1)[-1]
+        name = "".join(c if c.isalnum() or c in "-_." else "_" for c in name)
+        digest = hashlib.sha1(measure_id.encode()).hexdigest()[:12]
+        return os.path.join(self.directory, "{}-{}.csv".format(name, digest))
+
+    def lock(self, measure_id):
+        """
+        Returns a lock which must be held while reading and updating the readings of `measure_id`.
+        """
+        with self._lock:
+            if measure_id not in self._locks:
+                self._locks[measure_id] = threading.Lock()
+            return self._locks[measure_id]
+
+    def covered_since(self, measure_id):
+        """
+        Returns the time from which every reading of `measure_id` is stored, or `None` if nothing is stored.
+        """
+        try:
+            with open(self.path(measure_id), "r") as f:
+                header = f.readline()
+        except FileNotFoundError:
+            return None
+        return _parse_date(header[len("# since "):].strip())
+
+    def last_date(self, measure_id):
+        """
+        Returns the time of the latest stored reading of `measure_id`, or `None` if there aren't any.
+        """
+        try:
+            with open(self.path(measure_id), "rb") as f:
+                # Read backwards from the end of the file until the whole of the last line has been read
+                f.seek(0, os.SEEK_END)
+                end = f.tell()
+                size = 256
+                while True:
+                    f.seek(max(0, end - size))
+                    lines = f.read().splitlines()
+                    if len(lines) > 1 or size >= end:
+                        break
+                    size *= 2
+        except FileNotFoundError:
+            return None
+        if len(lines) < 2 or lines[-1].startswith(b"#"):
+            return None
+        return _parse_date(lines[-1].split(b",", 1)[0].decode())
+
+    def read(self, measure_id, since=None):
+        """
+        Returns the stored readings of `measure_id`, from time `since` onwards if given.
+
+        # Returns
+        A `tuple` of a `list` of the dates of the readings and a `list` of the levels, with `None` for missing levels.
+        """
+        # Dates are all stored in the same UTC format, so older readings are skipped by comparing the text of their
+        # dates, without parsing them
+        start = None if since is None else _format_date(since)
+        dates, levels = [], []
+        try:
+            with open(self.path(measure_id), "r") as f:
+                f.readline()
+                for line in f:
+                    date, level = line.rstrip("\n").split(",", 1)
+                    if start is not None and date < start:
+                        continue
+                    dates.append(_parse_date(date))
+                    levels.append(float(level) if level else None)
+        except FileNotFoundError:
+            pass
+        return dates, levels
+
+    def append(self, measure_id, dates, levels, since=None):
+        """
+        Appends the readings newer than the latest stored reading of `measure_id` to its file.
+
+        If `since` is given, the readings from before it are no longer needed. Once they span a longer time than the
+        readings from `since` onwards, the file is rewritten without them.
+
+        # Inputs
+        - `measure_id`: the measure the readings were taken by.
+        - `dates`: the dates of the readings, in any order.
+        - `levels`: the levels of the readings, with `None` for missing levels.
+        - `since`: the time from which readings must be kept, or `None` to keep every reading.
+        """
+        dates, levels = _sort_readings(dates, levels)
+        last = self.last_date(measure_id)
+        with open(self.path(measure_id), "a") as f:
+            for date, level in zip(dates, levels):
+                if last is None or date > last:
+                    f.write(_format_reading(date, level))
+                    last = date
+
+        if since is not None:
+            covered = self.covered_since(measure_id)
+            if covered is not None and last is not None and since - covered > last - since:
+                self.replace(measure_id, since, *self.read(measure_id, since=since))
+
+    def replace(self, measure_id, since, dates, levels):
+        """
+        Replaces all of the stored readings of `measure_id` with every reading from time `since` onwards, which may be
+        given in any order.
+        """
+        dates, levels = _sort_readings(dates, levels)
+        os.makedirs(self.directory, exist_ok=True)
+        path = self.path(measure_id)
+        tmp_path = "{}.{}.tmp".format(path, os.getpid())
+        with open(tmp_path, "w") as f:
+            f.write("# since {}\n".format(_format_date(since)))
+            for date, level in zip(dates, levels):
+                f.write(_format_reading(date, level))
+        os.replace(tmp_path, path)
+
+
+def _sort_readings(dates, levels):
+    # Readings are often given newest first, as the Environment Agency sorts them, so they are put in date order
+    if all(a <= b for a, b in zip(dates, dates[1:])):
+        return dates, levels
+    order = sorted(range(len(dates)), key=dates.__getitem__)
+    return [dates[i] for i in order], [levels[i] for i in order]
+
+
+def _format_date(date):
+    # Dates are stored in UTC, so that they sort and compare as strings
+    if date.tzinfo is None:
+        date = date.replace(tzinfo=datetime.timezone.utc)
+    return date.astimezone(datetime.timezone.utc).isoformat()
+
+
+def _format_reading(date, level):
+    return "{},{}\n".format(_format_date(date), "" if level is None else repr(float(level)))
+
+
+def _parse_date(text):
+    return datetime.datetime.fromisoformat(text)
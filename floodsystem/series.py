@@ -0,0 +1,79 @@
+"""
+This module contains a compact, array-backed representation of a station's water level history.
+
+A `LevelSeries` holds the times of the readings as a `datetime64` array and the levels as a `float64` array with NaN for
+missing readings, rather than `list`s of `datetime` objects and floats or `None`. It is a named tuple of
+`(times, levels)`, so it can be used anywhere a `(dates, levels)` pair is expected, for example
+`dates, levels = fetch_measure_levels(measure_id, dt, as_series=True)`.
+"""
+
+import datetime
+from typing import NamedTuple
+
+import numpy as np
+
+
+# Times are converted to days since this epoch, which is also matplotlib's default date epoch
+_EPOCH = np.datetime64("1970-01-01T00:00:00", "us")
+_MICROSECONDS_PER_DAY = 86400e6
+
+
+class LevelSeries(NamedTuple):
+    """
+    The water level history of a station.
+
+    # Attributes
+    - `times`: a `datetime64` array of the UTC times of the readings, in ascending order.
+    - `levels`: a `float64` array of the water level readings, with NaN for missing readings.
+    """
+    times: np.ndarray
+    levels: np.ndarray
+
+    @classmethod
+    def from_lists(cls, dates, levels):
+        """
+        Builds a series from a `list` of `datetime`s and a `list` of levels with `None` for missing levels.
+        Naive `datetime`s are taken to be UTC.
+        """
+        times = np.array([_to_utc(d) for d in dates], dtype="datetime64[us]")
+        return cls(times, np.array([np.nan if level is None else level for level in levels], dtype=float))
+
+    def to_lists(self):
+        """
+        Converts the series to a `list` of UTC `datetime`s and a `list` of levels with `None` for missing levels.
+        """
+        dates = [d.replace(tzinfo=datetime.timezone.utc) for d in self.times.astype("datetime64[us]").tolist()]
+        levels = [None if level != level else level for level in self.levels.tolist()]
+        return dates, levels
+
+    @property
+    def day_numbers(self):
+        """
+        The times of the readings as a `float64` array of days since 1970-01-01, the same as `date2num` gives.
+        """
+        return day_numbers(self.times)
+
+
+def day_numbers(dates):
+    """
+    Converts dates to a `float64` array of days since 1970-01-01, the same as `matplotlib.dates.date2num` gives
+    with its default epoch.
+
+    # Inputs
+    - `dates`: a `datetime64` array, a numerical array (which is assumed to already be day numbers),
+      or a sequence of `datetime`s.
+    """
+    if isinstance(dates, np.ndarray):
+        if np.issubdtype(dates.dtype, np.datetime64):
+            return (dates.astype("datetime64[us]") - _EPOCH).astype(np.int64) / _MICROSECONDS_PER_DAY
+        if np.issubdtype(dates.dtype, np.number):
+            return dates.astype(float)
+
+    from matplotlib.dates import date2num
+    return np.asarray(date2num(dates), dtype=float)
+
+
+def _to_utc(d):
+    if d.tzinfo is not None:
+        d = d.astimezone(datetime.timezone.utc).replace(tzinfo=None)
+    return d
@@ -0,0 +1,171 @@
+"""
+This module contains a spatial index for answering many distance queries on the same stations.
+
+Stations are stored in a k-d tree of points on the unit sphere, where the straight line (chord) distance between two
+points increases with the great circle distance between them. The tree finds the few stations which might be close
+enough to a query point, and the exact distances to these are then found with the haversine formula, so that the
+results are the same as `stations_within_radius` and `stations_by_distance`.
+"""
+
+import heapq
+
+import numpy as np
+
+from .geo import haversine_many, station_coords
+
+
+# Radius of the earth in km, as used by `haversine`
+EARTH_RADIUS = 6371.
+
+# Allowance for rounding when comparing chord lengths, so no station is wrongly excluded before the exact check
+_TOLERANCE = 1e-9
+
+
+class _Node:
+    __slots__ = ("lo", "hi", "left", "right", "indices")
+
+    def __init__(self, lo, hi, left=None, right=None, indices=None):
+        self.lo, self.hi = lo, hi
+        self.left, self.right = left, right
+        self.indices = indices
+
+
+def unit_vectors(coords):
+    """
+    Converts an `(n, 2)` array of (latitude, longitude) coordinates to an `(n, 3)` array of points on the unit sphere.
+    """
+    coords = np.radians(np.asarray(coords, dtype=float)).reshape(-1, 2)
+    lat, long = coords[:, 0], coords[:, 1]
+    return np.column_stack((np.cos(lat) * np.cos(long), np.cos(lat) * np.sin(long), np.sin(lat)))
+
+
+def _chord(r):
+    # Chord length on the unit sphere for a great circle distance `r` in km
+    angle = min(max(r, 0.) / EARTH_RADIUS, np.pi)
+    return 2 * np.sin(0.5 * angle)
+
+
+class StationIndex:
+    """
+    A spatial index of a `list` of `MonitoringStation`s, for fast radius and nearest-station queries.
+
+    The index must be rebuilt if the stations' coordinates change.
+
+    # Inputs
+    - `stations`: a `list` of `MonitoringStation`s.
+    - `leaf_size`: the maximum number of stations in each leaf of the tree.
+    """
+
+    def __init__(self, stations, leaf_size=16):
+        self.stations = list(stations)
+        self.coords = station_coords(self.stations)
+        self.points = unit_vectors(self.coords)
+        self.leaf_size = leaf_size
+        self.root = self._build(np.arange(len(self.stations))) if self.stations else None
+
+    def __len__(self):
+        return len(self.stations)
+
+    def _build(self, indices):
+        points = self.points[indices]
+        lo, hi = points.min(axis=0), points.max(axis=0)
+        # Bounds are kept as tuples of floats, which are much faster than small arrays to compare with in queries
+        if len(indices) <= self.leaf_size:
+            return _Node(tuple(lo.tolist()), tuple(hi.tolist()), indices=indices)
+
+        # Split at the median of the axis with the largest spread
+        axis = np.argmax(hi - lo)
+        middle = len(indices) // 2
+        order = np.argpartition(points[:, axis], middle)
+        return _Node(tuple(lo.tolist()), tuple(hi.tolist()),
+                     self._build(indices[order[:middle]]), self._build(indices[order[middle:]]))
+
+    def _within_chord(self, q, chord):
+        # Indices of all stations within a chord length of unit vector `q`, in no particular order
+        found = []
+        if self.root is None:
+            return np.array(found, dtype=int)
+        limit = (chord + _TOLERANCE)**2
+        stack = [self.root]
+        while stack:
+            node = stack.pop()
+            if _box_distance2(node, q) > limit:
+                continue
+            if node.indices is not None:
+                d2 = np.sum((self.points[node.indices] - q)**2, axis=1)
+                found.append(node.indices[d2 <= limit])
+            else:
+                stack.append(node.left)
+                stack.append(node.right)
+        return np.concatenate(found) if found else np.array(found, dtype=int)
+
+    def _kth_chord(self, q, k):
+        # Chord length from unit vector `q` to its `k`th nearest station, searching the closest boxes first
+        best = []  # max-heap of the `k` smallest squared chord lengths found so far
+        queue = [(0., 0, self.root)]
+        counter = 1
+        while queue:
+            box_d2, _, node = heapq.heappop(queue)
+            if len(best) == k and box_d2 > -best[0]:
+                break
+            if node.indices is not None:
+                for d2 in np.sum((self.points[node.indices] - q)**2, axis=1).tolist():
+                    if len(best) < k:
+                        heapq.heappush(best, -d2)
+                    elif d2 < -best[0]:
+                        heapq.heapreplace(best, -d2)
+            else:
+                for child in (node.left, node.right):
+                    heapq.heappush(queue, (_box_distance2(child, q), counter, child))
+                    counter += 1
+        return np.sqrt(-best[0])
+
+    def within_radius(self, centre, r):
+        """
+        Returns the stations within a distance `r` of `centre`.
+
+        # Inputs
+        - `centre`: the (latitude, longitude) pair which the monitoring stations must be within the specified radius of.
+        - `r`: the maximum distance in km a monitoring station can be from `centre`.
+
+        # Returns
+        A `list` of `MonitoringStation`s in the same order as the indexed stations, the same as
+        `stations_within_radius`.
+        """
+        candidates = np.sort(self._within_chord(unit_vectors(centre)[0], _chord(r)))
+        inside = haversine_many(self.coords[candidates], centre) <= r
+        return [self.stations[i] for i in candidates[inside]]
+
+    def nearest(self, point, k):
+        """
+        Returns the `k` stations nearest to `point`, and their distances.
+
+        # Inputs
+        - `point`: a latitude and longitude pair to calculate the distances from.
+        - `k`: the number of stations to return.
+
+        # Returns
+        A `list` of (`MonitoringStation`, distance) pairs sorted in ascending order by distance from `point`,
+        the same as the first `k` pairs returned by `stations_by_distance`.
+        """
+        k = min(k, len(self.stations))
+        if k <= 0:
+            return []
+        q = unit_vectors(point)[0]
+        candidates = np.sort(self._within_chord(q, self._kth_chord(q, k)))
+        distances = haversine_many(self.coords[candidates], point)
+        # A stable sort of the stations in their original order breaks ties the same way as `stations_by_distance`
+        order = np.argsort(distances, kind="stable")[:k]
+        distances = distances.tolist()
+        return [(self.stations[candidates[i]], distances[i]) for i in order]
+
+
+def _box_distance2(node, q):
+    # Squared distance from `q` to the nearest point of the bounding box of `node`
+    d2 = 0.
+    for (lo, hi, x) in zip(node.lo, node.hi, q):
+        if x < lo:
+            d2 += (lo - x)**2
+        elif x > hi:
+            d2 += (x - hi)**2
+    return d2
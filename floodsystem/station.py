@@ -6,10 +6,21 @@ for manipulating/modifying station data
 
 """
 
+import sys
+
+
+def _intern(name):
+    """Intern a river or town name, which is shared by many stations"""
+    return sys.intern(name) if isinstance(name, str) else name
+
 
 class MonitoringStation:
     """This class represents a river level monitoring station"""
 
+    # Stations are stored without a __dict__ to save memory
+    __slots__ = ('station_id', 'measure_id', 'name', 'coord',
+                 'typical_range', 'river', 'town', 'latest_level')
+
     def __init__(self, station_id, measure_id, label, coord, typical_range,
                  river, town):
         """Create a monitoring station."""
@@ -25,8 +36,8 @@ class MonitoringStation:
 
         self.coord = coord
         self.typical_range = typical_range
-        self.river = river
-        self.town = town
+        self.river = _intern(river)
+        self.town = _intern(town)
 
         self.latest_level = None
 
@@ -6,11 +6,15 @@ JSON objects fetched from the Internet and
 
 """
 
-from . import datafetcher
+import os
+
+from . import datafetcher, metrics
+from .bincache import read_station_table, write_station_table
 from .station import MonitoringStation
+from .stationtable import StationTable
 
 
-def build_station_list(use_cache=True):
+def build_station_list(use_cache=True, stream=False, binary=False):
     """Build and return a list of all river level monitoring stations
     based on data fetched from the Environment agency. Each station is
     represented as a MonitoringStation object.
@@ -18,51 +22,126 @@ def build_station_list(use_cache=True):
     The available data for some station is incomplete or not
     available.
 
+    If ``stream`` is ``True``, the station data is decoded one station
+    at a time (see ``iter_station_list``) rather than loaded in full
+    first, which lowers the peak memory use.
+
+    If ``binary`` is ``True``, the stations are read from the binary
+    station cache (see ``load_station_table``), which is much faster
+    than decoding the JSON station data.
+
     """
 
-    # Fetch station data
-    data = datafetcher.fetch_station_data(use_cache)
-
-    # Build list of MonitoringStation objects
-    stations = []
-    for e in data["items"]:
-        # Extract town string (not always available)
-        town = None
-        if 'town' in e:
-            town = e['town']
-
-        # Extract river name (not always available)
-        river = None
-        if 'riverName' in e:
-            river = e['riverName']
-
-        # Attempt to extract typical range (low, high)
-        try:
-            typical_range = (float(e['stageScale']['typicalRangeLow']),
-                             float(e['stageScale']['typicalRangeHigh']))
-        except Exception:
-            typical_range = None
-
-        try:
-            # Create mesure station object if all required data is
-            # available, and add to list
-            s = MonitoringStation(
-                station_id=e['@id'],
-                measure_id=e['measures'][-1]['@id'],
-                label=e['label'],
-                coord=(float(e['lat']), float(e['long'])),
-                typical_range=typical_range,
-                river=river,
-                town=town)
-            stations.append(s)
-        except Exception:
-            # Not all required data on the station was available, so
-            # skip over
-            pass
+    with metrics.timer('stationdata.build_station_list'):
+        if binary:
+            stations = load_station_table(use_cache).to_stations()
+
+        elif stream:
+            stations = list(iter_station_list(use_cache))
 
+        else:
+            # Fetch station data
+            data = datafetcher.fetch_station_data(use_cache)
+
+            # Build list of MonitoringStation objects
+            stations = []
+            for e in data["items"]:
+                s = station_from_item(e)
+                if s is not None:
+                    stations.append(s)
+
+    metrics.count('stationdata.stations', len(stations))
     return stations
 
 
+def iter_station_list(use_cache=True):
+    """Return an iterator of MonitoringStation objects for all river
+    level monitoring stations, built one at a time as the station data
+    is read from the cache file or the Internet.
+
+    """
+    for e in datafetcher.iter_station_data(use_cache):
+        s = station_from_item(e)
+        if s is not None:
+            yield s
+
+
+def load_station_table(use_cache=True):
+    """Build and return a StationTable of all river level monitoring
+    stations.
+
+    The table is memory-mapped from the binary station cache file if
+    the cached station data is still fresh and the binary cache was
+    built from it. Otherwise the table is built from the station data
+    and the binary cache is rewritten.
+
+    """
+
+    policy = datafetcher.cache_policy
+    json_path = policy.path('station_data')
+    binary_path = os.path.splitext(json_path)[0] + '.bin'
+
+    if use_cache and policy.is_fresh('station_data',
+                                     datafetcher.STATION_DATA_URL):
+        # An out of date binary cache is not mapped, so that it can be
+        # replaced below
+        cached = read_station_table(binary_path, _cache_source(json_path))
+        if cached is not None:
+            return cached[0]
+
+    table = StationTable.from_stations(list(iter_station_list(use_cache)))
+    write_station_table(table, binary_path, _cache_source(json_path))
+    return table
+
+
+def _cache_source(path):
+    """Describe a cache file, so that caches derived from it can be
+    checked to be up to date"""
+    st = os.stat(path)
+    return {'size': st.st_size, 'mtime_ns': st.st_mtime_ns}
+
+
+def station_from_item(e):
+    """Build a MonitoringStation object from a station item of the
+    station data, or return None if the required data is not
+    available.
+
+    """
+
+    # Extract town string (not always available)
+    town = None
+    if 'town' in e:
+        town = e['town']
+
+    # Extract river name (not always available)
+    river = None
+    if 'riverName' in e:
+        river = e['riverName']
+
+    # Attempt to extract typical range (low, high)
+    try:
+        typical_range = (float(e['stageScale']['typicalRangeLow']),
+                         float(e['stageScale']['typicalRangeHigh']))
+    except Exception:
+        typical_range = None
+
+    try:
+        # Create mesure station object if all required data is
+        # available
+        return MonitoringStation(
+            station_id=e['@id'],
+            measure_id=e['measures'][-1]['@id'],
+            label=e['label'],
+            coord=(float(e['lat']), float(e['long'])),
+            typical_range=typical_range,
+            river=river,
+            town=town)
+    except Exception:
+        # Not all required data on the station was available, so
+        # skip over
+        return None
+
+
 def update_water_levels(stations):
     """Attach level data contained in measure_data to stations"""
 
@@ -71,11 +150,8 @@ def update_water_levels(stations):
 
     # Build map from measure id to latest reading (value)
     measure_id_to_value = dict()
-    for measure in measure_data['items']:
-        if 'latestReading' in measure:
-            latest_reading = measure['latestReading']
-            measure_id = latest_reading['measure']
-            measure_id_to_value[measure_id] = latest_reading['value']
+    for measure_id, latest_reading in _latest_readings(measure_data):
+        measure_id_to_value[measure_id] = latest_reading['value']
 
     # Attach latest reading to station objects
     for station in stations:
@@ -87,3 +163,106 @@ def update_water_levels(stations):
         if station.measure_id in measure_id_to_value:
             if isinstance(measure_id_to_value[station.measure_id], float):
                 station.latest_level = measure_id_to_value[station.measure_id]
+
+
+def _latest_readings(measure_data):
+    """Iterate over (measure id, latest reading) pairs of the measures
+    in measure_data which have a latest reading"""
+    for measure in measure_data['items']:
+        if 'latestReading' in measure:
+            latest_reading = measure['latestReading']
+            yield latest_reading['measure'], latest_reading
+
+
+class WaterLevelUpdater:
+    """Keep the latest water levels of a list of stations up to date
+    between refreshes.
+
+    The map from measure id to stations is built once, and the latest
+    reading of each measure is remembered, so each call to ``update``
+    only changes the stations with a new reading and reports which
+    ones they are. The time of each station's latest reading is kept
+    in ``reading_times``.
+
+    Stations are updated in the same way as by
+    ``update_water_levels``: a station's ``latest_level`` is ``None``
+    if its measure has no reading or the reading is not a single
+    value.
+
+    """
+
+    def __init__(self, stations):
+        self.stations = stations
+
+        # Map from measure id to the stations with that measure
+        self.measure_index = dict()
+        self._positions = dict()
+        for i, station in enumerate(stations):
+            self.measure_index.setdefault(station.measure_id, []).append(station)
+            self._positions[id(station)] = i
+
+        # Map from measure id to the (dateTime, level) of the latest
+        # reading seen, and to the time of that reading
+        self.readings = dict()
+        self.reading_times = dict()
+
+        self._refreshed = False
+
+    def reading_time(self, station):
+        """Return the time of the latest reading of a station, or None
+        if it has no reading"""
+        return self.reading_times.get(station.measure_id)
+
+    def update(self, measure_data=None):
+        """Update the latest levels of the stations from measure_data,
+        which is fetched if not given. Return the list of stations
+        whose latest reading has changed (a new reading time or level)
+        since the previous update, in the order of ``stations``.
+
+        On the first update every station's latest level is set, and
+        the stations with a reading are reported as changed.
+
+        """
+
+        if measure_data is None:
+            measure_data = datafetcher.fetch_latest_water_level_data()
+
+        latest = dict()
+        for measure_id, latest_reading in _latest_readings(measure_data):
+            if measure_id in self.measure_index:
+                value = latest_reading['value']
+                level = value if isinstance(value, float) else None
+                latest[measure_id] = (latest_reading.get('dateTime'), level)
+
+        # Measures with a new reading, and measures which no longer
+        # have one
+        changed = [measure_id for measure_id, reading in latest.items()
+                   if self.readings.get(measure_id) != reading]
+        changed += [measure_id for measure_id in self.readings
+                    if measure_id not in latest]
+
+        if not self._refreshed:
+            for station in self.stations:
+                station.latest_level = None
+            self._refreshed = True
+
+        times = datafetcher.parse_datetimes(
+            [latest[measure_id][0] for measure_id in changed
+             if measure_id in latest and latest[measure_id][0] is not None])
+        times = iter(times)
+        for measure_id in changed:
+            if measure_id in latest:
+                date_time, level = self.readings[measure_id] = latest[measure_id]
+                self.reading_times[measure_id] = next(times) if date_time is not None else None
+            else:
+                del self.readings[measure_id]
+                del self.reading_times[measure_id]
+                level = None
+            for station in self.measure_index[measure_id]:
+                station.latest_level = level
+
+        # Report changed stations in the order they were given
+        stations = [station for measure_id in changed
+                    for station in self.measure_index[measure_id]]
+        stations.sort(key=lambda station: self._positions[id(station)])
+        return stations
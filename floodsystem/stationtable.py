@@ -0,0 +1,224 @@
+"""
+This module contains a columnar representation of a list of monitoring stations.
+
+A `StationTable` holds each station attribute as a single array rather than one `MonitoringStation` object per station,
+so that queries over every station are done as array operations. River and town names, which are shared by many
+stations, are stored once each and referred to by integer codes.
+"""
+
+import numpy as np
+
+from .geo import haversine_many
+from .station import MonitoringStation
+
+
+def _encode(values):
+    # Converts a sequence of values to integer codes into a list of the distinct values, with -1 for `None`
+    categories = list()
+    index = dict()
+    codes = np.empty(len(values), dtype=np.int32)
+    for (i, value) in enumerate(values):
+        if value is None:
+            codes[i] = -1
+            continue
+        code = index.get(value)
+        if code is None:
+            code = index[value] = len(categories)
+            categories.append(value)
+        codes[i] = code
+    return codes, categories
+
+
+def _take(column, indices):
+    # Selects elements of a string column, converting every element at once if the column supports it and most
+    # elements are needed
+    if hasattr(column, "tolist") and 8 * len(indices) >= len(column):
+        column = column.tolist()
+    return [column[i] for i in indices.tolist()]
+
+
+def _decode(codes, categories):
+    # Converts codes back to the values they stand for
+    if hasattr(categories, "tolist") and 8 * len(codes) >= len(categories):
+        categories = categories.tolist()
+    return [categories[code] if code >= 0 else None for code in codes]
+
+
+class StationTable:
+    """
+    A struct-of-arrays table of monitoring stations.
+
+    Missing typical ranges and latest levels are stored as NaN, and missing rivers and towns as the code -1.
+    Tables are usually built with `StationTable.from_stations`.
+
+    # Attributes
+    - `station_ids`, `measure_ids`, `names`: `list`s of `str` for each station.
+    - `lat`, `long`: `float64` arrays of the coordinates of each station.
+    - `typical_low`, `typical_high`: `float64` arrays of the typical range of each station.
+    - `latest_level`: a `float64` array of the latest water level at each station.
+    - `river_codes`, `town_codes`: `int32` arrays of indices into `rivers` and `towns`.
+    - `rivers`, `towns`: `list`s of the distinct river and town names.
+    """
+
+    def __init__(self, station_ids, measure_ids, names, lat, long, typical_low, typical_high, latest_level,
+                 river_codes, rivers, town_codes, towns):
+        self.station_ids = station_ids
+        self.measure_ids = measure_ids
+        self.names = names
+        self.lat = lat
+        self.long = long
+        self.typical_low = typical_low
+        self.typical_high = typical_high
+        self.latest_level = latest_level
+        self.river_codes = river_codes
+        self.rivers = rivers
+        self.town_codes = town_codes
+        self.towns = towns
+        self._codes = dict()
+
+    @classmethod
+    def from_stations(cls, stations):
+        """
+        Builds a table from a `list` of `MonitoringStation`s, such as the output of `build_station_list`.
+        """
+        n = len(stations)
+        coords = np.array([station.coord for station in stations], dtype=float).reshape(n, 2)
+        typical_range = np.array([station.typical_range if station.typical_range is not None else (np.nan, np.nan)
+                                  for station in stations], dtype=float).reshape(n, 2)
+        latest_level = np.array([station.latest_level if isinstance(station.latest_level, float) else np.nan
+                                 for station in stations], dtype=float)
+        river_codes, rivers = _encode([station.river for station in stations])
+        town_codes, towns = _encode([station.town for station in stations])
+        return cls(
+            station_ids=[station.station_id for station in stations],
+            measure_ids=[station.measure_id for station in stations],
+            names=[station.name for station in stations],
+            lat=coords[:, 0].copy(),
+            long=coords[:, 1].copy(),
+            typical_low=typical_range[:, 0].copy(),
+            typical_high=typical_range[:, 1].copy(),
+            latest_level=latest_level,
+            river_codes=river_codes,
+            rivers=rivers,
+            town_codes=town_codes,
+            towns=towns)
+
+    def __len__(self):
+        return len(self.station_ids)
+
+    @property
+    def coords(self):
+        """
+        An `(n, 2)` array of the (latitude, longitude) of each station.
+        """
+        return np.column_stack((self.lat, self.long))
+
+    def river(self, i):
+        """
+        Returns the river station `i` is on, or `None`.
+        """
+        code = self.river_codes[i]
+        return self.rivers[code] if code >= 0 else None
+
+    def town(self, i):
+        """
+        Returns the town station `i` is in, or `None`.
+        """
+        code = self.town_codes[i]
+        return self.towns[code] if code >= 0 else None
+
+    def station(self, i):
+        """
+        Returns a `MonitoringStation` holding the data of station `i`.
+
+        The station is a copy, so changes made to it are not made to the table.
+        """
+        return self.to_stations([i])[0]
+
+    def to_stations(self, indices=None):
+        """
+        Returns a `list` of `MonitoringStation`s for the stations at `indices`, or for every station.
+
+        `indices` may be a sequence of indices or a boolean mask, such as one returned by another method of the table.
+        The stations are copies, so changes made to them are not made to the table.
+        """
+        if indices is None:
+            indices = np.arange(len(self))
+        else:
+            indices = np.asarray(indices)
+            indices = np.flatnonzero(indices) if indices.dtype == bool else indices.astype(int).reshape(-1)
+
+        # Columns are converted to lists in bulk, which is much faster than reading them one element at a time
+        strings = [_take(column, indices) for column in (self.station_ids, self.measure_ids, self.names)]
+        numbers = [getattr(self, name)[indices].tolist()
+                   for name in ("lat", "long", "typical_low", "typical_high", "latest_level")]
+        rivers = _decode(self.river_codes[indices].tolist(), self.rivers)
+        towns = _decode(self.town_codes[indices].tolist(), self.towns)
+
+        stations = []
+        for (station_id, measure_id, name, lat, long, low, high, level, river, town) in zip(
+                *strings, *numbers, rivers, towns):
+            station = MonitoringStation(
+                station_id=station_id,
+                measure_id=measure_id,
+                label=name,
+                coord=(lat, long),
+                typical_range=None if low != low else (low, high),  # NaN is the only value not equal to itself
+                river=river,
+                town=town)
+            if level == level:
+                station.latest_level = level
+            stations.append(station)
+        return stations
+
+    def typical_range_consistent(self):
+        """
+        Returns a boolean array of whether each station's typical range is available and consistent.
+        """
+        # Comparisons with NaN are false, so stations with no typical range are inconsistent
+        return self.typical_high >= self.typical_low
+
+    def relative_water_levels(self):
+        """
+        Returns an array of each station's latest water level as a fraction of its typical range.
+
+        The relative level is NaN for stations with an inconsistent typical range or no latest level.
+        """
+        with np.errstate(divide="ignore", invalid="ignore"):
+            relative = (self.latest_level - self.typical_low) / (self.typical_high - self.typical_low)
+        return np.where(self.typical_range_consistent(), relative, np.nan)
+
+    def distances(self, p):
+        """
+        Returns an array of the distance in km of each station from a (latitude, longitude) pair `p`.
+        """
+        return haversine_many(self.coords, p)
+
+    def _code(self, name, value):
+        # Returns the code of a river or town name, or -1 if no station has it, from a `dict` of the codes of the
+        # names in the column `name`, which is built the first time it is used
+        codes = self._codes.get(name)
+        if codes is None:
+            categories = getattr(self, name)
+            if hasattr(categories, "tolist"):
+                categories = categories.tolist()
+            codes = self._codes[name] = {category: code for (code, category) in enumerate(categories)}
+        return codes.get(value, -1)
+
+    def river_mask(self, river):
+        """
+        Returns a boolean array of whether each station is on `river`.
+        """
+        code = self._code("rivers", river)
+        if code < 0:
+            return np.zeros(len(self), dtype=bool)
+        return self.river_codes == code
+
+    def town_mask(self, town):
+        """
+        Returns a boolean array of whether each station is in `town`.
+        """
+        code = self._code("towns", town)
+        if code < 0:
+            return np.zeros(len(self), dtype=bool)
+        return self.town_codes == code
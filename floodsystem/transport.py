@@ -0,0 +1,300 @@
+"""
+This module contains the HTTP transport used to fetch data from the Environment Agency.
+
+A transport keeps a pool of open connections for each host, so that many requests to the same host
+(such as fetching the level history of every station) reuse connections rather than opening a new one each time.
+
+Every request a transport sends goes through its `RateLimiter`, a token bucket which caps the rate requests are started
+at, combined with a cap on the number of requests in flight at once. Both adapt to how the server is coping. By default,
+the rate starts at 50 requests a second and grows with no limit while it is what holds requests back, and every
+connection in the pool may be used at once. The rate is cut when the server throttles requests (429), and the number in
+flight is cut when the server throttles requests, fails (5xx), drops connections or slows down, and grows again while
+responses are healthy. Throttled and failed requests are retried after a jittered, exponentially growing delay.
+"""
+
+import random
+import threading
+import time
+
+from . import metrics
+
+
+# Responses which mean the server is overloaded, and the request can be retried
+RETRY_STATUSES = frozenset((429, 500, 502, 503, 504))
+
+
+class RateLimiter:
+    """
+    A token bucket rate limiter with adaptive concurrency, shared by all of the requests sent by a transport.
+
+    A request may start once there is a token in the bucket, which is refilled at `rate` tokens a second up to `burst`
+    tokens, and fewer than `concurrency` requests are in flight. `concurrency` is adjusted with additive increase and
+    multiplicative decrease: each healthy response raises it by `1 / concurrency`, so it grows by about one for each
+    round of requests, and a sign of overload multiplies it by `decrease`. Overload is a 429 or 5xx response, a request
+    failing to connect or timing out, or a response taking more than `latency_factor` times the typical latency.
+    Overload of requests which were already in flight when the limits were last cut is ignored, so that one burst of
+    errors only cuts them once.
+
+    The rate adapts in the same way: a 429 response multiplies it by `decrease`, and each healthy response raises it by
+    `rate_increase` while the bucket is empty, so it only grows while it is what holds requests back.
+
+    # Inputs
+    - `rate`: the number of requests started per second at first, or `None` for no token bucket.
+    - `max_rate`: the greatest the rate grows to, or `None` for no limit.
+    - `burst`: the number of requests which can be started at once after a quiet period. Defaults to one second's
+      worth of requests at the current rate.
+    - `min_rate`: the least the rate is cut to.
+    - `rate_increase`: the number of requests per second the rate grows by for each healthy response.
+    - `concurrency`: the number of requests allowed in flight at first. Defaults to `max_concurrency`.
+    - `min_concurrency`, `max_concurrency`: the range the number of requests in flight is kept within.
+    - `decrease`: the factor the rate and concurrency are multiplied by on overload.
+    - `latency_factor`: how many times the typical latency a response must take to be counted as overload.
+    """
+
+    def __init__(self, rate=None, max_rate=None, burst=None, min_rate=1., rate_increase=0.1, concurrency=None,
+                 min_concurrency=1, max_concurrency=32, decrease=0.5, latency_factor=4.):
+        self.rate = None if rate is None else float(rate)
+        self.max_rate = max_rate
+        self._burst = burst
+        self.min_rate = min_rate
+        self.rate_increase = rate_increase
+        self.min_concurrency = min_concurrency
+        self.max_concurrency = max_concurrency
+        if concurrency is None:
+            concurrency = max_concurrency
+        self.concurrency = float(min(max(concurrency, min_concurrency), max_concurrency))
+        self.decrease = decrease
+        self.latency_factor = latency_factor
+        self.in_flight = 0
+        self.latency = None
+
+        self._condition = threading.Condition()
+        self._tokens = self.burst
+        self._refilled = time.monotonic()
+        self._resume = 0.
+        self._cut = 0.
+        self._samples = 0
+
+    def acquire(self):
+        """
+        Waits until a request may be started, and counts it as in flight. Must be followed by a call to `release`.
+
+        # Returns
+        The time the request was started at, to pass to `release`.
+        """
+        with self._condition:
+            while True:
+                now = time.monotonic()
+                if now < self._resume:
+                    # Paused by the server asking for requests to be retried later
+                    self._condition.wait(self._resume - now)
+                    continue
+                if self.in_flight >= int(self.concurrency):
+                    self._condition.wait()
+                    continue
+                if self.rate is not None:
+                    self._refill(now)
+                    if self._tokens < 1.:
+                        self._condition.wait((1. - self._tokens) / self.rate)
+                        continue
+                    self._tokens -= 1.
+                self.in_flight += 1
+                return now
+
+    def release(self, started, status=None, latency=None):
+        """
+        Counts a request as finished, and adapts the limits to how it went.
+
+        # Inputs
+        - `started`: the time the request was started at, as returned by `acquire`.
+        - `status`: the status code of the response, or `None` if the request failed to connect or timed out.
+        - `latency`: the number of seconds the response took. Defaults to the time since the request was started.
+        """
+        with self._condition:
+            now = time.monotonic()
+            if latency is None:
+                latency = now - started
+            self.in_flight -= 1
+            overloaded = status is None or status in RETRY_STATUSES
+            if not overloaded:
+                # Latency is only compared once the typical latency is known
+                if self._samples >= 10 and latency > self.latency_factor * self.latency:
+                    overloaded = True
+                    metrics.count("transport.slow_responses")
+                self.latency = latency if self.latency is None else 0.9 * self.latency + 0.1 * latency
+                self._samples += 1
+
+            if overloaded:
+                if started >= self._cut:
+                    self.concurrency = max(float(self.min_concurrency), self.concurrency * self.decrease)
+                    if self.rate is not None and status == 429:
+                        self._refill(now)
+                        self.rate = max(self.min_rate, self.rate * self.decrease)
+                    self._cut = now
+                    metrics.count("transport.backoffs")
+            else:
+                self.concurrency = min(float(self.max_concurrency), self.concurrency + 1. / self.concurrency)
+                if self.rate is not None:
+                    self._refill(now)
+                    if self._tokens < 1.:
+                        self.rate += self.rate_increase
+                        if self.max_rate is not None:
+                            self.rate = min(self.max_rate, self.rate)
+            self._condition.notify_all()
+
+    def pause(self, seconds):
+        """
+        Stops any request from starting for `seconds`, such as when the server asks for requests to be retried later.
+        """
+        with self._condition:
+            self._resume = max(self._resume, time.monotonic() + seconds)
+            self._condition.notify_all()
+
+    @property
+    def burst(self):
+        """
+        The number of tokens the bucket holds, or `None` if there is no token bucket.
+        """
+        if self.rate is None:
+            return None
+        return max(1., float(self.rate if self._burst is None else self._burst))
+
+    def _refill(self, now):
+        # Adds the tokens accrued since the last refill at the current rate
+        self._tokens = min(self.burst, self._tokens + (now - self._refilled) * self.rate)
+        self._refilled = now
+
+
+class HTTPTransport:
+    """
+    A pooled, keep-alive HTTP transport.
+
+    # Inputs
+    - `pool_connections`: the number of hosts to keep a connection pool for.
+    - `pool_maxsize`: the maximum number of connections kept open to each host.
+      This should be at least the number of requests made to a host at once.
+    - `connect_timeout`: the number of seconds to wait for a connection to be made.
+    - `read_timeout`: the number of seconds to wait between bytes received from the server.
+    - `rate`: the number of requests started per second at first, which grows with no limit while responses are
+      healthy and is cut when the server throttles requests, or `None` for no token bucket.
+    - `limiter`: the `RateLimiter` to send requests through. Defaults to a new one with `rate`, which starts with
+      `pool_maxsize` requests allowed in flight and only cuts them when the server is overloaded.
+    - `max_retries`: the number of times a throttled or failed request is retried.
+    - `retry_delay`: the number of seconds the delay before retrying is drawn up to, which doubles with each retry,
+      unless the server gives a longer delay with `Retry-After`.
+    - `max_retry_delay`: the greatest number of seconds to wait before retrying, and to hold back other requests
+      for when the server asks for a delay with `Retry-After`.
+    """
+
+    def __init__(self, pool_connections=4, pool_maxsize=32, connect_timeout=10., read_timeout=60., rate=50.,
+                 limiter=None, max_retries=4, retry_delay=0.5, max_retry_delay=30.):
+        # requests is imported here rather than with the module, as it is slow to import and isn't needed until
+        # something is fetched
+        import requests
+        from requests.adapters import HTTPAdapter
+
+        self.timeout = (connect_timeout, read_timeout)
+        self.limiter = RateLimiter(rate=rate, max_concurrency=pool_maxsize) if limiter is None else limiter
+        self.max_retries = max_retries
+        self.retry_delay = retry_delay
+        self.max_retry_delay = max_retry_delay
+        self._transient_errors = (requests.ConnectionError, requests.Timeout)
+
+        self.session = requests.Session()
+        adapter = HTTPAdapter(pool_connections=pool_connections, pool_maxsize=pool_maxsize)
+        self.session.mount("http://", adapter)
+        self.session.mount("https://", adapter)
+        # Responses are large JSON documents, which compress very well
+        self.session.headers.update({"Accept": "application/json", "Accept-Encoding": "gzip, deflate"})
+
+    def get(self, url, headers=None, stream=False):
+        """
+        Sends a GET request to `url`, with any extra `headers`, and returns the `requests.Response`.
+
+        If `stream` is `True`, the body is not downloaded until it is read from the response.
+
+        The request waits for the rate limiter, and is retried after a jittered delay if it is throttled, fails with
+        a 5xx response, fails to connect or times out. Once the retries run out, the last response is returned, or the
+        last error raised.
+        """
+        attempt = 0
+        while True:
+            started = self.limiter.acquire()
+            try:
+                r = self.session.get(url, headers=headers, timeout=self.timeout, stream=stream)
+            except self._transient_errors:
+                self.limiter.release(started)
+                if attempt >= self.max_retries:
+                    raise
+                wait = None
+            else:
+                self.limiter.release(started, r.status_code)
+                if r.status_code not in RETRY_STATUSES or attempt >= self.max_retries:
+                    return r
+                if r.status_code == 429:
+                    metrics.count("transport.throttled")
+                wait = _retry_after(r)
+                r.close()
+
+            if wait is not None:
+                # Hold back every request, not just this one, until the server is ready
+                wait = min(wait, self.max_retry_delay)
+                self.limiter.pause(wait)
+            delay = random.uniform(0., min(self.max_retry_delay, self.retry_delay * 2 ** attempt))
+            time.sleep(max(delay, wait or 0.))
+            attempt += 1
+            metrics.count("transport.retries")
+
+    def get_json(self, url):
+        """
+        Sends a GET request to `url` and returns the decoded JSON response.
+
+        Raises `requests.HTTPError` if the response is an error, once any retries have run out.
+        """
+        r = self.get(url)
+        metrics.count("transport.bytes", len(r.content))
+        r.raise_for_status()
+        return r.json()
+
+    def close(self):
+        """
+        Closes all of the open connections.
+        """
+        self.session.close()
+
+
+def _retry_after(r):
+    # The number of seconds the server asks for before a retry, or None
+    try:
+        return max(0., float(r.headers.get("Retry-After")))
+    except (TypeError, ValueError):
+        return None
+
+
+_transport = None
+_transport_lock = threading.Lock()
+
+
+def get_transport():
+    """
+    Returns the transport shared by all of the fetching functions, creating it if needed.
+    """
+    global _transport
+    with _transport_lock:
+        if _transport is None:
+            _transport = HTTPTransport()
+        return _transport
+
+
+def set_transport(transport):
+    """
+    Replaces the transport shared by all of the fetching functions, returning the previous one.
+
+    # Inputs
+    - `transport`: an object with the same methods as `HTTPTransport`, or `None` to use a new default transport.
+    """
+    global _transport
+    with _transport_lock:
+        previous = _transport
+        _transport = transport
+        return previous
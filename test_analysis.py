@@ -0,0 +1,107 @@
+"""Unit test for the analysis module"""
+
+import datetime
+import random
+
+import numpy as np
+import pytest
+
+from floodsystem.analysis import SlidingPolyfit, fill_missing_levels, polyfit, polyfit_many
+from floodsystem.flood import assess_risk, get_risk_level, get_risk_levels
+
+
+def random_histories(n):
+    rng = random.Random(0)
+    start = datetime.datetime(2024, 1, 1, tzinfo=datetime.timezone.utc)
+    histories = []
+    for _ in range(n):
+        length = rng.randint(1, 300)
+        dates = [start + datetime.timedelta(minutes=15 * i + rng.randint(0, 5)) for i in range(length)]
+        a, b, c = rng.uniform(-1, 1), rng.uniform(-1, 1), rng.uniform(0, 2)
+        levels = [c + b * i / 96 + a * (i / 96)**2 + rng.gauss(0, 0.05) for i in range(length)]
+        for i in rng.sample(range(length), length // 10):
+            levels[i] = None
+        histories.append((dates, levels))
+    return histories
+
+
+def test_fill_missing_levels():
+    assert list(fill_missing_levels([None, None, 0.5, None, 0.7, None])) == [1., 1., 0.5, 0.5, 0.7, 0.7]
+    assert list(fill_missing_levels(np.array([0.2, np.nan]))) == [0.2, 0.2]
+    assert len(fill_missing_levels([])) == 0
+
+
+def test_polyfit_many():
+    histories = random_histories(200)
+    dates = [h[0] for h in histories]
+    levels = [h[1] for h in histories]
+
+    # Small batches test that batching doesn't change the fits
+    for max_batch_size in [1000, 2**21]:
+        fits = polyfit_many(dates, levels, 3, max_batch_size=max_batch_size)
+        for (d, l, (polynomial, offset)) in zip(dates, levels, fits):
+            expected, expected_offset = polyfit(d, l, 3) if len(d) > 3 else (None, None)
+            if expected is not None:
+                assert offset == expected_offset
+                assert np.allclose(polynomial.coeffs, expected.coeffs, rtol=1e-6, atol=1e-8)
+    assert polyfit_many([], [], 3) == []
+
+
+@pytest.mark.filterwarnings("ignore:Polyfit may be poorly conditioned")
+def test_get_risk_levels():
+    histories = random_histories(200) + [([], [])]
+    risks = get_risk_levels(histories, 3)
+    assert risks[-1] == 2
+    assert risks[:-1] == [get_risk_level(dates, levels, 3) for (dates, levels) in histories[:-1]]
+
+
+def test_sliding_polyfit():
+    rng = random.Random(1)
+    start = datetime.datetime(2024, 1, 1, tzinfo=datetime.timezone.utc)
+    dates = [start + datetime.timedelta(minutes=15 * i) for i in range(1500)]
+    levels = [None, None] + [0.5 + 0.3 * np.sin(i / 200) + rng.gauss(0, 0.02) for i in range(1498)]
+    for i in rng.sample(range(1500), 100):
+        levels[i] = None
+    window = datetime.timedelta(days=2)
+
+    fitter = SlidingPolyfit(3, window)
+    filled = fill_missing_levels(levels)
+    for i in range(len(dates)):
+        fitter.add(dates[i], levels[i])
+        if i < 3 or (i % 97 and i != len(dates) - 1):
+            continue
+
+        # The same readings as fetching the window back from the latest reading
+        first = next(j for j in range(i + 1) if dates[j] >= dates[i] - window)
+        assert len(fitter) == i + 1 - first
+        expected, expected_offset = polyfit(dates[first:i + 1], filled[first:i + 1], 3)
+        polynomial, offset = fitter.fit()
+        assert offset == expected_offset
+        x = np.linspace(0, 2, 50)
+        assert np.allclose(polynomial(x), expected(x), rtol=0, atol=1e-8)
+        assert np.allclose(polynomial.coeffs, expected.coeffs, rtol=1e-6, atol=1e-8)
+
+        t, level = fitter.latest_reading
+        assert level == filled[i]
+        assert assess_risk(polynomial, t - offset, level) == get_risk_level(dates[first:i + 1], filled[first:i + 1], 3)
+
+
+def test_sliding_polyfit_expire():
+    start = datetime.datetime(2024, 1, 1)
+    dates = np.array([start + datetime.timedelta(hours=i) for i in range(100)], dtype="datetime64[us]")
+    levels = 0.1 * np.arange(100.) - 0.002 * np.arange(100.)**2
+
+    fitter = SlidingPolyfit(2)
+    fitter.extend(dates[:60], levels[:60])
+    fitter.expire(datetime.datetime(2024, 1, 2))
+    fitter.extend(dates[60:], levels[60:])
+    polynomial, offset = fitter.fit()
+    expected, expected_offset = polyfit(dates[24:], levels[24:], 2)
+    assert np.isclose(offset, expected_offset)
+    assert np.allclose(polynomial.coeffs, expected.coeffs, rtol=1e-6, atol=1e-8)
+
+    with pytest.raises(ValueError):
+        fitter.add(dates[0], 1.)
+    fitter.expire(datetime.datetime(2025, 1, 1))
+    with pytest.raises(ValueError):
+        fitter.fit()
@@ -0,0 +1,68 @@
+"""Unit test for the bincache module"""
+
+import json
+import os
+
+import numpy as np
+
+from floodsystem import datafetcher
+from floodsystem.bincache import StringColumn, read_station_table, write_station_table
+from floodsystem.cache import CachePolicy
+from floodsystem.stationdata import build_station_list
+from floodsystem.stationtable import StationTable
+from test_flood import dummy_stations
+from test_stationdata import station_items
+
+
+def test_string_column():
+    strings = ["", "River Cam", "Afon Dyfrdwy", "Rivière", ""]
+    column = StringColumn.from_strings(strings)
+    assert len(column) == 5
+    assert list(column) == strings
+    assert column[-2] == "Rivière" and column[1:3] == strings[1:3]
+    assert "River Cam" in column and column.index("Afon Dyfrdwy") == 2
+
+
+def test_round_trip(tmp_path):
+    stations = dummy_stations()
+    table = StationTable.from_stations(stations)
+    path = str(tmp_path / "stations.bin")
+    write_station_table(table, path, source={"size": 1})
+
+    loaded, source = read_station_table(path)
+    assert source == {"size": 1}
+    assert isinstance(loaded.lat, np.memmap)
+    for name in ["lat", "long", "typical_low", "typical_high", "river_codes", "town_codes"]:
+        assert np.array_equal(getattr(loaded, name), getattr(table, name), equal_nan=True)
+    for (station, view) in zip(stations, loaded.to_stations()):
+        for attribute in ["station_id", "measure_id", "name", "coord", "typical_range", "river", "town"]:
+            assert getattr(view, attribute) == getattr(station, attribute)
+    assert np.isnan(loaded.latest_level).all()
+    assert np.array_equal(loaded.river_mask("River 3"), table.river_mask("River 3"))
+    assert np.array_equal(loaded.town_mask("Town 3"), table.town_mask("Town 3")) and not loaded.town_mask(None).any()
+
+    # A file written from a different source isn't read
+    assert read_station_table(path, source={"size": 1})[1] == {"size": 1}
+    assert read_station_table(path, source={"size": 2}) is None
+
+    write_station_table(StationTable.from_stations([]), path)
+    assert len(read_station_table(path)[0]) == 0
+    assert read_station_table(str(tmp_path / "missing.bin")) is None
+
+
+def test_build_station_list_binary(monkeypatch, tmp_path):
+    policy = CachePolicy(directory=str(tmp_path))
+    monkeypatch.setattr(datafetcher, "cache_policy", policy)
+    with open(policy.path("station_data"), "w") as f:
+        json.dump({"items": station_items(100)}, f)
+
+    expected = [repr(s) for s in build_station_list()]
+    # The first build writes the binary cache, and the second reads it
+    assert [repr(s) for s in build_station_list(binary=True)] == expected
+    assert os.path.exists(str(tmp_path / "station_data.bin"))
+    assert [repr(s) for s in build_station_list(binary=True)] == expected
+
+    # Changed station data isn't read from the out of date binary cache
+    with open(policy.path("station_data"), "w") as f:
+        json.dump({"items": station_items(50)}, f)
+    assert len(build_station_list(binary=True)) == len(build_station_list())
@@ -0,0 +1,124 @@
+"""Unit test for the cache module"""
+
+import json
+import os
+import threading
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+import pytest
+import requests
+
+from floodsystem.cache import CachePolicy
+from floodsystem.transport import HTTPTransport
+
+
+class ConditionalHandler(BaseHTTPRequestHandler):
+    """Serves `server.body` with an ETag, and a 304 when the client already has it, or `server.status` if it is set"""
+    protocol_version = "HTTP/1.1"
+
+    def do_GET(self):
+        server = self.server
+        etag = '"v{}"'.format(server.version)
+        server.requests.append(dict(self.headers))
+        if server.status is not None:
+            self.send_response(server.status)
+            self.send_header("Content-Length", "0")
+            self.end_headers()
+            return
+        if self.headers.get("If-None-Match") == etag:
+            self.send_response(304)
+            self.send_header("ETag", etag)
+            self.send_header("Content-Length", "0")
+            self.end_headers()
+            return
+        body = json.dumps(server.body).encode()
+        self.send_response(200)
+        self.send_header("Content-Type", "application/json")
+        self.send_header("ETag", etag)
+        self.send_header("Last-Modified", "Mon, 01 Jan 2024 00:00:00 GMT")
+        self.send_header("Content-Length", str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def log_message(self, *args):
+        pass
+
+
+def start_server(body):
+    server = ThreadingHTTPServer(("127.0.0.1", 0), ConditionalHandler)
+    server.version, server.body, server.requests, server.status = 1, body, [], None
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    return server, "http://127.0.0.1:{}/id/stations".format(server.server_address[1])
+
+
+def test_ttl(tmp_path):
+    server, url = start_server({"items": [1, 2]})
+    try:
+        policy = CachePolicy({"station_data": 60}, directory=str(tmp_path))
+        assert policy.fetch("station_data", url) == {"items": [1, 2]}
+        assert os.path.exists(policy.path("station_data"))
+
+        # Within the TTL the cached copy is used without any requests
+        assert policy.fetch("station_data", url) == {"items": [1, 2]}
+        assert len(server.requests) == 1
+
+        # A different URL is never served from the cache
+        assert policy.is_fresh("station_data", url) and not policy.is_fresh("station_data", url + "?other")
+    finally:
+        server.shutdown()
+
+
+def test_conditional_request(tmp_path):
+    server, url = start_server({"items": [1, 2]})
+    try:
+        policy = CachePolicy({"level_data": 0}, directory=str(tmp_path))
+        assert policy.fetch("level_data", url) == {"items": [1, 2]}
+        assert "If-None-Match" not in server.requests[-1]
+
+        # Expired but unchanged: the server replies 304 and the cached copy is used
+        assert policy.fetch("level_data", url) == {"items": [1, 2]}
+        assert server.requests[-1]["If-None-Match"] == '"v1"'
+        assert server.requests[-1]["If-Modified-Since"] == "Mon, 01 Jan 2024 00:00:00 GMT"
+
+        # Changed upstream: the new data is downloaded and cached
+        server.version, server.body = 2, {"items": [3]}
+        assert policy.fetch("level_data", url) == {"items": [3]}
+        assert policy.load_meta("level_data")["etag"] == '"v2"'
+
+        # Revalidating fresh data still checks for changes
+        policy.ttls["level_data"] = 60
+        policy.fetch("level_data", url, revalidate=True)
+        assert len(server.requests) == 4
+    finally:
+        server.shutdown()
+
+
+def test_stale_if_error(tmp_path):
+    server, url = start_server({"items": [1, 2]})
+    transport = HTTPTransport(max_retries=1, retry_delay=0.01)
+    try:
+        policy = CachePolicy({"station_data": 0}, directory=str(tmp_path))
+        assert policy.fetch("station_data", url, transport=transport) == {"items": [1, 2]}
+
+        # Once the TTL has run out, the cached copy is still used while the server fails
+        server.status = 503
+        assert policy.fetch("station_data", url, transport=transport) == {"items": [1, 2]}
+        assert len(server.requests) == 3
+
+        # Responses which aren't the resource are never decoded
+        server.status = 204
+        assert policy.fetch("station_data", url, transport=transport) == {"items": [1, 2]}
+        with pytest.raises(requests.HTTPError):
+            CachePolicy(directory=str(tmp_path / "empty")).fetch("station_data", url, transport=transport)
+        server.status = 503
+        with pytest.raises(requests.HTTPError):
+            CachePolicy(directory=str(tmp_path / "empty")).fetch("station_data", url, transport=transport)
+    finally:
+        server.shutdown()
+        server.server_close()
+
+    # And while the server can't be reached
+    assert policy.fetch("station_data", url, transport=transport) == {"items": [1, 2]}
+    with pytest.raises(requests.ConnectionError):
+        CachePolicy(directory=str(tmp_path / "empty")).fetch("station_data", url, transport=transport)
+    transport.close()
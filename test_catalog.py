@@ -0,0 +1,53 @@
+"""Unit test for the catalog module"""
+
+from floodsystem.catalog import StationCatalog, top_counts
+from floodsystem.geo import rivers_station_number, rivers_with_station, stations_by_river
+from floodsystem.station import MonitoringStation
+
+
+def dummy_stations():
+    rivers = ["River A", "River B", "River A", "River C", "River B", "River D", "River C", None]
+    towns = ["Town 1", None, "Town 2", "Town 1", "Town 1", "Town 2", None, "Town 3"]
+    return [MonitoringStation(f"http://example.com/id/stations/{k}", f"http://example.com/id/measures/{k}",
+                              f"Station {k}", (0, 0), (0.1, 0.5), river, town)
+            for (k, (river, town)) in enumerate(zip(rivers, towns))]
+
+
+def test_top_counts():
+    counts = {"a": 1, "b": 3, "c": 2, "d": 3, "e": 2, "f": 2}
+    assert top_counts(counts, 1) == [("b", 3), ("d", 3)]
+    assert top_counts(counts, 3) == [("b", 3), ("d", 3), ("c", 2), ("e", 2), ("f", 2)]
+    assert top_counts(counts, 6) == [("b", 3), ("d", 3), ("c", 2), ("e", 2), ("f", 2), ("a", 1)]
+    assert top_counts(counts, 10) == top_counts(counts, 6)
+    assert top_counts(counts, 0) == []
+    assert top_counts({}, 3) == []
+
+
+def test_station_catalog():
+    stations = dummy_stations()
+    catalog = StationCatalog(stations)
+
+    assert len(catalog) == len(stations) and list(catalog) == stations and catalog[2] is stations[2]
+    assert catalog.stations_by_river() == stations_by_river(stations)
+    assert catalog.rivers_with_station() == ["River A", "River B", "River C", "River D", None]
+    assert catalog.stations_by_town()["Town 1"] == [stations[0], stations[3], stations[4]]
+    assert catalog.river_station_counts() == {"River A": 2, "River B": 2, "River C": 2, "River D": 1, None: 1}
+    for N in range(1, 7):
+        assert catalog.rivers_station_number(N) == rivers_station_number(stations, N)
+
+    # The geo functions reuse the catalog's indexes
+    assert stations_by_river(catalog) is catalog.stations_by_river()
+    assert set(rivers_with_station(catalog)) == set(rivers_with_station(stations))
+    assert rivers_station_number(catalog, 1) == rivers_station_number(stations, 1)
+
+    # Indexes are rebuilt when the station list changes length, or when told to
+    stations.append(MonitoringStation("s", "m", "Station 8", (0, 0), None, "River D", "Town 3"))
+    assert catalog.river_station_counts()["River D"] == 2
+    stations[-1].river = "River E"
+    assert catalog.river_station_counts()["River D"] == 2
+    catalog.invalidate()
+    assert catalog.river_station_counts()["River D"] == 1
+    assert catalog.rivers_station_number(1) == [("River A", 2), ("River B", 2), ("River C", 2)]
+
+    catalog.update(stations[:2])
+    assert catalog.rivers_with_station() == ["River A", "River B"]
@@ -35,3 +35,127 @@ def test_build_station_list():
         station_cam.measure_id, dt=datetime.timedelta(days=dt))
     assert len(dates10) == len(levels10)
     assert len(dates10) > len(levels2)
+
+
+def test_parse_datetimes():
+    import dateutil.parser
+    import numpy as np
+    from floodsystem.datafetcher import parse_datetimes, parse_datetime64
+
+    strings = ["2024-02-29T23:45:00Z", "1999-12-31T23:59:59Z", "2024-03-01T01:02:03+01:00", "2024-06-01T12:00:00"]
+    expected = [dateutil.parser.parse(s) for s in strings[:3]]
+
+    # Timezone aware datetimes are the same as dateutil's
+    assert parse_datetimes(strings[:3]) == expected
+    assert all(d.utcoffset() == e.utcoffset() for (d, e) in zip(parse_datetimes(strings[:3]), expected))
+
+    # The whole batch is converted to UTC, with times with no time zone taken to be UTC
+    assert list(parse_datetime64(strings)) == [np.datetime64(s, "s") for s in [
+        "2024-02-29T23:45:00", "1999-12-31T23:59:59", "2024-03-01T00:02:03", "2024-06-01T12:00:00"]]
+    assert len(parse_datetime64([])) == 0
+
+
+def test_fetch_measure_levels_order(tmp_path, stub):
+    from floodsystem.readingstore import ReadingStore
+
+    # Readings are served newest first but returned oldest first, so the last reading is the latest,
+    # as the risk assessment takes it to be
+    measure_id = build_station_list()[2].measure_id
+    latest_level = stub.readings[measure_id][-1][1]
+    dt = datetime.timedelta(days=1)
+    reading_store = ReadingStore(str(tmp_path))
+    for (as_series, store) in ((False, None), (True, None), (False, reading_store), (False, reading_store)):
+        dates, levels = fetch_measure_levels(measure_id, dt, store=store, as_series=as_series)
+        assert list(dates) == sorted(dates) and len(dates) == 8
+        assert levels[-1] == latest_level
+
+
+def test_fetch_all_measure_levels(monkeypatch, stub):
+    import numpy as np
+    from floodsystem import datafetcher
+    from floodsystem.datafetcher import fetch_all_measure_levels
+    from floodsystem.flood import get_all_town_risk_levels
+
+    stations = build_station_list()
+    measure_ids = [station.measure_id for station in stations]
+    dt = datetime.timedelta(days=1)
+
+    # Every measure's readings are fetched in a few pages, the same as fetching them one measure at a time
+    bulk = fetch_all_measure_levels(dt, measure_ids + ["http://example.com/id/measures/none"], page_size=70)
+    assert stub.paths["/data/readings"] == -(-30 * 8 // 70)
+    assert bulk.pop("http://example.com/id/measures/none") == ([], [])
+    assert list(bulk) == measure_ids
+    for measure_id in measure_ids:
+        assert bulk[measure_id] == fetch_measure_levels(measure_id, dt)
+        assert bulk[measure_id][0] == sorted(bulk[measure_id][0])
+
+    series = fetch_all_measure_levels(dt, as_series=True, page_size=1000)
+    assert set(series) == set(measure_ids)
+    assert np.array_equal(series[measure_ids[3]].times, fetch_measure_levels(measure_ids[3], dt, as_series=True).times)
+
+    # Town risk levels are the same with far fewer requests
+    stub.requests.clear()
+    expected = get_all_town_risk_levels(stations, 1, 3, False)
+    assert sum(stub.requests.values()) == 20
+    stub.paths.clear()
+    stub.requests.clear()
+    assert get_all_town_risk_levels(stations, 1, 3, False, bulk=True) == expected
+    assert sum(stub.requests.values()) == 0 and stub.paths["/data/readings"] == 1
+
+    # A reading which arrives while paging shifts the pages, but readings seen twice are only returned once
+    monkeypatch.setattr(datafetcher, "READINGS_PAGE_SIZE", 50)
+    fetch = datafetcher.fetch
+    def fetch_while_adding(url, transport=None):
+        if "_offset=50&" in url + "&":
+            stub.add_reading(0, 0.9)
+        return fetch(url, transport)
+    monkeypatch.setattr(datafetcher, "fetch", fetch_while_adding)
+    added = fetch_all_measure_levels(dt)
+    assert len(added[measure_ids[0]][0]) == len(set(added[measure_ids[0]][0])) == 8
+    assert sum(len(dates) for (dates, levels) in added.values()) == 30 * 8
+
+
+def test_iter_measure_levels(monkeypatch, stub):
+    from floodsystem import datafetcher
+    from floodsystem.analysis import SlidingPolyfit, polyfit
+    from floodsystem.datafetcher import iter_measure_levels
+
+    measure_id = build_station_list()[3].measure_id
+    dt = datetime.timedelta(days=1)
+    dates, levels = fetch_measure_levels(measure_id, dt)
+    assert len(dates) == 8 and stub.requests[measure_id] == 1
+
+    # Readings are yielded a window at a time in date order, although they are served newest first
+    for page_size in (3, 4, 100):
+        pages = list(iter_measure_levels(measure_id, dt, page_size=page_size))
+        assert [d for (page_dates, _) in pages for d in page_dates] == dates
+        assert [level for (_, page_levels) in pages for level in page_levels] == levels
+
+    # A window spans as many days as fit in a page, so a short history takes one request
+    stub.requests.clear()
+    assert len(list(iter_measure_levels(measure_id, datetime.timedelta(days=3)))) == 1
+    assert stub.requests[measure_id] == 1
+
+    # Small pages give a window a day, and days with no readings aren't yielded
+    series = list(iter_measure_levels(measure_id, datetime.timedelta(days=3), as_series=True, page_size=3))
+    assert len(series) == len({d.date() for d in dates})
+
+    # Windows can be fitted incrementally, with the same result as fitting the whole history
+    fit = SlidingPolyfit(3)
+    for page in series:
+        fit.extend(*page)
+    poly, d0 = fit.fit()
+    expected, expected_d0 = polyfit(dates, levels, 3)
+    assert abs(d0 - expected_d0) < 1e-9
+    assert all(abs(poly(x) - expected(x)) < 1e-6 for x in (0., 0.05, 0.1))
+
+    # A reading which arrives while paging shifts the pages, but readings seen twice are only yielded once
+    fetch = datafetcher.fetch
+    def fetch_while_adding(url, transport=None):
+        if "_offset=3&" in url + "&":
+            stub.add_reading(3, 0.9)
+        return fetch(url, transport)
+    monkeypatch.setattr(datafetcher, "fetch", fetch_while_adding)
+    pages = list(iter_measure_levels(measure_id, dt, page_size=3))
+    streamed = [d for (page_dates, _) in pages for d in page_dates]
+    assert streamed == sorted(set(streamed)) and set(dates) <= set(streamed)
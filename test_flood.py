@@ -1,7 +1,10 @@
 """Unit test for the flood module"""
 
 from floodsystem.station import MonitoringStation
-from floodsystem.flood import stations_level_over_threshold, stations_highest_rel_level
+from floodsystem.flood import stations_level_over_threshold, stations_highest_rel_level, relative_water_levels
+
+import numpy as np
+import pytest
 
 
 def dummy_stations():
@@ -24,3 +27,88 @@ def test_stations_highest_rel_level():
     stations = dummy_stations()
 
     assert stations_highest_rel_level(stations,2) == [stations[3], stations[1]]
+    # Stations with no relative level come last, in their original order
+    assert stations_highest_rel_level(stations,10) == [stations[3], stations[1], stations[0], stations[2], stations[4]]
+    assert stations_highest_rel_level(stations,0) == []
+
+def test_bulk_relative_levels():
+    from floodsystem.stationtable import StationTable
+    stations = dummy_stations()
+    table = StationTable.from_stations(stations)
+
+    levels = relative_water_levels(stations)
+    assert [None if np.isnan(l) else l for l in levels] == [s.relative_water_level() for s in stations]
+    assert np.array_equal(levels, relative_water_levels(table), equal_nan=True)
+
+    # A table gives the same results as the list of stations it was built from
+    assert stations_level_over_threshold(table, -1) == stations_level_over_threshold(stations, -1)
+    assert [s.name for s in stations_highest_rel_level(table, 3)] == [s.name for s in stations_highest_rel_level(stations, 3)]
+
+def dummy_histories(monkeypatch):
+    # Replace fetching over the Internet with fake level histories, returned after a random delay so that
+    # concurrent requests finish out of order
+    import datetime
+    import random
+    import time
+    import floodsystem.flood
+    from floodsystem.series import LevelSeries
+
+    now = datetime.datetime(2024, 1, 1)
+    def fake_fetch_measure_levels(measure_id, dt, store=None, as_series=False):
+        time.sleep(random.random() * 0.01)
+        k = int(measure_id.rsplit("/", 1)[-1])
+        dates = [now - datetime.timedelta(hours=h) for h in range(48, 0, -1)]
+        levels = [0.5 + 0.02 * k * (48 - h) * (-1)**k for h in range(48, 0, -1)]
+        if as_series:
+            return LevelSeries.from_lists(dates, levels)
+        return dates, levels
+    monkeypatch.setattr(floodsystem.flood, "fetch_measure_levels", fake_fetch_measure_levels)
+
+    stations = list()
+    for k in range(40):
+        stations.append(MonitoringStation(f"http://example.com/id/stations/{k}", f"http://example.com/id/measures/{k}",
+                                          f"Station {k}", (0,0), (0.2,1.0), f"River {k % 3}", f"Town {k % 7}"))
+    return stations
+
+def test_get_all_town_risk_levels_concurrent(monkeypatch):
+    from floodsystem.flood import get_all_town_risk_levels
+    stations = dummy_histories(monkeypatch)
+
+    sequential = get_all_town_risk_levels(stations, 2, 3, False)
+    assert sum(len(towns) for towns in sequential) == 7
+    for max_workers in (1, 4, 16):
+        assert get_all_town_risk_levels(stations, 2, 3, False, max_workers=max_workers) == sequential
+
+def test_fetch_station_histories_error(monkeypatch):
+    import time
+    import floodsystem.flood
+    from floodsystem.flood import fetch_station_histories
+    stations = dummy_histories(monkeypatch)
+
+    # A failed fetch is raised without waiting for the rest of the stations to be fetched
+    fetched = list()
+    def failing_fetch_measure_levels(measure_id, dt, store=None, as_series=False):
+        fetched.append(measure_id)
+        if len(fetched) == 3:
+            raise ConnectionError("fetch failed")
+        time.sleep(0.01)
+    monkeypatch.setattr(floodsystem.flood, "fetch_measure_levels", failing_fetch_measure_levels)
+    with pytest.raises(ConnectionError):
+        list(fetch_station_histories(stations, 2, max_workers=2))
+    assert len(fetched) < 10
+
+def test_get_all_town_risk_levels_processes(monkeypatch):
+    from floodsystem.flood import get_all_town_risk_levels, get_risk_levels, get_town_severities
+    from test_analysis import random_histories
+    stations = dummy_histories(monkeypatch)
+    stations[5].typical_range = (1.0, 0.2)
+
+    # Fitting in other processes gives the same risk levels and town severities
+    sequential = get_all_town_risk_levels(stations, 2, 3, False)
+    assert get_all_town_risk_levels(stations, 2, 3, False, processes=2) == sequential
+
+    histories = random_histories(300) + [([], [])]
+    towns = [f"Town {k % 11}" for k in range(len(histories))]
+    assert get_risk_levels(histories, 3, processes=3) == get_risk_levels(histories, 3)
+    assert get_town_severities(histories, towns, 3, processes=3) == get_town_severities(histories, towns, 3)
+    assert get_risk_levels([], 3, processes=2) == []
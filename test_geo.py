@@ -2,6 +2,7 @@
 
 from floodsystem.station import MonitoringStation
 from floodsystem.geo import stations_by_distance, stations_within_radius, rivers_with_station, stations_by_river, haversine, rivers_station_number
+from floodsystem.geo import haversine_many, station_coords
 
 from math import pi
 
@@ -19,6 +20,21 @@ def test_haversine():
     assert abs(haversine((0, 0), (0, 90)) - (pi * 6371 / 2)) < 0.01
     assert abs(haversine((0, 0), (18.31, 90)) - (pi * 6371 / 2)) < 0.01
 
+def test_haversine_many():
+    stations = dummy_stations()
+    coords = station_coords(stations)
+    points = [(0, 90), (52.2053, 0.1218), (-30, -30)]
+
+    # A single point gives a distance to each station, many points give a distance matrix
+    distances = haversine_many(coords, points[0])
+    matrix = haversine_many(coords, points)
+    assert distances.shape == (3,) and matrix.shape == (3, 3)
+    for i, point in enumerate(points):
+        for j, station in enumerate(stations):
+            assert abs(matrix[i, j] - haversine(station.coord, point)) < 1e-6
+    assert abs(haversine_many([(0, 0)], (0, 180))[0] - pi * 6371) < 0.01
+    assert haversine_many(station_coords([]), points).shape == (3, 0)
+
 def test_stations_by_distance():
     # Get dummy stations
     stations = dummy_stations()
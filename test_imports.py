@@ -0,0 +1,13 @@
+"""Unit test for lazily imported dependencies"""
+
+import subprocess
+import sys
+
+
+def test_lazy_imports():
+    # Importing the package doesn't load matplotlib, requests or dateutil until they are needed
+    script = ("import sys\n"
+              "import floodsystem.flood, floodsystem.stationdata, floodsystem.plot, floodsystem.monitor\n"
+              "print(' '.join(m for m in ('matplotlib', 'requests', 'dateutil') if m in sys.modules))\n")
+    output = subprocess.run([sys.executable, "-c", script], check=True, capture_output=True, text=True).stdout
+    assert output.strip() == ""
@@ -0,0 +1,51 @@
+"""Unit test for the jsonstream module"""
+
+import json
+
+import pytest
+
+from floodsystem.jsonstream import iter_items
+
+
+def chunked(text, size):
+    return [text[i:i + size] for i in range(0, len(text), size)]
+
+
+def test_iter_items():
+    data = {
+        "@context": "http://example.com/context.jsonld",
+        "meta": {"items": ["not", "these"], "limit": 12345},
+        "items": [{"@id": "a", "lat": 52.25, "value": [1, 2]}, 12345678, "a string with ] and }", None, []],
+        "count": 98765,
+    }
+    text = json.dumps(data, indent=1)
+
+    # Splitting the text anywhere gives the same items, including numbers split between chunks
+    for size in [1, 2, 3, 7, 64, len(text)]:
+        assert list(iter_items(chunked(text, size))) == data["items"]
+    assert list(iter_items(chunked(text, 5), key="meta")) == []
+
+
+def test_iter_items_empty():
+    assert list(iter_items(['{"items": []}'])) == []
+    assert list(iter_items(["{}"])) == []
+    assert list(iter_items(['{"other": 1}'])) == []
+
+
+def test_iter_items_drains_chunks():
+    read = []
+
+    def chunks():
+        yield '{"items": [1, 2]}'
+        read.append(True)
+        yield "  \n"
+
+    assert list(iter_items(chunks())) == [1, 2]
+    assert read
+
+
+def test_iter_items_invalid():
+    with pytest.raises(ValueError):
+        list(iter_items(['{"items": [1, 2}']))
+    with pytest.raises(ValueError):
+        list(iter_items(['[1, 2]']))
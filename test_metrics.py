@@ -0,0 +1,82 @@
+"""Unit test for the metrics module"""
+
+import datetime
+
+import pytest
+
+from floodsystem import metrics
+
+
+@pytest.fixture
+def enabled():
+    was_enabled = metrics.is_enabled()
+    metrics.reset()
+    metrics.enable()
+    yield
+    metrics.reset()
+    if not was_enabled:
+        metrics.disable()
+
+
+def test_disabled():
+    was_enabled = metrics.is_enabled()
+    metrics.disable()
+    metrics.reset()
+    try:
+        metrics.count("test.counter")
+        with metrics.timer("test.timer"):
+            pass
+        assert metrics.report() == {"counters": {}, "timers": {}}
+    finally:
+        if was_enabled:
+            metrics.enable()
+
+
+def test_counters_and_timers(enabled):
+    metrics.count("test.counter")
+    metrics.count("test.counter", 4)
+    for _ in range(3):
+        with metrics.timer("test.timer"):
+            pass
+    with pytest.raises(ValueError):
+        with metrics.timer("test.failing"):
+            raise ValueError
+
+    snapshot = metrics.report()
+    assert snapshot["counters"] == {"test.counter": 5}
+    assert snapshot["timers"]["test.timer"]["count"] == 3
+    assert snapshot["timers"]["test.failing"]["count"] == 1
+    stats = snapshot["timers"]["test.timer"]
+    assert 0 <= stats["min"] <= stats["mean"] <= stats["max"] <= stats["total"]
+
+    text = metrics.format_report()
+    assert "test.timer" in text and "test.counter" in text
+
+    exported = metrics.export_prometheus().splitlines()
+    assert "# TYPE floodsystem_test_counter_total counter" in exported
+    assert "floodsystem_test_counter_total 5" in exported
+    assert "# TYPE floodsystem_test_timer_seconds summary" in exported
+    assert "floodsystem_test_timer_seconds_count 3" in exported
+    assert any(line.startswith("floodsystem_test_timer_seconds_sum ") for line in exported)
+
+    metrics.reset()
+    assert metrics.report() == {"counters": {}, "timers": {}}
+
+
+def test_instrumented(enabled, monkeypatch):
+    from floodsystem import datafetcher
+    from floodsystem.analysis import polyfit
+    from floodsystem.stationdata import build_station_list
+    from test_stationdata import station_items
+
+    monkeypatch.setattr(datafetcher, "fetch_station_data", lambda use_cache=True: {"items": station_items(50)})
+    stations = build_station_list()
+
+    start = datetime.datetime(2024, 1, 1)
+    dates = [start + datetime.timedelta(hours=i) for i in range(10)]
+    polyfit(dates, [0.1 * i for i in range(10)], 3)
+
+    snapshot = metrics.report()
+    assert snapshot["counters"]["stationdata.stations"] == len(stations)
+    assert snapshot["timers"]["stationdata.build_station_list"]["count"] == 1
+    assert snapshot["timers"]["analysis.polyfit"]["count"] == 1
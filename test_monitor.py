@@ -0,0 +1,79 @@
+"""Unit test for the monitor module"""
+
+import datetime
+import threading
+
+import pytest
+
+from floodsystem.flood import get_all_town_risk_levels
+from floodsystem.monitor import FloodMonitor
+from floodsystem.stationdata import build_station_list, update_water_levels
+
+
+def expected_towns():
+    stations = build_station_list()
+    update_water_levels(stations)
+    return [sorted(towns) for towns in get_all_town_risk_levels(stations, 1, 3, False)]
+
+
+def test_monitor_poll(stub):
+    monitor = FloodMonitor(n=1, p=3, max_workers=4)
+
+    # The first poll scores every station in a town, fetching the history of those with a consistent typical range
+    rescored = monitor.poll()
+    assert len(rescored) == 30 - 5
+    assert sum(stub.requests.values()) == 30 - 5 - 5
+    assert [sorted(towns) for towns in monitor.town_risk_levels()] == expected_towns()
+
+    # A poll with no new readings does no work
+    stub.requests.clear()
+    assert monitor.poll() == []
+    assert sum(stub.requests.values()) == 0
+
+    # Only stations with a new reading are refetched and rescored
+    stub.requests.clear()
+    stub.add_reading(1, 5.0)
+    stub.add_reading(2, -3.0)
+    stub.add_reading(7, 0.5)
+    rescored = monitor.poll()
+    assert [station.name for station in rescored] == ["Station 1", "Station 2"]
+    assert set(stub.requests) == {stub.url + "/id/measures/1", stub.url + "/id/measures/2"}
+    assert [sorted(towns) for towns in monitor.town_risk_levels()] == expected_towns()
+    assert monitor.polls == 3
+
+
+def test_monitor_failed_poll(monkeypatch, stub):
+    import floodsystem.monitor
+
+    # The first poll fails part way through scoring
+    fetch_station_histories = floodsystem.monitor.fetch_station_histories
+    def failing_fetch(*args, **kwargs):
+        raise ConnectionError("transient error")
+    monkeypatch.setattr(floodsystem.monitor, "fetch_station_histories", failing_fetch)
+    monitor = FloodMonitor(n=1, p=3)
+    with pytest.raises(ConnectionError):
+        monitor.poll()
+    assert monitor.polls == 0
+
+    # The next poll scores every station the failed poll didn't, although none of their readings have changed
+    monkeypatch.setattr(floodsystem.monitor, "fetch_station_histories", fetch_station_histories)
+    stub.add_reading(1, 5.0)
+    assert len(monitor.poll()) == 30 - 5
+    assert [sorted(towns) for towns in monitor.town_risk_levels()] == expected_towns()
+    stub.requests.clear()
+    assert monitor.poll() == [] and sum(stub.requests.values()) == 0
+
+
+def test_monitor_background(stub):
+    monitor = FloodMonitor(n=1, p=3, interval=0.01)
+    monitor.start()
+    try:
+        stub.add_reading(3, 4.0)
+        deadline = datetime.datetime.now() + datetime.timedelta(seconds=10)
+        while monitor.polls < 3 and datetime.datetime.now() < deadline:
+            threading.Event().wait(0.01)
+    finally:
+        monitor.stop(timeout=10)
+    assert monitor.last_error is None
+    assert monitor.polls >= 3
+    assert [sorted(towns) for towns in monitor.town_risk_levels()] == expected_towns()
@@ -0,0 +1,107 @@
+"""Unit test for the readingstore module"""
+
+import datetime
+import json
+import threading
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from urllib.parse import parse_qs, urlparse
+
+from floodsystem.datafetcher import fetch_measure_levels
+from floodsystem.readingstore import ReadingStore
+
+
+class ReadingsHandler(BaseHTTPRequestHandler):
+    """Serves `server.readings` from the `since` query parameter onwards, newest first as the Environment Agency does"""
+    protocol_version = "HTTP/1.1"
+
+    def do_GET(self):
+        since = parse_qs(urlparse(self.path).query)["since"][0]
+        self.server.since.append(since)
+        since = datetime.datetime.fromisoformat(since.replace("Z", "+00:00"))
+        items = [{"dateTime": d.strftime("%Y-%m-%dT%H:%M:%SZ"), "value": v}
+                 for d, v in reversed(self.server.readings) if d >= since]
+        body = json.dumps({"items": items}).encode()
+        self.send_response(200)
+        self.send_header("Content-Type", "application/json")
+        self.send_header("Content-Length", str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def log_message(self, *args):
+        pass
+
+
+def hourly_readings(hours):
+    now = datetime.datetime.now(datetime.timezone.utc).replace(minute=0, second=0, microsecond=0)
+    return [(now - datetime.timedelta(hours=h), 0.1 * h) for h in range(hours, -1, -1)]
+
+
+def test_incremental_fetch(tmp_path):
+    server = ThreadingHTTPServer(("127.0.0.1", 0), ReadingsHandler)
+    server.readings, server.since = hourly_readings(48), []
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    measure_id = "http://127.0.0.1:{}/id/measures/1-level".format(server.server_address[1])
+    store = ReadingStore(str(tmp_path))
+    try:
+        dates, levels = fetch_measure_levels(measure_id, datetime.timedelta(days=1), store=store)
+        assert len(dates) == len(levels) == 24
+        assert dates == sorted(dates)
+
+        # A new reading arrives: only readings from the latest stored one are fetched
+        now = server.readings[-1][0] + datetime.timedelta(hours=1)
+        server.readings.append((now, 7.5))
+        dates, levels = fetch_measure_levels(measure_id, datetime.timedelta(days=1), store=store)
+        assert datetime.datetime.fromisoformat(server.since[-1][:-1] + "+00:00") == now - datetime.timedelta(hours=1)
+        assert dates[-1] == now and levels[-1] == 7.5
+        assert len(set(dates)) == len(dates)
+
+        # A longer period than has been stored is fetched in full
+        dates, levels = fetch_measure_levels(measure_id, datetime.timedelta(days=2), store=store)
+        assert len(dates) == 49
+        assert store.covered_since(measure_id) <= dates[0]
+    finally:
+        server.shutdown()
+
+
+def test_store(tmp_path):
+    store = ReadingStore(str(tmp_path))
+    start = datetime.datetime(2024, 1, 1, tzinfo=datetime.timezone.utc)
+    dates = [start + datetime.timedelta(minutes=15 * i) for i in range(4)]
+
+    assert store.last_date("m") is None and store.read("m") == ([], [])
+
+    store.replace("m", start, dates[:2], [1.0, None])
+    store.append("m", dates[1:], [9.0, 2.5, 3.0])
+    assert store.last_date("m") == dates[-1]
+    assert store.read("m") == (dates, [1.0, None, 2.5, 3.0])
+    assert store.read("m", since=dates[2]) == (dates[2:], [2.5, 3.0])
+
+    # Readings given newest first are stored in date order
+    store.replace("n", start, dates[::-1], [4.0, 3.0, 2.0, 1.0])
+    assert store.read("n") == (dates, [1.0, 2.0, 3.0, 4.0])
+    later = [dates[-1] + datetime.timedelta(minutes=15 * i) for i in (2, 1)]
+    store.append("n", later, [6.0, 5.0])
+    assert store.last_date("n") == later[0]
+    assert store.read("n", since=dates[-1]) == ([dates[-1]] + later[::-1], [4.0, 5.0, 6.0])
+
+
+def test_compaction(tmp_path):
+    store = ReadingStore(str(tmp_path))
+    start = datetime.datetime(2024, 1, 1, tzinfo=datetime.timezone.utc)
+    dates = [start + datetime.timedelta(hours=i) for i in range(48)]
+    store.replace("m", start, dates[:10], [float(i) for i in range(10)])
+
+    # Readings from before the window are kept while they span no longer than the window
+    for i in range(10, 17):
+        store.append("m", [dates[i]], [float(i)], since=dates[i - 8])
+    assert store.covered_since("m") == start
+    assert store.read("m") == (dates[:17], [float(i) for i in range(17)])
+
+    # After that, they are dropped
+    store.append("m", [dates[17]], [17.0], since=dates[9])
+    assert store.covered_since("m") == dates[9]
+    assert store.read("m") == (dates[9:18], [float(i) for i in range(9, 18)])
+    for i in range(18, 48):
+        store.append("m", [dates[i]], [float(i)], since=dates[i - 8])
+    assert dates[30] < store.covered_since("m") <= dates[-9]
+    assert store.read("m", since=dates[-9]) == (dates[-9:], [float(i) for i in range(39, 48)])
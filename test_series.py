@@ -0,0 +1,66 @@
+"""Unit test for the series module"""
+
+import datetime
+
+import numpy as np
+from matplotlib.dates import date2num
+
+from floodsystem.analysis import polyfit
+from floodsystem.datafetcher import _parse_readings, _parse_readings_series
+from floodsystem.flood import get_risk_level, get_risk_levels
+from floodsystem.series import LevelSeries, day_numbers
+
+
+def history():
+    start = datetime.datetime(2024, 3, 1, tzinfo=datetime.timezone.utc)
+    dates = [start + datetime.timedelta(minutes=15 * i) for i in range(200)]
+    levels = [0.4 + 0.1 * np.sin(i / 30) for i in range(200)]
+    levels[0] = levels[57] = None
+    return dates, levels
+
+
+def test_level_series_round_trip():
+    dates, levels = history()
+    series = LevelSeries.from_lists(dates, levels)
+
+    assert series.times.dtype == np.dtype("datetime64[us]")
+    assert series.levels.dtype == np.float64
+    assert np.isnan(series.levels[[0, 57]]).all()
+    assert series.to_lists() == (dates, levels)
+
+    # A series unpacks like a (dates, levels) pair
+    times, values = series
+    assert times is series.times and values is series.levels
+
+
+def test_day_numbers():
+    dates, _ = history()
+    expected = date2num(dates)
+
+    assert np.allclose(day_numbers(dates), expected, rtol=0, atol=1e-9)
+    assert np.allclose(LevelSeries.from_lists(dates, [0.] * len(dates)).day_numbers, expected, rtol=0, atol=1e-9)
+    assert np.array_equal(day_numbers(expected), expected)
+
+
+def test_parse_readings_series():
+    data = {"items": [
+        {"dateTime": "2024-03-01T00:00:00Z", "value": 0.5},
+        {"dateTime": "2024-03-01T00:15:00Z"},
+        {"dateTime": "2024-03-01T00:30:00Z", "value": [0.25, 0.75]},
+    ]}
+    series = _parse_readings_series(data)
+
+    assert series.to_lists() == _parse_readings(data)
+
+
+def test_series_fit_matches_lists():
+    dates, levels = history()
+    series = LevelSeries.from_lists(dates, levels)
+
+    polynomial, offset = polyfit(dates, levels, 3)
+    series_polynomial, series_offset = polyfit(*series, 3)
+    assert np.isclose(offset, series_offset, rtol=0, atol=1e-9)
+    assert np.allclose(polynomial.coeffs, series_polynomial.coeffs)
+
+    assert get_risk_level(*series, 3) == get_risk_level(dates, levels, 3)
+    assert get_risk_levels([series, (dates, levels)], 3) == [get_risk_level(dates, levels, 3)] * 2
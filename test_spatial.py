@@ -0,0 +1,44 @@
+"""Unit test for the spatial module"""
+
+import random
+
+from floodsystem.geo import stations_by_distance, stations_within_radius
+from floodsystem.spatial import StationIndex
+from floodsystem.station import MonitoringStation
+from test_geo import dummy_stations
+
+
+def random_stations(n):
+    rng = random.Random(0)
+    stations = [MonitoringStation(f"http://example.com/id/stations/{i}", f"http://example.com/id/measures/{i}",
+                                  f"Station {i}", (rng.uniform(49, 59), rng.uniform(-7, 2)), None, "River", "Town")
+                for i in range(n)]
+    # Stations at the same place test that ties are broken the same way
+    return stations + stations[:20]
+
+
+def test_within_radius():
+    stations = random_stations(2000)
+    index = StationIndex(stations)
+    rng = random.Random(1)
+    for _ in range(50):
+        centre, r = (rng.uniform(45, 62), rng.uniform(-10, 5)), rng.uniform(0, 200)
+        assert index.within_radius(centre, r) == stations_within_radius(stations, centre, r)
+
+    stations = dummy_stations()
+    assert StationIndex(stations).within_radius((0, 0), 3500) == stations_within_radius(stations, (0, 0), 3500)
+    assert StationIndex(stations).within_radius((0, 0), 1e9) == stations
+    assert StationIndex([]).within_radius((0, 0), 10) == []
+
+
+def test_nearest():
+    stations = random_stations(2000)
+    index = StationIndex(stations)
+    rng = random.Random(2)
+    for k in [0, 1, 5, 30, 100]:
+        point = (rng.uniform(45, 62), rng.uniform(-10, 5))
+        assert index.nearest(point, k) == stations_by_distance(stations, point)[:k]
+
+    stations = dummy_stations()
+    assert StationIndex(stations).nearest((0, 90), 10) == stations_by_distance(stations, (0, 90))
+    assert StationIndex([]).nearest((0, 0), 3) == []
@@ -28,6 +28,28 @@ def test_create_monitoring_station():
     assert s.river == river
     assert s.town == town
 
+def test_compact_monitoring_station():
+    s1 = MonitoringStation("http://example.com/id/stations/1", "http://example.com/id/measures/1-level",
+                           "Station 1", (0, 0), None, "River " + "X", "Town " + "Y")
+    s2 = MonitoringStation("http://example.com/id/stations/2", None, "Station 2", (0, 0), None, "River X", "Town Y")
+
+    # Stations have no __dict__, so no other attributes can be set
+    assert not hasattr(s1, "__dict__")
+    try:
+        s1.level = 1.
+        assert False
+    except AttributeError:
+        pass
+
+    # Ids are unchanged, and names are only stored once
+    assert s1.station_id == "http://example.com/id/stations/1"
+    assert s1.measure_id == "http://example.com/id/measures/1-level"
+    assert s2.measure_id is None
+    assert s1.river is s2.river and s1.town is s2.town
+
+    s1.measure_id = "test-m-id"
+    assert s1.measure_id == "test-m-id"
+
 def test_typical_range_consistent():
      # Get dummy stations
     stations = dummy_stations()
@@ -28,3 +28,109 @@ def test_update_level():
             counter += 1
 
     assert counter > 0
+
+
+def station_items(n):
+    """Station items in the format of the Environment Agency station data"""
+    items = []
+    for i in range(n):
+        item = {
+            "@id": "http://example.com/id/stations/{}".format(i),
+            "label": "Station {}".format(i) if i % 5 else ["Station {}".format(i)] * 2,
+            "lat": 50 + i / n, "long": -1 + i / n,
+            "measures": [{"@id": "http://example.com/id/measures/{}-level".format(i), "parameter": "level"}],
+            "riverName": "River {}".format(i % 4),
+        }
+        if i % 3:
+            item["town"] = "Town {}".format(i % 7)
+        if i % 4:
+            item["stageScale"] = {"typicalRangeLow": 0.1, "typicalRangeHigh": 0.2 * (i % 3)}
+        if i % 11 == 0:
+            del item["lat"]
+        items.append(item)
+    return items
+
+
+def test_build_station_list_stream(monkeypatch, tmp_path):
+    """Test building list of stations while decoding station data"""
+    import json
+    import threading
+    from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+    from floodsystem import datafetcher
+    from floodsystem.cache import CachePolicy
+
+    body = json.dumps({"meta": {"limit": 500}, "items": station_items(300)}).encode()
+
+    class Handler(BaseHTTPRequestHandler):
+        def do_GET(self):
+            self.send_response(200)
+            self.send_header("Content-Type", "application/json")
+            self.send_header("Content-Length", str(len(body)))
+            self.end_headers()
+            self.wfile.write(body)
+
+        def log_message(self, *args):
+            pass
+
+    server = ThreadingHTTPServer(("127.0.0.1", 0), Handler)
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    monkeypatch.setattr(datafetcher, "STATION_DATA_URL", "http://127.0.0.1:{}/id/stations".format(server.server_address[1]))
+    monkeypatch.setattr(datafetcher, "cache_policy", CachePolicy(directory=str(tmp_path)))
+    try:
+        # Decoded from the response, which is saved to the cache at the same time
+        streamed = build_station_list(use_cache=False, stream=True)
+        assert (tmp_path / "station_data.json").exists()
+        # Decoded from the cache file
+        cached = build_station_list(stream=True)
+        loaded = build_station_list()
+    finally:
+        server.shutdown()
+
+    assert len(loaded) == 300 - 28
+    for stations in [streamed, cached]:
+        assert [repr(s) for s in stations] == [repr(s) for s in loaded]
+
+
+def test_water_level_updater():
+    """Test incremental update of latest water levels"""
+    import datetime
+    from floodsystem.station import MonitoringStation
+    from floodsystem.stationdata import WaterLevelUpdater
+
+    stations = [MonitoringStation("s{}".format(i), "m{}".format(i % 4), "Station {}".format(i),
+                                  (0., 0.), (0., 1.), "River", "Town") for i in range(6)]
+
+    def measure_data(readings):
+        return {"items": [{"@id": m, "latestReading": {"measure": m, "dateTime": t, "value": v}}
+                          for (m, t, v) in readings] + [{"@id": "m9"}]}
+
+    updater = WaterLevelUpdater(stations)
+    stations[3].latest_level = 5.
+
+    # Every station with a reading changes on the first update
+    changed = updater.update(measure_data([("m0", "2024-01-01T00:00:00Z", 0.5),
+                                           ("m1", "2024-01-01T00:00:00Z", [0.1, 0.2]),
+                                           ("m2", "2024-01-01T00:00:00Z", 0.7)]))
+    assert changed == [stations[0], stations[1], stations[2], stations[4], stations[5]]
+    assert [s.latest_level for s in stations] == [0.5, None, 0.7, None, 0.5, None]
+    assert updater.reading_time(stations[2]) == datetime.datetime(2024, 1, 1, tzinfo=datetime.timezone.utc)
+    assert updater.reading_time(stations[3]) is None
+
+    # Only stations with a new reading change
+    changed = updater.update(measure_data([("m0", "2024-01-01T00:00:00Z", 0.5),
+                                           ("m1", "2024-01-01T00:00:00Z", [0.1, 0.2]),
+                                           ("m2", "2024-01-01T00:15:00Z", 0.7),
+                                           ("m3", "2024-01-01T00:15:00Z", 0.9)]))
+    assert changed == [stations[2], stations[3]]
+    assert [s.latest_level for s in stations] == [0.5, None, 0.7, 0.9, 0.5, None]
+    assert updater.reading_time(stations[2]) == datetime.datetime(2024, 1, 1, 0, 15, tzinfo=datetime.timezone.utc)
+
+    # Stations whose measure loses its reading change too
+    changed = updater.update(measure_data([("m1", "2024-01-01T00:00:00Z", [0.1, 0.2]),
+                                           ("m2", "2024-01-01T00:15:00Z", 0.7),
+                                           ("m3", "2024-01-01T00:15:00Z", 0.9)]))
+    assert changed == [stations[0], stations[4]]
+    assert stations[0].latest_level is None and updater.reading_time(stations[0]) is None
+    assert updater.update(measure_data([("m1", "2024-01-01T00:00:00Z", [0.1, 0.2]),
+                                        ("m2", "2024-01-01T00:15:00Z", 0.7),
+                                        ("m3", "2024-01-01T00:15:00Z", 0.9)])) == []
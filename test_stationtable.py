@@ -0,0 +1,38 @@
+"""Unit test for the stationtable module"""
+
+import numpy as np
+
+from floodsystem.geo import haversine
+from floodsystem.stationtable import StationTable
+from test_flood import dummy_stations
+
+
+def test_from_stations():
+    stations = dummy_stations()
+    table = StationTable.from_stations(stations)
+
+    assert len(table) == 5
+    assert table.rivers == ["River 1", "River 2", "River 3"]
+    assert list(table.river_codes) == [0, 0, 1, 2, 2]
+    assert table.towns == ["Town 1", "Town 2", "Town 3", "Town 4"]
+
+    # Converting back gives stations with the same data
+    for (station, view) in zip(stations, table.to_stations()):
+        for attribute in ["station_id", "measure_id", "name", "coord", "typical_range", "river", "town", "latest_level"]:
+            assert getattr(view, attribute) == getattr(station, attribute)
+    assert [s.name for s in table.to_stations(table.river_mask("River 3"))] == ["Station 3", "Station 3"]
+    assert not table.town_mask("Nowhere").any()
+
+
+def test_bulk_queries():
+    stations = dummy_stations()
+    table = StationTable.from_stations(stations)
+
+    assert list(table.typical_range_consistent()) == [s.typical_range_consistent() for s in stations]
+    for (relative, station) in zip(table.relative_water_levels(), stations):
+        if station.relative_water_level() is None:
+            assert np.isnan(relative)
+        else:
+            assert relative == station.relative_water_level()
+    assert np.allclose(table.distances((0, 0)), [haversine(s.coord, (0, 0)) for s in stations])
+    assert len(StationTable.from_stations([]).relative_water_levels()) == 0
@@ -0,0 +1,216 @@
+"""Unit test for the transport module"""
+
+import collections
+import json
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+import pytest
+import requests
+
+from floodsystem.datafetcher import fetch
+from floodsystem.transport import HTTPTransport, RateLimiter, get_transport, set_transport
+
+
+class EchoHandler(BaseHTTPRequestHandler):
+    # Keep connections open between requests
+    protocol_version = "HTTP/1.1"
+
+    def do_GET(self):
+        body = json.dumps({"path": self.path, "port": self.client_address[1],
+                           "encoding": self.headers.get("Accept-Encoding")}).encode()
+        self.send_response(200)
+        self.send_header("Content-Type", "application/json")
+        self.send_header("Content-Length", str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def log_message(self, *args):
+        pass
+
+
+class ThrottlingHandler(EchoHandler):
+    # Throttles more than two requests at once, and answers each path with its queue of error statuses first
+    lock = threading.Lock()
+    in_flight = 0
+    errors = dict()
+    requests = collections.Counter()
+
+    def do_GET(self):
+        cls = ThrottlingHandler
+        with cls.lock:
+            cls.requests[self.path] += 1
+            cls.in_flight += 1
+            queued = cls.errors.get(self.path)
+            status = queued.pop(0) if queued else 429 if cls.in_flight > 2 else 200
+        try:
+            if status == 200:
+                time.sleep(0.01)
+                super().do_GET()
+            else:
+                self.send_response(status)
+                self.send_header("Retry-After", "3600" if self.path == "/later" else "0")
+                self.send_header("Content-Length", "0")
+                self.end_headers()
+        finally:
+            with cls.lock:
+                cls.in_flight -= 1
+
+
+def start_server(handler=EchoHandler):
+    server = ThreadingHTTPServer(("127.0.0.1", 0), handler)
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    return server, "http://127.0.0.1:{}".format(server.server_address[1])
+
+
+def test_connections_reused():
+    server, url = start_server()
+    transport = HTTPTransport(connect_timeout=1., read_timeout=1.)
+    try:
+        responses = [transport.get_json(url + "/readings/" + str(i)) for i in range(5)]
+    finally:
+        transport.close()
+        server.shutdown()
+
+    assert [r["path"] for r in responses] == ["/readings/" + str(i) for i in range(5)]
+    # Every request was sent over the same connection
+    assert len({r["port"] for r in responses}) == 1
+    assert "gzip" in responses[0]["encoding"]
+
+
+def test_set_transport():
+    server, url = start_server()
+    transport = HTTPTransport()
+    previous = set_transport(transport)
+    try:
+        assert get_transport() is transport
+        assert fetch(url + "/id/stations")["path"] == "/id/stations"
+    finally:
+        set_transport(previous)
+        transport.close()
+        server.shutdown()
+
+
+def test_retries(monkeypatch):
+    monkeypatch.setattr(ThrottlingHandler, "errors", {"/a": [429, 503], "/b": [404], "/c": [500] * 3})
+    server, url = start_server(ThrottlingHandler)
+    transport = HTTPTransport(max_retries=2, retry_delay=0.01)
+    try:
+        # Throttled and failed requests are retried, and errors are raised once the retries run out
+        assert transport.get_json(url + "/a")["path"] == "/a"
+        with pytest.raises(requests.HTTPError):
+            transport.get_json(url + "/b")
+        with pytest.raises(requests.HTTPError):
+            transport.get_json(url + "/c")
+    finally:
+        transport.close()
+        server.shutdown()
+
+    assert ThrottlingHandler.requests["/a"] == 3
+    assert ThrottlingHandler.requests["/b"] == 1
+    assert ThrottlingHandler.requests["/c"] == 3
+    assert transport.limiter.concurrency < 32
+
+
+def test_default_rate():
+    server, url = start_server()
+    transport = HTTPTransport()
+    try:
+        # The shared transport meters request starts: a burst of one second's worth goes at once, and the rest wait
+        # for tokens, while the rate grows as it is what holds the requests back
+        rate = transport.limiter.rate
+        assert rate is not None
+        start = time.monotonic()
+        with ThreadPoolExecutor(8) as executor:
+            list(executor.map(transport.get_json, [url + "/" + str(i) for i in range(int(2 * rate))]))
+        assert time.monotonic() - start > 0.5
+        assert transport.limiter.rate > rate
+    finally:
+        transport.close()
+        server.shutdown()
+
+
+def test_retry_after_capped(monkeypatch):
+    monkeypatch.setattr(ThrottlingHandler, "errors", {"/later": [429]})
+    server, url = start_server(ThrottlingHandler)
+    transport = HTTPTransport(retry_delay=0.01, max_retry_delay=0.2)
+    try:
+        # A long Retry-After only holds back requests for up to the greatest retry delay
+        start = time.monotonic()
+        assert transport.get_json(url + "/later")["path"] == "/later"
+        assert transport.get_json(url + "/other")["path"] == "/other"
+        assert 0.2 <= time.monotonic() - start < 2.
+    finally:
+        transport.close()
+        server.shutdown()
+
+
+def test_adaptive_concurrency(monkeypatch):
+    monkeypatch.setattr(ThrottlingHandler, "requests", collections.Counter())
+    server, url = start_server(ThrottlingHandler)
+    transport = HTTPTransport(retry_delay=0.01, limiter=RateLimiter(concurrency=16))
+    try:
+        # A burst of requests backs off to a level the server can take, and every request succeeds
+        with ThreadPoolExecutor(16) as executor:
+            responses = list(executor.map(transport.get_json, [url + "/" + str(i) for i in range(100)]))
+    finally:
+        transport.close()
+        server.shutdown()
+
+    assert [r["path"] for r in responses] == ["/" + str(i) for i in range(100)]
+    assert 100 < sum(ThrottlingHandler.requests.values()) < 150
+    assert transport.limiter.concurrency < 16
+    assert transport.limiter.in_flight == 0
+
+
+def test_rate_limiter():
+    # Healthy responses ramp concurrency up by about one a round
+    limiter = RateLimiter(concurrency=4, max_concurrency=6)
+    started = [limiter.acquire() for _ in range(4)]
+    for start in started:
+        limiter.release(start, 200, 0.1)
+    assert 4.9 < limiter.concurrency < 5
+
+    # Overload halves it, but only once for the requests in flight at the time
+    started = [limiter.acquire() for _ in range(2)]
+    limiter.release(started[0], 503)
+    limiter.release(started[1])
+    assert 2.4 < limiter.concurrency < 2.5
+    for _ in range(100):
+        limiter.release(limiter.acquire(), 200, 0.1)
+    assert limiter.concurrency == 6
+
+    # A latency spike is a sign of overload
+    for latency in [0.1] * 10 + [1.]:
+        limiter.release(limiter.acquire(), 200, latency)
+    assert limiter.concurrency == 3
+
+    # Requests are started at no more than the rate, which is cut when throttled
+    limiter = RateLimiter(rate=50., burst=1.)
+    start = time.monotonic()
+    for _ in range(6):
+        limiter.release(limiter.acquire(), 200, 0.)
+    assert time.monotonic() - start > 0.09
+    limiter.release(limiter.acquire(), 429)
+    assert limiter.rate < 26.
+
+    # The rate only grows while the bucket is empty, and no higher than the greatest rate
+    limiter = RateLimiter(rate=10., max_rate=11., rate_increase=0.5)
+    limiter.release(limiter.acquire(), 200, 0.)
+    assert limiter.rate == 10.
+    for _ in range(12):
+        limiter.release(limiter.acquire(), 200, 0.)
+    assert limiter.rate == 11.
+
+    # Once the concurrency is reached, requests wait for one to finish
+    limiter = RateLimiter(concurrency=1)
+    first = limiter.acquire()
+    acquired = threading.Event()
+    thread = threading.Thread(target=lambda: (limiter.acquire(), acquired.set()))
+    thread.start()
+    assert not acquired.wait(0.05)
+    limiter.release(first, 200)
+    assert acquired.wait(1.)
+    thread.join()